@@ -0,0 +1,61 @@
+"""Benchmark for backtesting the models over years of data.
+
+This writes HOBOlink and USGS history CSV files built from the data store's
+pickles to a temporary directory, runs `run_backtest` over them, and reports
+how long it took and the peak memory of the main process and of the largest
+worker process.
+
+You can run it with:
+
+`python benchmarks/backtest.py --years 10`
+"""
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import click
+
+sys.path.append('.')
+
+from flagging_site.data.backtest import run_backtest  # noqa: E402
+from tests.synthetic_data import synthetic_hobolink_data  # noqa: E402
+from tests.synthetic_data import synthetic_usgs_data  # noqa: E402
+
+
+@click.command()
+@click.option('--years', default=10, help='Years of data to backtest.')
+@click.option('--chunk-days', default=30, help='Days of data in each chunk.')
+@click.option('--workers', default=None, type=int,
+              help='Number of processes. Defaults to the number of CPUs.')
+def benchmark(years: int, chunk_days: int, workers: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        hobolink_fpath = os.path.join(tmp_dir, 'hobolink.csv')
+        usgs_fpath = os.path.join(tmp_dir, 'usgs.csv')
+        synthetic_hobolink_data(days=365 * years).to_csv(hobolink_fpath,
+                                                          index=False)
+        synthetic_usgs_data(days=365 * years).to_csv(usgs_fpath, index=False)
+        input_mb = (os.path.getsize(hobolink_fpath)
+                    + os.path.getsize(usgs_fpath)) / 2 ** 20
+
+        # Measure the memory used by the backtest, not by building the data.
+        start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start_time = time.perf_counter()
+        summary = run_backtest(hobolink_fpath, usgs_fpath,
+                               out_dir=os.path.join(tmp_dir, 'out'),
+                               chunk_days=chunk_days, workers=workers)
+        elapsed = time.perf_counter() - start_time
+
+    main_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    worker_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    click.echo(summary.to_string(index=False))
+    click.echo(f'input:  {input_mb:.0f} MB of CSV')
+    click.echo(f'time:   {elapsed:.1f}s')
+    click.echo(f'peak memory (main):   {main_rss / 1024:.0f} MB '
+               f'({start_rss / 1024:.0f} MB before the backtest)')
+    click.echo(f'peak memory (worker): {worker_rss / 1024:.0f} MB')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,85 @@
+"""Benchmark for writing the processed data and model outputs to Postgres.
+
+This compares `DataFrame.to_sql` against `bulk_write`, which uses `COPY FROM
+STDIN`, on 90 days of processed data and model outputs. The writes go to
+scratch copies of the `processed_data` and `model_outputs` tables, which are
+dropped afterwards.
+
+This needs a database set up the same way as for running the website. You can
+run it with:
+
+`FLASK_ENV=development python benchmarks/database_write.py`
+"""
+import sys
+import timeit
+
+import click
+from flask import Flask
+
+sys.path.append('.')
+
+from flagging_site import create_app  # noqa: E402
+from flagging_site.data.database import db  # noqa: E402
+from flagging_site.data.database import bulk_write  # noqa: E402
+from flagging_site.data.database import execute_sql  # noqa: E402
+from flagging_site.data.predictive_models import all_models  # noqa: E402
+from flagging_site.data.predictive_models import process_data  # noqa: E402
+from tests.synthetic_data import synthetic_hobolink_data  # noqa: E402
+from tests.synthetic_data import synthetic_usgs_data  # noqa: E402
+
+TABLES = ['processed_data', 'model_outputs']
+
+
+def run_benchmark(app: Flask, days: int = 90, repeat: int = 3) -> None:
+    df = process_data(
+        df_hobolink=synthetic_hobolink_data(days=days),
+        df_usgs=synthetic_usgs_data(days=days)
+    )
+    dfs = {
+        'processed_data': df,
+        'model_outputs': all_models(df, rows=len(df))
+    }
+
+    with app.app_context():
+        for table_name in TABLES:
+            execute_sql(f'''
+                DROP TABLE IF EXISTS benchmark_{table_name};
+                CREATE TABLE benchmark_{table_name} (LIKE {table_name});
+                COMMIT;
+            ''')
+
+        try:
+            for table_name, df in dfs.items():
+                bench_table = f'benchmark_{table_name}'
+
+                def _to_sql():
+                    df.to_sql(bench_table, con=db.engine, index=False,
+                              if_exists='replace')
+
+                def _bulk_write():
+                    bulk_write(df, bench_table)
+
+                # Run the bulk write first; `to_sql` replaces the table.
+                copy_time = min(timeit.repeat(_bulk_write, number=1,
+                                              repeat=repeat))
+                to_sql_time = min(timeit.repeat(_to_sql, number=1,
+                                                repeat=repeat))
+                click.echo(f'{table_name} ({len(df)} rows):')
+                click.echo(f'    to_sql: {to_sql_time:.3f}s')
+                click.echo(f'    COPY:   {copy_time:.3f}s')
+                click.echo(f'    speedup: {to_sql_time / copy_time:.1f}x')
+        finally:
+            for table_name in TABLES:
+                execute_sql(f'DROP TABLE IF EXISTS benchmark_{table_name}; '
+                            'COMMIT;')
+
+
+@click.command()
+@click.option('--days', default=90, help='Days of data to write.')
+@click.option('--repeat', default=3, help='Number of timing runs.')
+def benchmark(days: int, repeat: int) -> None:
+    run_benchmark(create_app(), days=days, repeat=repeat)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,113 @@
+"""Benchmark for parsing the HOBOlink API response.
+
+This compares the old row-by-row coalescing of HOBOlink's duplicated columns
+against the vectorized `coalesce_columns` used by `parse_hobolink_data`. The
+input is a HOBOlink-style CSV that is built from the data store's
+`hobolink.pickle` and stretched out to the size of the 90 day export.
+
+You can run it with:
+
+`python benchmarks/hobolink_parse.py`
+"""
+import io
+import os
+import sys
+import timeit
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append('.')
+
+from flagging_site.config import DATA_STORE  # noqa: E402
+from flagging_site.data.hobolink import HOBOLINK_COLUMNS  # noqa: E402
+from flagging_site.data.hobolink import HOBOLINK_STATIC_FILE_NAME  # noqa: E402
+from flagging_site.data.hobolink import parse_hobolink_data  # noqa: E402
+
+STATION = 'Charles River Weather Station'
+# Columns that HOBOlink sometimes splits in two.
+SPLIT_COLUMNS = ['DewPt', 'Wind Dir', 'Water Temp', 'Temp']
+
+
+def legacy_parse_hobolink_data(res: str) -> pd.DataFrame:
+    """The parser as it was before the vectorized coalesce."""
+    split_by = '------------'
+    str_table = res[res.find(split_by) + len(split_by):]
+    df = pd.read_csv(io.StringIO(str_table), sep=',')
+
+    for old_col_startswith, new_col in HOBOLINK_COLUMNS.items():
+        subset_df = df.loc[
+            :,
+            filter(lambda x: x.startswith(old_col_startswith), df.columns)
+        ]
+        subset_df = subset_df.loc[~subset_df.isna().all(axis=1)]
+        df[new_col] = subset_df \
+            .apply(lambda x: x[x.first_valid_index()], axis=1)
+
+    df = df[HOBOLINK_COLUMNS.values()]
+    df = df.loc[df['water_temp'].notna()]
+    df['time'] = pd.to_datetime(df['time'], format='%m/%d/%y %H:%M:%S')
+    return df
+
+
+def build_hobolink_export(days: int = 90) -> str:
+    """Build the text of a HOBOlink export out of the data store's pickle.
+
+    The measurements in the pickle are repeated until they cover `days` days
+    of 10 minute readings. Like the real export, each reading is followed by a
+    row that only has the battery status, and the second half of the rows have
+    their data in the duplicated copies of `SPLIT_COLUMNS`.
+    """
+    df = pd.read_pickle(os.path.join(DATA_STORE, HOBOLINK_STATIC_FILE_NAME))
+    n = days * 24 * 6
+    df = df.iloc[np.arange(n) % len(df)].reset_index(drop=True)
+    df['time'] = pd.date_range(end='2020-09-01', periods=n, freq='10min')
+
+    header = {k: f'{k}, {STATION}' for k in HOBOLINK_COLUMNS}
+    header['Time, GMT-04:00'] = 'Time, GMT-04:00'
+    out = pd.DataFrame({
+        header[k]: df[v] for k, v in HOBOLINK_COLUMNS.items()
+    })
+    out[header['Time, GMT-04:00']] = df['time'].dt.strftime('%m/%d/%y %H:%M:%S')
+
+    # Spread the data for some columns across duplicated columns.
+    split_rows = out.index >= n // 2
+    for col in SPLIT_COLUMNS:
+        out[f'{header[col]} '] = out[header[col]].where(split_rows)
+        out.loc[split_rows, header[col]] = np.nan
+
+    # Add the battery status rows at the 5 minute marks.
+    battery = pd.DataFrame(index=out.index, columns=out.columns)
+    battery[header['Time, GMT-04:00']] = (
+        (df['time'] + pd.Timedelta(minutes=5)).dt.strftime('%m/%d/%y %H:%M:%S')
+    )
+    out = pd.concat([out, battery]).sort_index(kind='mergesort')
+    out.columns = [c.rstrip() for c in out.columns]
+    out.insert(0, '#', np.arange(1, len(out) + 1))
+
+    return f'Data Format:\n------------\n{out.to_csv(index=False)}'
+
+
+@click.command()
+@click.option('--days', default=90, help='Days of data in the export.')
+@click.option('--repeat', default=3, help='Number of timing runs.')
+def benchmark(days: int, repeat: int) -> None:
+    text = build_hobolink_export(days=days)
+
+    expected = legacy_parse_hobolink_data(text)
+    actual = parse_hobolink_data(text)
+    assert actual.equals(expected), 'Parser outputs do not match.'
+    click.echo(f'Parsed {len(actual)} rows; outputs match.')
+
+    legacy = min(timeit.repeat(
+        lambda: legacy_parse_hobolink_data(text), number=1, repeat=repeat))
+    current = min(timeit.repeat(
+        lambda: parse_hobolink_data(text), number=1, repeat=repeat))
+    click.echo(f'legacy:     {legacy:.3f}s')
+    click.echo(f'vectorized: {current:.3f}s')
+    click.echo(f'speedup:    {legacy / current:.1f}x')
+
+
+if __name__ == '__main__':
+    benchmark()
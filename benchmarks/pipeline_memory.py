@@ -0,0 +1,72 @@
+"""Benchmark for the memory used by the model pipeline.
+
+This runs `process_data` and `all_models` on synthetic HOBOlink and USGS data,
+once the default way and once with `low_memory=True`, and reports the peak
+memory of the process before and after the pipeline. Each run is done in its
+own process, since the peak memory of a process never goes back down.
+
+You can run it with:
+
+`python benchmarks/pipeline_memory.py --days 365`
+"""
+import resource
+import subprocess
+import sys
+import time
+
+import click
+
+sys.path.append('.')
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run(days: int, low_memory: bool) -> None:
+    """Runs the pipeline once and prints the results. This runs in the child
+    process.
+    """
+    from flagging_site.data.predictive_models import all_models
+    from flagging_site.data.predictive_models import process_data
+    from tests.synthetic_data import synthetic_hobolink_data
+    from tests.synthetic_data import synthetic_usgs_data
+
+    df_hobolink = synthetic_hobolink_data(days=days)
+    df_usgs = synthetic_usgs_data(days=days)
+
+    before = _peak_rss_mb()
+    start_time = time.perf_counter()
+    df = process_data(df_hobolink, df_usgs, low_memory=low_memory)
+    model_outs = all_models(df, rows=len(df))
+    elapsed = time.perf_counter() - start_time
+    after = _peak_rss_mb()
+
+    frames_mb = (df.memory_usage(deep=True).sum()
+                 + model_outs.memory_usage(deep=True).sum()) / 2 ** 20
+    print(before, after, frames_mb, elapsed)
+
+
+@click.command()
+@click.option('--days', default=365, help='Days of data to process.')
+@click.option('--child', type=click.Choice(['default', 'low_memory']),
+              default=None, hidden=True)
+def benchmark(days: int, child: str) -> None:
+    if child is not None:
+        _run(days, low_memory=child == 'low_memory')
+        return
+
+    click.echo(f'{days} days of data')
+    for mode in ['default', 'low_memory']:
+        out = subprocess.run(
+            [sys.executable, __file__, '--days', str(days), '--child', mode],
+            check=True, capture_output=True, text=True
+        )
+        before, after, frames_mb, elapsed = map(float, out.stdout.split())
+        click.echo(f'{mode:>10}: peak memory {before:.0f} MB before, '
+                   f'{after:.0f} MB after (+{after - before:.0f} MB); '
+                   f'outputs {frames_mb:.1f} MB; {elapsed:.2f}s')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,98 @@
+"""Benchmark for calculating the processed data in Pandas or in Postgres.
+
+This compares reading the raw HOBOlink and USGS data out of the database and
+running `process_data`, against `process_data_in_database`, which calculates
+the same features with window functions and only sends back the processed
+rows. Both are timed on longer and longer histories of data.
+
+The synthetic data is written to copies of the `hobolink` and `usgs` tables
+(`benchmark_hobolink` and `benchmark_usgs`), which are dropped afterwards, so
+the live data is never touched.
+
+This needs a database set up the same way as for running the website. You can
+run it with:
+
+`FLASK_ENV=development python benchmarks/process_data_engines.py`
+"""
+import sys
+import timeit
+
+import click
+from flask import Flask
+
+sys.path.append('.')
+
+from flagging_site import create_app  # noqa: E402
+from flagging_site.data.database import bulk_write  # noqa: E402
+from flagging_site.data.database import execute_sql  # noqa: E402
+from flagging_site.data.predictive_models import process_data  # noqa: E402
+from flagging_site.data.predictive_models import \
+    process_data_in_database  # noqa: E402
+from tests.synthetic_data import synthetic_hobolink_data  # noqa: E402
+from tests.synthetic_data import synthetic_usgs_data  # noqa: E402
+
+TABLES = ['hobolink', 'usgs']
+
+
+def _process_data_in_pandas(days: int) -> None:
+    df_hobolink = execute_sql('''
+        SELECT * FROM benchmark_hobolink
+        WHERE time > (
+            SELECT MAX(time) - :days * interval '1 day'
+            FROM benchmark_hobolink
+        )
+        ORDER BY time;
+    ''', params={'days': days})
+    df_usgs = execute_sql('SELECT * FROM benchmark_usgs ORDER BY time;')
+    process_data(df_hobolink=df_hobolink, df_usgs=df_usgs)
+
+
+def run_benchmark(app: Flask, history_days: list, repeat: int = 3) -> None:
+    with app.app_context():
+        for table_name in TABLES:
+            execute_sql(f'''
+                DROP TABLE IF EXISTS benchmark_{table_name};
+                CREATE TABLE benchmark_{table_name}
+                    (LIKE {table_name} INCLUDING ALL);
+                COMMIT;
+            ''')
+
+        try:
+            for days in history_days:
+                bulk_write(synthetic_hobolink_data(days=days),
+                           'benchmark_hobolink')
+                bulk_write(synthetic_usgs_data(days=days), 'benchmark_usgs')
+
+                pandas_time = min(timeit.repeat(
+                    lambda: _process_data_in_pandas(days),
+                    number=1, repeat=repeat
+                ))
+                sql_time = min(timeit.repeat(
+                    lambda: process_data_in_database(
+                        days=days,
+                        hobolink_table='benchmark_hobolink',
+                        usgs_table='benchmark_usgs'
+                    ),
+                    number=1, repeat=repeat
+                ))
+                click.echo(f'{days} days of history:')
+                click.echo(f'    pandas:   {pandas_time:.3f}s')
+                click.echo(f'    database: {sql_time:.3f}s')
+                click.echo(f'    speedup: {pandas_time / sql_time:.1f}x')
+        finally:
+            for table_name in TABLES:
+                execute_sql(f'DROP TABLE IF EXISTS benchmark_{table_name}; '
+                            'COMMIT;')
+
+
+@click.command()
+@click.option('--days', multiple=True, type=int,
+              default=[21, 90, 365, 365 * 3],
+              help='Days of history to process. Can be given more than once.')
+@click.option('--repeat', default=3, help='Number of timing runs.')
+def benchmark(days: list, repeat: int) -> None:
+    run_benchmark(create_app(), history_days=days, repeat=repeat)
+
+
+if __name__ == '__main__':
+    benchmark()
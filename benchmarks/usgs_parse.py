@@ -0,0 +1,126 @@
+"""Benchmark for parsing the USGS API response.
+
+This compares the old parser, which split the response into Python lists line
+by line, against `parse_usgs_data`, which reads the RDB table with Pandas' C
+engine. The input is an RDB payload that is built from the data store's
+`usgs.pickle` and stretched out to the size of a `days_ago=90` request.
+
+At that size both parsers take about the same time (the new one is within
+about 10% of the old one either way). The new parser is not faster; it is more
+robust, since USGS value codes and empty values become NaN instead of failing
+the float cast. This benchmark checks that it isn't slower.
+
+You can run it with:
+
+`python benchmarks/usgs_parse.py`
+"""
+import os
+import sys
+import timeit
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append('.')
+
+from flagging_site.config import DATA_STORE  # noqa: E402
+from flagging_site.data.usgs import USGS_STATIC_FILE_NAME  # noqa: E402
+from flagging_site.data.usgs import parse_usgs_data  # noqa: E402
+
+RDB_COMMENTS = '''\
+# ---------------------------------- WARNING ----------------------------------------
+# Some of the data that you have obtained from this U.S. Geological Survey database
+# may not have received Director's approval. Any such data values are qualified
+# as provisional and are subject to revision. Provisional data are released on the
+# condition that neither the USGS nor the United States Government may be held liable
+# for any damages resulting from its use.
+#
+# Data for the following 1 site(s) are contained in this file
+#    USGS 01104500 CHARLES RIVER AT WALTHAM, MA
+# -----------------------------------------------------------------------------------
+#
+# Data provided for site 01104500
+#            TS   parameter     Description
+#         66190       00060     Discharge, cubic feet per second
+#         66191       00065     Gage height, feet
+#
+# Data-value qualification codes included in this output:
+#     P  Provisional data subject to revision.
+#
+'''
+
+
+class MockUSGSResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def legacy_parse_usgs_data(res) -> pd.DataFrame:
+    """The parser as it was before reading the RDB table with `read_csv`."""
+    raw_data = [
+        i.split('\t')
+        for i in res.text.split('\n')
+        if not i.startswith('#') and i != ''
+    ]
+    df = pd.DataFrame(raw_data[2:], columns=raw_data[0])
+    df = df.rename(columns={
+        'datetime': 'time',
+        '66190_00060': 'stream_flow',
+        '66191_00065': 'gage_height'
+    })
+    df = df[['time', 'stream_flow', 'gage_height']]
+    df['time'] = pd.to_datetime(df['time'])
+    df['stream_flow'] = df['stream_flow'].astype(float)
+    df['gage_height'] = df['gage_height'].astype(float)
+    return df
+
+
+def build_usgs_response(days: int = 90) -> MockUSGSResponse:
+    """Build an RDB response out of the data store's pickle. The measurements
+    in the pickle are repeated until they cover `days` days of 15 minute
+    readings.
+    """
+    df = pd.read_pickle(os.path.join(DATA_STORE, USGS_STATIC_FILE_NAME))
+    n = days * 24 * 4
+    df = df.iloc[np.arange(n) % len(df)].reset_index(drop=True)
+    df['time'] = pd.date_range(end='2020-09-01', periods=n, freq='15min')
+
+    out = pd.DataFrame({
+        'agency_cd': 'USGS',
+        'site_no': '01104500',
+        'datetime': df['time'].dt.strftime('%Y-%m-%d %H:%M'),
+        'tz_cd': 'EDT',
+        '66190_00060': df['stream_flow'],
+        '66190_00060_cd': 'P',
+        '66191_00065': df['gage_height'],
+        '66191_00065_cd': 'P',
+    })
+    formats = '5s\t15s\t20d\t6s\t14n\t10s\t14n\t10s\n'
+    table = out.to_csv(sep='\t', index=False)
+    header, body = table.split('\n', 1)
+    return MockUSGSResponse(f'{RDB_COMMENTS}{header}\n{formats}{body}')
+
+
+@click.command()
+@click.option('--days', default=90, help='Days of data in the response.')
+@click.option('--repeat', default=5, help='Number of timing runs.')
+def benchmark(days: int, repeat: int) -> None:
+    res = build_usgs_response(days=days)
+
+    expected = legacy_parse_usgs_data(res)
+    actual = parse_usgs_data(res)
+    assert actual.equals(expected), 'Parser outputs do not match.'
+    click.echo(f'Parsed {len(actual)} rows; outputs match.')
+
+    legacy = min(timeit.repeat(
+        lambda: legacy_parse_usgs_data(res), number=1, repeat=repeat))
+    current = min(timeit.repeat(
+        lambda: parse_usgs_data(res), number=1, repeat=repeat))
+    click.echo(f'legacy:   {legacy:.4f}s')
+    click.echo(f'read_csv: {current:.4f}s')
+    click.echo(f'speedup:  {legacy / current:.1f}x')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -8,6 +8,7 @@ from flask import request
 from flask import Response
 from flask import send_file
 from flask import abort
+from flask import escape
 from flask_admin import Admin
 from flask_admin import BaseView
 from flask_admin import expose
@@ -156,18 +157,24 @@ class DatabaseView(AdminBaseView):
         """
         # If auth passed, then update database.
         from .data.database import update_database
-        update_database()
-
-        # Notify the user that the update was successful, then redirect:
-        return '''<!DOCTYPE html>
+        try:
+            if update_database():
+                msg = 'Databases updated.'
+            else:
+                msg = 'No new data; the databases were not updated.'
+        except Exception as e:
+            msg = f'Note: while updating database, something didn\'t work: {e}'
+
+        # Notify the user whether the update was successful, then redirect:
+        return f'''<!DOCTYPE html>
             <html>
                 <body>
                     <script>
-                        setTimeout(function(){
+                        setTimeout(function(){{
                             window.location.href = '/admin/';
-                        }, 3000);
+                        }}, 3000);
                     </script>
-                    <p>Databases updated. Redirecting in 3 seconds...</p>
+                    <p>{escape(msg)} Redirecting in 3 seconds...</p>
                 </body>
             </html>
         '''
@@ -279,7 +286,8 @@ class DownloadView(AdminBaseView):
         df_hobolink = get_live_hobolink_data('code_for_boston_export_90d')
 
         from .data.predictive_models import process_data
-        df = process_data(df_hobolink=df_hobolink, df_usgs=df_usgs)
+        df = process_data(df_hobolink=df_hobolink, df_usgs=df_usgs,
+                          low_memory=True)
 
         return _send_csv_attachment_of_dataframe(
             df=df,
@@ -296,7 +304,8 @@ class DownloadView(AdminBaseView):
         df_hobolink = get_live_hobolink_data('code_for_boston_export_90d')
 
         from .data.predictive_models import process_data
-        df = process_data(df_hobolink=df_hobolink, df_usgs=df_usgs)
+        df = process_data(df_hobolink=df_hobolink, df_usgs=df_usgs,
+                          low_memory=True)
 
         from .data.predictive_models import all_models
         model_outs = all_models(df, rows=len(df))
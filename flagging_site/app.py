@@ -71,6 +71,18 @@ def create_app(config: Optional[Union[Config, str]] = None) -> Flask:
     from .data import db
     db.init_app(app)
 
+    # Load the SQL queries
+    from .data.query_catalog import init_query_catalog
+    init_query_catalog(app)
+
+    # Configure the connections to the HOBOlink and USGS APIs
+    from .data.http_client import init_http_client
+    init_http_client(app)
+
+    # Set up the in-memory caches
+    from .cache import init_cache
+    init_cache(app)
+
     # Register admin
     from .admin import init_admin
     init_admin(app)
@@ -115,14 +127,24 @@ def create_app(config: Optional[Union[Config, str]] = None) -> Flask:
         init_db()
         click.echo('Initialized the database.')
 
+    @app.cli.command('migrate-db')
+    def migrate_db_command():
+        """Move the tables onto the latest schema, keeping the HOBOlink data
+        and manual overrides."""
+        from .data.database import migrate_db
+        migrate_db()
+        click.echo('Migrated the database.')
+
     @app.cli.command('update-db')
     def update_db_command():
         """Update the database with the latest live data."""
         from .data.database import update_database
         try:
-            update_database()
-            click.echo('Updated the database.')
-            updated = True
+            updated = update_database()
+            if updated:
+                click.echo('Updated the database.')
+            else:
+                click.echo('No new data; the database was not updated.')
         except Exception as e:
             click.echo("Note: while updating database, something didn't "
                        f'work: {e}')
@@ -134,8 +156,8 @@ def create_app(config: Optional[Union[Config, str]] = None) -> Flask:
     def update_website_command(ctx):
         """Updates the database, then Tweets a message."""
         updated = ctx.invoke(update_db_command)
-        # If the model updated and it's boating season, send a tweet.
-        # Otherwise, do nothing.
+        # If the model updated with new data and it's boating season, send a
+        # tweet. Otherwise, do nothing.
         if (
                 updated
                 and current_app.config['BOATING_SEASON']
@@ -145,6 +167,70 @@ def create_app(config: Optional[Union[Config, str]] = None) -> Flask:
             msg = tweet_current_status()
             click.echo(f'Sent out tweet: {msg!r}')
 
+    @app.cli.command('backtest')
+    @click.argument('hobolink_csv', type=click.Path(exists=True))
+    @click.argument('usgs_csv', type=click.Path(exists=True))
+    @click.option('--out-dir', default='backtest',
+                  help='Directory to write the outputs to.')
+    @click.option('--chunk-days', default=30,
+                  help='Days of data processed in each chunk.')
+    @click.option('--workers', default=None, type=int,
+                  help='Number of processes. Defaults to the number of CPUs.')
+    @click.option('--low-memory', is_flag=True,
+                  help='Process the data as float32 to use less memory.')
+    def backtest_command(hobolink_csv, usgs_csv, out_dir, chunk_days, workers,
+                         low_memory):
+        """Run the models over historical HOBOlink and USGS data."""
+        from .data.backtest import run_backtest
+        summary = run_backtest(hobolink_csv, usgs_csv, out_dir=out_dir,
+                               chunk_days=chunk_days, workers=workers,
+                               low_memory=low_memory)
+        click.echo(summary.to_string(index=False))
+        click.echo(f'Wrote the backtest outputs to {out_dir!r}.')
+
+    @app.cli.command('retrain-models')
+    @click.argument('samples_csv', nargs=-1, required=True,
+                    type=click.Path(exists=True))
+    @click.option('--version', required=True,
+                  help='Name of the new model version, e.g. "2021".')
+    @click.option('--out', 'out_file', default=None,
+                  help='File to write the coefficients to. Defaults to '
+                       'model_<version>.json.')
+    @click.option('--features', 'features_csv', default=None,
+                  type=click.Path(exists=True),
+                  help='CSV of processed data to use instead of the feature '
+                       'store or the processed_data table.')
+    @click.option('--folds', default=10, help='Number of cross-validation '
+                                              'folds.')
+    @click.option('--workers', default=None, type=int,
+                  help='Number of processes. Defaults to the number of CPUs.')
+    def retrain_models_command(samples_csv, version, out_file, features_csv,
+                               folds, workers):
+        """Fit new model coefficients to bacteria samples."""
+        import pandas as pd
+        from .data.database import execute_sql
+        from .data import retraining
+        features = None
+        if features_csv:
+            features = pd.read_csv(features_csv, parse_dates=['time'])
+        elif current_app.config['FEATURE_STORE_DIR']:
+            from .data.feature_store import read_features
+            features = read_features()
+        # The feature store is empty until the database has been updated with
+        # it turned on.
+        if features is None or not len(features):
+            features = execute_sql('SELECT * FROM processed_data;')
+        data = retraining.join_features(retraining.load_samples(samples_csv),
+                                        features)
+        coefficients, cv_results = retraining.retrain(data, folds=folds,
+                                                      workers=workers)
+        out_file = out_file or f'model_{version}.json'
+        retraining.save_model_coefficients(out_file, version, coefficients,
+                                           cv_results)
+        click.echo(cv_results.to_string())
+        click.echo(f'Wrote the coefficients to {out_file!r}. Set '
+                   'MODEL_COEFFICIENTS_FILE to this file to use them.')
+
     # Make a few useful functions available in Flask shell without imports
     @app.shell_context_processor
     def make_shell_context():
@@ -155,6 +241,7 @@ def create_app(config: Optional[Union[Config, str]] = None) -> Flask:
         from .data.hobolink import get_live_hobolink_data
         from .data.predictive_models import process_data
         from .data.usgs import get_live_usgs_data
+        from .data.http_client import http_client
         from .twitter import compose_tweet
 
         return {
@@ -165,6 +252,7 @@ def create_app(config: Optional[Union[Config, str]] = None) -> Flask:
             'get_live_hobolink_data': get_live_hobolink_data,
             'get_live_usgs_data': get_live_usgs_data,
             'process_data': process_data,
+            'http_client': http_client,
             'compose_tweet': compose_tweet
         }
 
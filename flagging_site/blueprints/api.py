@@ -1,12 +1,20 @@
 from typing import List
+from typing import Optional
 
 import pandas as pd
 from flask import Blueprint
+from flask import abort
 from flask import request
 from flask import current_app
 from flask import jsonify
+from flask import json
+from ..cache import data_version
+from ..cache import init_conditional_get
+from ..cache import response_cache
+from ..snapshots import init_snapshots
 from ..data.predictive_models import latest_model_outputs
-from ..data.predictive_models import MODEL_VERSION
+from ..data.predictive_models import get_model_coefficients
+from ..data.predictive_models import get_model_registry
 from ..data.database import get_boathouse_metadata_dict
 from ..data.database import execute_sql
 
@@ -14,6 +22,13 @@ from flasgger import swag_from
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
+# The model outputs only change when the data changes.
+init_conditional_get(bp, ['predictive_model_api'])
+
+# `/api/v1/model` with the default parameters and `/api/v1/boathouses` are
+# served from the snapshots when they are current.
+init_snapshots(bp)
+
 
 def add_to_dict(models, df, reach) -> None:
     """
@@ -32,7 +47,16 @@ def add_to_dict(models, df, reach) -> None:
     models[f'reach_{reach}'] = df.to_dict(orient='list')
 
 
-def model_api(reaches: List[int], hours: int) -> dict:
+def clamp_hours(hours: int) -> int:
+    """Return `hours` limited to between 1 and `API_MAX_HOURS`."""
+    return max(1, min(hours, current_app.config['API_MAX_HOURS']))
+
+
+def model_api(
+        reaches: List[int],
+        hours: int,
+        version: Optional[str] = None
+) -> dict:
     """
     Class method that retrieves data from hobolink and usgs and processes
     data, then creates json-like dictionary structure for model output.
@@ -42,16 +66,20 @@ def model_api(reaches: List[int], hours: int) -> dict:
     # First step is to validate inputs
 
     # `hours` must be an integer between 1 and `API_MAX_HOURS`. Default is 24
-    if hours > current_app.config['API_MAX_HOURS']:
-        hours = current_app.config['API_MAX_HOURS']
-    elif hours < 1:
-        hours = 1
+    hours = clamp_hours(hours)
     # `reaches` must be a list of integers. Default is all the reaches.
 
+    # `version` must be a registered model version. Default is the version
+    # that the website runs.
+    if version is None:
+        version, _ = get_model_coefficients()
+    elif version not in get_model_registry():
+        abort(400, f'Unknown model version: {version!r}')
+
     # get model output data from database
-    df = latest_model_outputs(hours)
+    df = latest_model_outputs(hours, version=version, reaches=reaches)
     return {
-        'model_version': MODEL_VERSION,
+        'model_version': version,
         'time_returned': pd.to_datetime('today'),
         'is_boating_season': bool(current_app.config['BOATING_SEASON']),
         'model_outputs': [
@@ -77,7 +105,27 @@ def predictive_model_api():
     """Returns JSON of the predictive model outputs."""
     reaches = request.args.getlist('reach', type=int) or [2, 3, 4, 5]
     hours = request.args.get('hours', type=int) or 24
-    return jsonify(model_api(reaches, hours))
+    version = request.args.get('version')
+
+    # Normalize the inputs first, so that requests for the same outputs share
+    # one cache entry.
+    hours = clamp_hours(hours)
+    reaches = sorted(set(reaches))
+
+    # The response is cached until the data changes, except for the time it
+    # was returned, which is added to the end of the cached JSON object.
+    key = ('model', tuple(reaches), hours, version, data_version.get())
+    body = response_cache.get(key)
+    if body is None:
+        data = model_api(reaches, hours, version=version)
+        del data['time_returned']
+        body = json.dumps(data).encode('utf8')[:-1]
+        response_cache.set(key, body)
+    time_returned = json.dumps(pd.to_datetime('today')).encode('utf8')
+    return current_app.response_class(
+        body + b', "time_returned": ' + time_returned + b'}\n',
+        mimetype=current_app.config['JSONIFY_MIMETYPE']
+    )
 
 
 @bp.route('/v1/boathouses')
@@ -92,15 +140,17 @@ def boathouses_api():
 @swag_from('model_input_data_api.yml')
 def model_input_data_api():
     """Returns records of the data used for the model."""
-    df = execute_sql('''SELECT * FROM processed_data ORDER BY time''')
-
     # Parse the hours
-    hours = request.args.get('hours', type=int) or 24
-    if hours > current_app.config['API_MAX_HOURS']:
-        hours = current_app.config['API_MAX_HOURS']
-    elif hours < 1:
-        hours = 1
+    hours = clamp_hours(request.args.get('hours', type=int) or 24)
+
+    # Only the latest rows are read, using the index on `time`.
+    df = execute_sql('''
+        SELECT * FROM (
+            SELECT * FROM processed_data ORDER BY time DESC LIMIT :hours
+        ) AS latest
+        ORDER BY time;
+    ''', params={'hours': hours})
 
     return jsonify({
-        'model_input_data': df.tail(n=hours).to_dict(orient='records')
+        'model_input_data': df.to_dict(orient='records')
     })
@@ -4,32 +4,38 @@ from flask import Blueprint
 from flask import render_template
 from flask import request
 from flask import current_app
-from flask import flash
+from flask import g
 
-from ..data.manual_overrides import get_currently_overridden_boathouses
+from ..cache import init_conditional_get
+from ..cache import latest_time
+from ..snapshots import init_snapshots
+from ..data.boathouse_flags import current_flags
 from ..data.predictive_models import latest_model_outputs
 # from ..data.database import get_boathouse_by_reach_dict
-from ..data.database import get_boathouse_metadata_dict
-from ..data.database import get_latest_time
 
 bp = Blueprint('flagging', __name__)
 
+# The flags pages only change when the data or the manual overrides change.
+init_conditional_get(bp, ['index', 'flags'])
 
-@bp.before_request
-def before_request():
-    # Get the latest time shown in the database
-    ltime = get_latest_time()
-
-    # Get current time from the computer clock
-    ttime = pd.Timestamp.now()
+# `/` and `/flags` are served from the snapshots when they are current.
+init_snapshots(bp)
 
-    # Calculate difference between now and d.b. time
-    diff = ttime - ltime
 
-    # If more than 48 hours, flash message.
-    if diff >= pd.Timedelta(48, 'hr'):
-        flash('<b>Note:</b> The database has not updated in at least 48 '
-              'hours. The information displayed on this page may be outdated.')
+@bp.before_request
+def before_request():
+    # Notices are passed to the templates without the session, so the pages
+    # don't set cookies and proxies can cache them.
+    g.notices = []
+
+    # If the database hasn't been updated in more than 48 hours, show a
+    # notice. The latest time is kept in memory until the data changes, so this
+    # doesn't normally query the database.
+    if latest_time.is_stale():
+        g.notices.append(
+            '<b>Note:</b> The database has not updated in at least 48 hours. '
+            'The information displayed on this page may be outdated.'
+        )
 
     # ~~~
 
@@ -48,7 +54,7 @@ def before_request():
                 'are not intended to be used to make decisions regarding '
                 'recreational activities along the Charles River.'
             )
-        flash(msg)
+        g.notices.append(msg)
 
 
 def stylize_model_output(df: pd.DataFrame) -> str:
@@ -78,35 +84,15 @@ def stylize_model_output(df: pd.DataFrame) -> str:
     return df.to_html(index=False, escape=False)
 
 
-def parse_model_outputs(model_output_df: pd.DataFrame) -> dict:
-    model_output_df = model_output_df.set_index('reach')
-
-    boathouses = get_boathouse_metadata_dict()['boathouses']
-    flags = {}
-
-    # loop through all boathouses
-    for boathouse in boathouses:
-        flags[boathouse.boathouse] = model_output_df['safe'][boathouse.reach]
-
-    # then set any and all overriden boathouses to False (Irregardless of model output)
-    overridden_boathouses = get_currently_overridden_boathouses()
-
-    for or_boathouse in overridden_boathouses:
-        print(or_boathouse)
-        flags[or_boathouse] = False
-
-    return flags
-
-
 @bp.route('/')
 def index() -> str:
     """
     The home page of the website. This page contains a brief description of the
     purpose of the website, and the latest outputs for the flagging model.
     """
-    df = latest_model_outputs()
-    homepage = parse_model_outputs(df)
-    model_last_updated_time = df['time'].iloc[0]
+    snapshot = current_flags.get()
+    homepage = snapshot.flags()
+    model_last_updated_time = snapshot.model_time
     boating_season = current_app.config['BOATING_SEASON']
 
     return render_template('index.html',
@@ -139,7 +125,7 @@ def output_model() -> str:
     # Look at no more than x_MAX_HOURS
     hours = min(max(hours, 1), current_app.config['API_MAX_HOURS'])
 
-    df = latest_model_outputs(hours)
+    df = latest_model_outputs(hours, reaches=None if reach == -1 else [reach])
 
     # reach_html_tables is a dict where the index is the reach number
     # and the values are HTML code for the table of data to display for
@@ -160,11 +146,9 @@ def output_model() -> str:
 
 @bp.route('/flags')
 def flags() -> str:
-    # TODO: Update to use combination of Boathouses and the predictive model
-    #  outputs
-    df = latest_model_outputs()
-    boathouse_statuses = parse_model_outputs(df)
-    model_last_updated_time = df['time'].iloc[0]
+    snapshot = current_flags.get()
+    boathouse_statuses = snapshot.flags()
+    model_last_updated_time = snapshot.model_time
     boating_season = current_app.config['BOATING_SEASON']
 
     return render_template('flags.html',
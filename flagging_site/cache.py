@@ -0,0 +1,378 @@
+"""
+This file handles the caches that the website keeps in memory. The data behind
+the website only changes when `update_database` runs (about once an hour), so
+most responses can be reused until then:
+
+- `data_version` keeps track of the version of the data in the database. The
+  version is a number stored in the `data_version` table that
+  `update_database` increases every time it changes the data. Each process
+  reads it again at most every `DATA_VERSION_TTL` seconds, so checking the
+  version is normally free.
+- `response_cache` holds serialized responses. Their keys include the data
+  version, so responses made from old data are never used once the process
+  sees the new version. Responses also expire after `RESPONSE_CACHE_TTL`
+  seconds, and only the `RESPONSE_CACHE_SIZE` most recently used responses are
+  kept.
+- `latest_time` keeps the time of the latest processed data, which the pages
+  use to say when the data is out of date. It is read again when the data
+  version changes, or at most every `LATEST_TIME_TTL` seconds.
+
+These are configured with the app's config in the `create_app` function via
+`init_cache(app)`.
+
+Pages that only change when the data or the manual overrides change also
+support conditional GET requests (see `init_conditional_get`), so browsers,
+proxies and CDNs can check whether their copy is still current without the
+page being made again.
+"""
+import calendar
+import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+from typing import Hashable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import pandas as pd
+from flask import Blueprint
+from flask import Flask
+from flask import Response
+from flask import current_app
+from flask import g
+from flask import request
+from sqlalchemy.exc import ProgrammingError
+
+from .data.hobolink import HOBOLINK_TIMEZONE
+
+
+class TTLCache:
+    """A thread-safe least-recently-used cache where the entries also expire
+    after a number of seconds.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = 3600):
+        """
+        Args:
+            maxsize: (int) Most number of entries to keep.
+            ttl: (float) Seconds that an entry is kept for.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value for `key`, or `default` if it is not in the cache or
+        has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] >= self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def read_data_version() -> int:
+    """Return the version of the data in the database, or 0 if the data has
+    never been versioned.
+    """
+    from .data.database import execute_sql
+    try:
+        df = execute_sql('SELECT MAX(version) AS version FROM data_version;')
+    except ProgrammingError:
+        # The table has not been created yet.
+        return 0
+    version = df['version'].iloc[0]
+    return 0 if pd.isna(version) else int(version)
+
+
+def bump_data_version() -> int:
+    """Increase the version of the data in the database. This should be run
+    every time the data behind the website's pages changes.
+
+    Returns:
+        The new version.
+    """
+    from .data.database import db
+    with db.engine.begin() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS data_version (
+                version         bigint PRIMARY KEY,
+                updated_at      timestamptz NOT NULL
+            );
+            LOCK TABLE data_version IN EXCLUSIVE MODE;
+        ''')
+        version = conn.execute('''
+            INSERT INTO data_version (version, updated_at)
+            SELECT COALESCE(MAX(version), 0) + 1, NOW() FROM data_version
+            RETURNING version;
+        ''').scalar()
+        conn.execute('DELETE FROM data_version WHERE version < %s;',
+                     (version,))
+    data_version.set(version)
+    return version
+
+
+class DataVersion:
+    """The version of the data in the database, as last seen by this process."""
+
+    def __init__(self, ttl: float = 10):
+        """
+        Args:
+            ttl: (float) Seconds to go before reading the version from the
+                 database again.
+        """
+        self.ttl = ttl
+        self._version: Optional[int] = None
+        self._read_at = 0
+        self._lock = threading.Lock()
+
+    def get(self) -> int:
+        """Return the version of the data, reading it from the database if it
+        has not been read in the last `ttl` seconds.
+        """
+        with self._lock:
+            if (
+                    self._version is None
+                    or time.monotonic() - self._read_at >= self.ttl
+            ):
+                self._version = read_data_version()
+                self._read_at = time.monotonic()
+            return self._version
+
+    def set(self, version: int) -> None:
+        """Set the version, e.g. right after this process changed it."""
+        with self._lock:
+            self._version = version
+            self._read_at = time.monotonic()
+
+
+class LatestTime:
+    """The time of the latest processed data, as last seen by this process."""
+
+    def __init__(self, ttl: float = 60):
+        """
+        Args:
+            ttl: (float) Seconds to go before reading the time from the database
+                 again, even if the data version has not changed.
+        """
+        self.ttl = ttl
+        self._latest_time = pd.NaT
+        self._version: Optional[int] = None
+        self._read_at = 0
+        self._lock = threading.Lock()
+
+    def get(self) -> pd.Timestamp:
+        """Return the latest time in the `processed_data` table, reading it
+        from the database if the data version changed or it has not been read in
+        the last `ttl` seconds.
+        """
+        from .data.database import get_latest_time
+        version = data_version.get()
+        with self._lock:
+            if (
+                    self._version != version
+                    or time.monotonic() - self._read_at >= self.ttl
+            ):
+                self._latest_time = get_latest_time()
+                self._version = version
+                self._read_at = time.monotonic()
+            return self._latest_time
+
+    def is_stale(self) -> bool:
+        """Return whether the processed data is more than `STALE_DATA_HOURS`
+        old. This is False if there is no processed data.
+        """
+        latest_time = self.get()
+        if pd.isna(latest_time):
+            return False
+        return pd.Timestamp.now() - latest_time >= \
+            pd.Timedelta(hours=STALE_DATA_HOURS)
+
+
+STALE_DATA_HOURS = 48
+"""Hours after which the pages say that the database has not been updated."""
+
+data_version = DataVersion()
+response_cache = TTLCache()
+latest_time = LatestTime()
+
+
+def init_cache(app: Flask):
+    """Uses the app instance's config to set the sizes and expiry times of the
+    caches.
+    """
+    data_version.ttl = app.config['DATA_VERSION_TTL']
+    response_cache.maxsize = app.config['RESPONSE_CACHE_SIZE']
+    response_cache.ttl = app.config['RESPONSE_CACHE_TTL']
+    response_cache.clear()
+    latest_time.ttl = app.config['LATEST_TIME_TTL']
+
+
+# Conditional GET
+# ~~~~~~~~~~~~~~~
+
+def _local_epoch(ts: pd.Timestamp) -> float:
+    """Seconds since the epoch for a time without a timezone from the
+    database, which is in the timezone of the HOBOlink data (GMT-04:00), not
+    the server's local time.
+    """
+    return ts.tz_localize(HOBOLINK_TIMEZONE).timestamp()
+
+
+def _utc_epoch(dt: datetime.datetime) -> float:
+    """Seconds since the epoch for a time from an HTTP header. These are in
+    UTC whether or not they have a timezone.
+    """
+    return calendar.timegm(dt.utctimetuple())
+
+
+def _read_page_state() -> dict:
+    """Read everything that the validators of the pages depend on, other than
+    the current time.
+    """
+    from .data.database import execute_sql
+    latest_time = execute_sql(
+        'SELECT MAX(time) AS latest_time FROM model_outputs;'
+    )['latest_time'].iloc[0]
+    overrides = execute_sql(
+        'SELECT boathouse, start_time, end_time FROM manual_overrides;'
+    )
+    try:
+        updated_at = execute_sql(
+            'SELECT EXTRACT(EPOCH FROM MAX(updated_at)) AS updated_at '
+            'FROM data_version;'
+        )['updated_at'].iloc[0]
+    except ProgrammingError:
+        # The table has not been created yet.
+        updated_at = None
+    return {
+        'latest_time': latest_time,
+        'updated_at': 0 if pd.isna(updated_at) else float(updated_at),
+        'overrides': list(overrides.itertuples(index=False)),
+    }
+
+
+def get_validators() -> Tuple[str, float]:
+    """Return the ETag and the Last-Modified time of the pages and API
+    responses that are made from the latest model outputs and the manual
+    overrides.
+
+    The state of the database is read once per data version, so this normally
+    doesn't run any queries. The overrides that are in effect and whether the
+    data is out of date are worked out from the current time, since they can
+    change without the data changing.
+
+    Returns:
+        The ETag, and the Last-Modified time as seconds since the epoch.
+    """
+    version = data_version.get()
+    state = response_cache.get(('page_state', version))
+    if state is None:
+        state = _read_page_state()
+        response_cache.set(('page_state', version), state)
+
+    # The times in the database are compared in their own timezone, so that
+    # a Last-Modified time is never in the future.
+    now = pd.Timestamp.now(tz=HOBOLINK_TIMEZONE).tz_localize(None)
+    last_modified = state['updated_at']
+    overridden = []
+    for override in state['overrides']:
+        if override.start_time <= now <= override.end_time:
+            overridden.append(override.boathouse)
+        # An override that started or ended changes the pages.
+        for boundary in [override.start_time, override.end_time]:
+            if boundary <= now:
+                last_modified = max(last_modified, _local_epoch(boundary))
+
+    latest_time = state['latest_time']
+    stale_at = latest_time + pd.Timedelta(hours=STALE_DATA_HOURS)
+    stale = not pd.isna(latest_time) and stale_at <= now
+    if stale:
+        last_modified = max(last_modified, _local_epoch(stale_at))
+
+    key = '|'.join(map(str, [
+        version,
+        latest_time,
+        sorted(overridden),
+        stale,
+        current_app.config['BOATING_SEASON'],
+    ]))
+    etag = hashlib.sha1(key.encode('utf8')).hexdigest()
+    return etag, int(last_modified)
+
+
+def init_conditional_get(bp: Blueprint, endpoints: List[str]) -> None:
+    """Add conditional GET support to some of a blueprint's endpoints.
+
+    Responses get an ETag, a Last-Modified time, and a Cache-Control header
+    from `get_validators()`. Requests whose If-None-Match or If-Modified-Since
+    header shows that the client already has the latest response get an empty
+    304 response, before the blueprint's other `before_request` functions or
+    the view run. This needs to be run before the blueprint's other
+    `before_request` functions are registered.
+
+    Args:
+        bp: (Blueprint) The blueprint.
+        endpoints: (list) Names of the blueprint's views, e.g. "flags".
+    """
+    endpoints = {f'{bp.name}.{i}' for i in endpoints}
+
+    def _set_headers(response: Response) -> Response:
+        # The ETag is weak because the API responses include the time they
+        # were returned, so they are equivalent but not byte-for-byte equal.
+        response.set_etag(g.etag, weak=True)
+        response.last_modified = g.last_modified
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['HTTP_CACHE_MAX_AGE']
+        return response
+
+    @bp.before_request
+    def _return_304_if_not_modified() -> Optional[Response]:
+        if request.endpoint not in endpoints or request.method != 'GET':
+            return None
+        g.etag, g.last_modified = get_validators()
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(g.etag)
+        elif request.if_modified_since:
+            not_modified = \
+                g.last_modified <= _utc_epoch(request.if_modified_since)
+        else:
+            not_modified = False
+        if not_modified:
+            return _set_headers(current_app.response_class(status=304))
+        return None
+
+    @bp.after_request
+    def _add_validators(response: Response) -> Response:
+        if (
+                request.endpoint in endpoints
+                and response.status_code == 200
+                and 'etag' in g
+        ):
+            _set_headers(response)
+        return response
@@ -7,6 +7,8 @@ this module, they won't refresh.
 """
 import os
 import re
+import tempfile
+from typing import Optional
 from flask.cli import load_dotenv
 from distutils.util import strtobool
 
@@ -17,6 +19,7 @@ from distutils.util import strtobool
 ROOT_DIR = os.path.abspath(os.path.dirname(__file__))
 QUERIES_DIR = os.path.join(ROOT_DIR, 'data', 'queries')
 DATA_STORE = os.path.join(ROOT_DIR, 'data', '_store')
+RAW_DATA_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'flagging_raw_data')
 VAULT_FILE = os.path.join(ROOT_DIR, 'vault.7z')
 
 
@@ -77,11 +80,36 @@ class Config:
     SQLALCHEMY_RECORD_QUERIES: bool = True
     SQLALCHEMY_TRACK_MODIFICATIONS: bool = False
 
+    TABLE_SWAP_ATTEMPTS: int = 5
+    """Number of times to try swapping in newly written tables if a slow query
+    is still reading from the old tables. See `swap_in_tables`.
+    """
+
+    PROCESS_DATA_INCREMENTALLY: bool = True
+    """If True, `update_database` only processes the hours that have new data
+    and appends them to the `processed_data` and `model_outputs` tables, instead
+    of processing the last 21 days of data each time. The full 21 days are
+    still processed when the `processed_data` table is empty.
+    """
+
+    PROCESS_DATA_IN_DATABASE: bool = False
+    """If True, `update_database` calculates the processed data inside of
+    Postgres with window functions (`process_data_in_database`) when it
+    processes the full 21 days, instead of downloading the HOBOlink data from
+    the database and processing it with Pandas.
+    """
+
     QUERIES_DIR: str = QUERIES_DIR
     """Directory that contains various queries that are accessible throughout
     the rest of the code base.
     """
 
+    PREPARE_QUERIES: bool = True
+    """Run the queries in `QUERIES_DIR` as prepared statements. This should be
+    turned off if the database is behind a connection pooler that doesn't keep
+    each client on one connection (e.g. PgBouncer in transaction mode).
+    """
+
     # ==========================================================================
     # MISC. CUSTOM CONFIG OPTIONS
     #
@@ -140,12 +168,120 @@ class Config:
     when doing requests.
     """
 
+    RAW_DATA_CACHE_DIR: str = RAW_DATA_CACHE_DIR
+    """Where the raw responses from the HOBOlink and USGS APIs are saved. Each
+    file is named after the hash of the response's contents.
+    """
+
+    RAW_DATA_CACHE_SIZE: int = 24
+    """Number of raw responses kept in the cache for each API."""
+
+    FEATURE_STORE_DIR: Optional[str] = os.getenv('FEATURE_STORE_DIR') or None
+    """Where `update_database` keeps a copy of the processed data, in one Arrow
+    file per month (see `feature_store.py`). This is off by default. It should
+    be a directory on persistent storage that the processes which read the
+    features can see too, not a dyno's own disk (e.g. on Heroku, the scheduler
+    that runs `flask update-db` has a disk that is thrown away after each run).
+    """
+
+    MODEL_COEFFICIENTS_FILE: str = os.getenv('MODEL_COEFFICIENTS_FILE')
+    """Path to a JSON file of model coefficients made by `flask retrain-models`.
+    If set, the website runs those models instead of the 2020 models defined in
+    `predictive_models.py`.
+    """
+
+    EXTRA_MODEL_COEFFICIENTS_FILES: list = [
+        i for i in os.getenv('EXTRA_MODEL_COEFFICIENTS_FILES', '').split(',')
+        if i
+    ]
+    """Paths to more files of model coefficients (separated by commas in the
+    environment variable). These model versions are run alongside the website's
+    version and stored in the `model_outputs` table, so that their flags can be
+    compared. The API returns them with the `version` parameter.
+    """
+
+    DATA_VERSION_TTL: float = 10
+    """Seconds that each process goes before checking whether
+    `update_database` has changed the data. See `cache.py`.
+    """
+
+    LATEST_TIME_TTL: float = 60
+    """Most seconds that each process goes before reading the time of the
+    latest processed data again, which is used to say when the data is out of
+    date. It is also read again whenever the data version changes.
+    """
+
+    RESPONSE_CACHE_SIZE: int = 256
+    """Number of serialized API responses kept in memory by each process."""
+
+    RESPONSE_CACHE_TTL: float = 3600
+    """Seconds that a cached API response is kept for. Cached responses are
+    also dropped as soon as the data changes.
+    """
+
+    SNAPSHOT_DIR: Optional[str] = os.getenv('SNAPSHOT_DIR') or None
+    """Directory that the snapshots of the flags pages and the API are
+    published to (see `snapshots.py`). The snapshots are off unless this and
+    `SNAPSHOT_BASE_URL` are set. It should be on storage that every process of
+    the website shares, not a dyno's own disk; otherwise each process renders
+    and publishes its own snapshots.
+    """
+
+    SNAPSHOT_BASE_URL: Optional[str] = os.getenv('SNAPSHOT_BASE_URL')
+    """Public root URL of the website (e.g. "https://example.com/"), which is
+    used for the absolute links in the snapshots. The snapshots are only
+    published if this is set, and only requests for this host are served from
+    them.
+    """
+
+    SERVE_SNAPSHOTS: bool = True
+    """Serve `/`, `/flags`, `/api/v1/model` and `/api/v1/boathouses` from
+    the snapshots when they are current.
+    """
+
+    HTTP_CACHE_MAX_AGE: int = 300
+    """Seconds that browsers, proxies and CDNs can reuse the flags pages and
+    the model API before checking whether they changed (the `max-age` of the
+    `Cache-Control` header).
+    """
+
     API_MAX_HOURS: int = 48
     """The maximum number of hours of data that the API will return. We are not
     trying to be stingy about our data, we just want this in order to avoid any
     odd behaviors if the user requests more data than exists.
     """
 
+    HTTP_CONNECT_TIMEOUT: float = 5
+    """Seconds to wait to connect to the HOBOlink and USGS APIs."""
+
+    HTTP_READ_TIMEOUT: float = 60
+    """Seconds to wait for the HOBOlink and USGS APIs to send data before giving
+    up on a request.
+    """
+
+    HTTP_MAX_RETRIES: int = 3
+    """Number of times a request to the HOBOlink or USGS API is retried if it
+    fails with a 5xx status code or a connection error.
+    """
+
+    HTTP_BACKOFF_FACTOR: float = 0.5
+    """Controls the wait between retries: before the nth retry, we wait a random
+    number of seconds between 0 and `HTTP_BACKOFF_FACTOR * 2 ** n`.
+    """
+
+    USGS_FETCH_TIMEOUT: float = 60
+    """Seconds that `update_database` waits for the USGS data to be downloaded
+    and parsed. The HOBOlink data is still written if the USGS times out. The
+    request and its retries are also cut off after this long, so the retries
+    fit inside of this time.
+    """
+
+    HOBOLINK_FETCH_TIMEOUT: float = 120
+    """Seconds that `update_database` waits for the HOBOlink data to be
+    downloaded and parsed. The USGS data is still written if HOBOlink times out.
+    The request and its retries are also cut off after this long.
+    """
+
     SEND_TWEETS: bool = strtobool(os.getenv('SEND_TWEETS') or 'false')
     """If True, the website behaves normally. If False, any time the app would
     send a Tweet, it does not do so. It is useful to turn this off when
@@ -241,6 +377,11 @@ class TestingConfig(Config):
     """
     SEND_TWEETS: bool = False
     TESTING: bool = True
+    FEATURE_STORE_DIR: str = os.path.join(tempfile.gettempdir(),
+                                          'flagging_test_features')
+    SNAPSHOT_DIR: str = os.path.join(tempfile.gettempdir(),
+                                     'flagging_test_snapshots')
+    SNAPSHOT_BASE_URL: str = 'http://localhost/'
 
 
 def get_config_from_env(env: str) -> Config:
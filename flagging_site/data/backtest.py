@@ -0,0 +1,350 @@
+"""
+This file runs the predictive models over years of historical HOBOlink and
+USGS data, which is a lot more than the 21 days the website processes or the
+90 days that the admin panel can export.
+
+The history is read from two CSV files, one with the HOBOlink data and one
+with the USGS data. They have the same columns as the `hobolink` and `usgs`
+tables (e.g. from `\\copy hobolink TO 'hobolink.csv' CSV HEADER` in psql), and
+must be sorted by time.
+
+The files are streamed in chunks of time instead of being read all at once,
+and each chunk is processed with `process_data` on a process pool. To make the
+output the same as processing all of the data at once, each chunk is sent
+along with:
+
+- the 47 hours of data before it, so the 24 and 48 hour windows at the start
+  of the chunk are complete, and
+- the first hour of HOBOlink data after it, so that `process_data` does not
+  drop the chunk's last hour, and fills in the hours at the end of the chunk
+  that don't have data.
+
+The time of the last significant rain is carried over from one chunk to the
+next when the results come back, and then the models are run on each chunk.
+Only a few chunks are in memory at any time, so decades of data can be run in
+bounded memory.
+
+The outputs are written to a directory:
+
+- `model_outputs_reach_<n>.csv`: the model outputs for each reach.
+- `summary.csv`: summary statistics for each reach, such as the number of days
+  that the reach was flagged.
+"""
+import os
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+import pandas as pd
+
+from .predictive_models import ROLLING_WINDOW_HOURS
+from .predictive_models import add_features
+from .predictive_models import aggregate_hourly
+from .predictive_models import all_models
+from .predictive_models import hourly_grid
+
+DEFAULT_CHUNK_DAYS = 30
+
+# Number of rows read from the CSV files at a time.
+CSV_READ_ROWS = 100_000
+
+
+def _iter_windows(
+        fpath: str,
+        freq: str
+) -> Iterator[Tuple[pd.Timestamp, pd.DataFrame]]:
+    """Read a CSV file sorted by time, and yield the rows in each window of
+    time that has data, in order.
+    """
+    leftover = None
+    for df in pd.read_csv(fpath, parse_dates=['time'], chunksize=CSV_READ_ROWS):
+        if leftover is not None:
+            df = pd.concat([leftover, df], ignore_index=True)
+        windows = df['time'].dt.floor(freq)
+        # The last window might continue into the next rows of the file.
+        last_window = windows.iloc[-1]
+        for window, df_window in df.loc[windows < last_window].groupby(
+                windows[windows < last_window]):
+            yield window, df_window.reset_index(drop=True)
+        leftover = df.loc[windows == last_window]
+    if leftover is not None and len(leftover):
+        yield (leftover['time'].iloc[0].floor(freq),
+               leftover.reset_index(drop=True))
+
+
+def _empty_frame(fpath: str) -> pd.DataFrame:
+    """Return an empty DataFrame with the columns of a CSV file."""
+    df = pd.read_csv(fpath, nrows=0)
+    return (
+        df
+        .astype({c: float for c in df.columns})
+        .astype({'time': 'datetime64[ns]'})
+    )
+
+
+def _iter_history(
+        hobolink_fpath: str,
+        usgs_fpath: str,
+        freq: str
+) -> Iterator[Tuple[pd.Timestamp, pd.DataFrame, pd.DataFrame]]:
+    """Yield the HOBOlink and USGS data in each window of time from the first
+    data to the last data, in order. Either DataFrame is empty if that source
+    has no data in the window.
+    """
+    windows = {
+        'hobolink': _iter_windows(hobolink_fpath, freq),
+        'usgs': _iter_windows(usgs_fpath, freq),
+    }
+    empty = {
+        'hobolink': _empty_frame(hobolink_fpath),
+        'usgs': _empty_frame(usgs_fpath),
+    }
+    upcoming = {k: next(v, None) for k, v in windows.items()}
+
+    window = None
+    while any(i is not None for i in upcoming.values()):
+        # Windows without any data in between windows with data are also
+        # yielded, so that their hours are included in the outputs.
+        next_window = min(i[0] for i in upcoming.values() if i is not None)
+        if window is None:
+            window = next_window
+        else:
+            window = min(window + pd.Timedelta(freq), next_window)
+        data = {}
+        for k in windows:
+            if upcoming[k] is not None and upcoming[k][0] == window:
+                data[k] = upcoming[k][1]
+                upcoming[k] = next(windows[k], None)
+            else:
+                data[k] = empty[k]
+        yield window, data['hobolink'], data['usgs']
+
+
+def _process_chunk(
+        df_hobolink: pd.DataFrame,
+        df_usgs: pd.DataFrame,
+        grid_start: Optional[pd.Timestamp],
+        start: pd.Timestamp,
+        end: pd.Timestamp,
+        low_memory: bool = False
+) -> pd.DataFrame:
+    """Process the data the same way as `process_data`, and return the
+    processed data between `start` and `end`. This runs in the process pool.
+
+    The hourly grid starts at `grid_start` even if the chunk's data starts
+    later, so that a chunk in the middle of a gap in the data still gets a row
+    for every hour, like it would if all of the data were processed at once.
+
+    The time of the last significant rain before the chunk isn't known here,
+    so it is left as NaT until the first significant rain within the chunk;
+    `_link_chunk` fills it in.
+    """
+    df = aggregate_hourly(df_hobolink=df_hobolink, df_usgs=df_usgs,
+                          low_memory=low_memory)
+    df = add_features(hourly_grid(df, start=grid_start),
+                      low_memory=low_memory)
+    df = df.loc[(df['time'] >= start) & (df['time'] < end)].copy()
+    df['last_sig_rain'] = df['time'].where(df['sig_rain']).ffill()
+    return df.reset_index(drop=True)
+
+
+def _link_chunk(
+        df: pd.DataFrame,
+        last_sig_rain: Optional[pd.Timestamp]
+) -> pd.DataFrame:
+    """Fill in the time of the last significant rain that happened before the
+    chunk, and recalculate the time since then.
+    """
+    if last_sig_rain is None:
+        # This is the first chunk, so fill it in the same way as
+        # `process_data`.
+        last_sig_rain = df['time'].min()
+    df['last_sig_rain'] = df['last_sig_rain'].fillna(last_sig_rain)
+    df['days_since_sig_rain'] = (
+        ((df['time'] - df['last_sig_rain']).dt.seconds / 60 / 60 / 24)
+        .astype(df['days_since_sig_rain'].dtype)
+    )
+    return df
+
+
+class _BacktestSummary:
+    """Keeps running totals of the model outputs for each reach, so the outputs
+    don't need to be kept in memory.
+    """
+
+    def __init__(self):
+        self.hours = {}
+        self.unsafe_hours = {}
+        self.total_probability = {}
+        self.max_probability = {}
+        self.days = {}
+        self.flag_days = {}
+        self.start = {}
+        self.end = {}
+
+    def add(self, model_outs: pd.DataFrame) -> None:
+        model_outs = model_outs.assign(date=model_outs['time'].dt.date)
+        for reach, df in model_outs.groupby('reach'):
+            self.hours[reach] = self.hours.get(reach, 0) + len(df)
+            self.unsafe_hours[reach] = \
+                self.unsafe_hours.get(reach, 0) + int((~df['safe']).sum())
+            self.total_probability[reach] = \
+                self.total_probability.get(reach, 0) + df['probability'].sum()
+            self.max_probability[reach] = max(
+                self.max_probability.get(reach, 0), df['probability'].max()
+            )
+            self.days.setdefault(reach, set()).update(df['date'])
+            self.flag_days.setdefault(reach, set()).update(
+                df.loc[~df['safe'], 'date']
+            )
+            self.start.setdefault(reach, df['time'].min())
+            self.end[reach] = df['time'].max()
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame([
+            {
+                'reach': reach,
+                'start': self.start[reach],
+                'end': self.end[reach],
+                'hours': self.hours[reach],
+                'unsafe_hours': self.unsafe_hours[reach],
+                'days': len(self.days[reach]),
+                'flag_days': len(self.flag_days[reach]),
+                'mean_probability':
+                    self.total_probability[reach] / self.hours[reach],
+                'max_probability': self.max_probability[reach],
+            }
+            for reach in sorted(self.hours)
+        ])
+
+
+def run_backtest(
+        hobolink_fpath: str,
+        usgs_fpath: str,
+        out_dir: str,
+        chunk_days: int = DEFAULT_CHUNK_DAYS,
+        workers: Optional[int] = None,
+        low_memory: bool = False
+) -> pd.DataFrame:
+    """Run the models over historical data. See the top of this file for more.
+
+    Args:
+        hobolink_fpath: (str) CSV file of HOBOlink data, sorted by time.
+        usgs_fpath: (str) CSV file of USGS data, sorted by time.
+        out_dir: (str) Directory to write the outputs to. Files from a previous
+                 backtest are overwritten.
+        chunk_days: (int) Number of days of data processed in each chunk.
+        workers: (int) Number of processes to use. Defaults to the number of
+                 CPUs.
+        low_memory: (bool) Process the data as float32 instead of float64. The
+                    outputs can differ from `process_data` in the last few
+                    decimal places.
+
+    Returns:
+        Pandas DataFrame of the summary statistics for each reach.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    freq = f'{chunk_days}D'
+    workers = workers or os.cpu_count()
+    summary = _BacktestSummary()
+    written_reaches = set()
+    last_sig_rain = None
+
+    def _finish(future: Future) -> None:
+        nonlocal last_sig_rain
+        df = _link_chunk(future.result(), last_sig_rain)
+        if not len(df):
+            return
+        last_sig_rain = df['last_sig_rain'].iloc[-1]
+
+        model_outs = all_models(df, rows=len(df))
+        summary.add(model_outs)
+        for reach, df_reach in model_outs.groupby('reach'):
+            df_reach.to_csv(
+                os.path.join(out_dir, f'model_outputs_reach_{reach}.csv'),
+                mode='a' if reach in written_reaches else 'w',
+                header=reach not in written_reaches,
+                index=False
+            )
+            written_reaches.add(reach)
+
+    # The chunks have to be finished in order to carry over the time of the
+    # last significant rain, and at most `2 * workers` chunks are queued up at
+    # a time to keep the memory bounded.
+    pending: deque = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        first_hour = None
+
+        def _submit(chunk: Dict[str, pd.DataFrame], start, end) -> None:
+            if len(pending) >= 2 * workers:
+                _finish(pending.popleft())
+            # The hourly grid starts at the first hour of data, or the first
+            # hour that the chunk's windows need, whichever is later.
+            grid_start = None
+            if first_hour is not None:
+                grid_start = max(
+                    first_hour,
+                    start - pd.Timedelta(hours=ROLLING_WINDOW_HOURS - 1)
+                )
+            pending.append(executor.submit(
+                _process_chunk, chunk['hobolink'], chunk['usgs'],
+                grid_start, start, end, low_memory
+            ))
+
+        # Chunks wait here until the next HOBOlink data is read, so they can be
+        # sent along with its first hour.
+        waiting = []
+        tail = {'hobolink': None, 'usgs': None}
+        for window, df_hobolink, df_usgs in _iter_history(
+                hobolink_fpath, usgs_fpath, freq):
+            if len(df_hobolink):
+                next_hour = df_hobolink['time'].min().floor('h')
+                if first_hour is None:
+                    first_hour = next_hour
+                lookahead = {
+                    'hobolink': df_hobolink.loc[
+                        df_hobolink['time'] < next_hour + pd.Timedelta('1h')],
+                    'usgs': df_usgs.loc[
+                        df_usgs['time'] < next_hour + pd.Timedelta('1h')],
+                }
+                for chunk_window, chunk in waiting:
+                    _submit(
+                        {k: pd.concat([chunk[k], lookahead[k]])
+                         for k in lookahead},
+                        start=chunk_window,
+                        end=chunk_window + pd.Timedelta(freq)
+                    )
+                waiting = []
+
+            # Each chunk starts with the data for the hours before it that are
+            # needed for the rolling windows.
+            chunk = {
+                'hobolink': pd.concat([tail['hobolink'], df_hobolink],
+                                      ignore_index=True),
+                'usgs': pd.concat([tail['usgs'], df_usgs], ignore_index=True),
+            }
+            waiting.append((window, chunk))
+
+            # Keep the data from the last 47 hours of the window for the next
+            # chunk.
+            tail_start = (
+                window + pd.Timedelta(freq)
+                - pd.Timedelta(hours=ROLLING_WINDOW_HOURS - 1)
+            )
+            tail = {k: v.loc[v['time'] >= tail_start] for k, v in chunk.items()}
+
+        for chunk_window, chunk in waiting:
+            _submit(chunk, start=chunk_window,
+                    end=chunk_window + pd.Timedelta(freq))
+
+        while pending:
+            _finish(pending.popleft())
+
+    df_summary = summary.to_frame()
+    df_summary.to_csv(os.path.join(out_dir, 'summary.csv'), index=False)
+    return df_summary
@@ -0,0 +1,150 @@
+"""
+This file keeps the current flag of every boathouse in memory, so that the
+flags pages can be made without querying the database.
+
+The flags are kept in a `FlagSnapshot`, which is made from the boathouses, the
+latest model outputs and the manual overrides, and is never changed once it is
+made. When the data version changes (i.e. after `update_database` runs or the
+manual overrides are edited), or when a manual override starts or ends, a new
+snapshot is made and replaces the old one, so a request always sees one
+complete snapshot.
+"""
+import threading
+from typing import Dict
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+import pandas as pd
+
+from ..cache import data_version
+from .database import execute_sql
+from .database import get_boathouse_metadata_dict
+from .predictive_models import latest_model_outputs
+
+
+class BoathouseFlag(NamedTuple):
+    boathouse: str
+    reach: int
+    latitude: float
+    longitude: float
+    safe: bool
+    """Whether the boathouse has a blue flag: the model says that the reach is
+    safe, and the boathouse is not manually overridden.
+    """
+    override_reason: Optional[str]
+    """Reason of the manual override that is in effect, if there is one."""
+
+
+class FlagSnapshot(NamedTuple):
+    version: int
+    """Data version that the snapshot was made from."""
+    model_time: pd.Timestamp
+    """Time of the model outputs that the flags are based on."""
+    boathouses: Tuple[BoathouseFlag, ...]
+    expires_at: pd.Timestamp
+    """When the next manual override starts or ends, or NaT if none do."""
+
+    def flags(self) -> Dict[str, bool]:
+        """Return a dict of each boathouse's name and whether it has a blue
+        flag.
+        """
+        return {b.boathouse: b.safe for b in self.boathouses}
+
+    def is_current(self, version: int, now: pd.Timestamp) -> bool:
+        return (
+            self.version == version
+            and (pd.isna(self.expires_at) or now < self.expires_at)
+        )
+
+
+def build_flag_snapshot(version: int) -> FlagSnapshot:
+    """Make a snapshot of the current flags from the database.
+
+    Args:
+        version: (int) The data version that the database is at.
+
+    Returns:
+        The snapshot.
+    """
+    now = pd.Timestamp.now()
+    df_model = latest_model_outputs()
+    df_overrides = execute_sql('''
+        SELECT boathouse, start_time, end_time, reason
+        FROM manual_overrides
+        ORDER BY start_time;
+    ''')
+
+    safe = dict(zip(df_model['reach'], df_model['safe']))
+    reasons = {}
+    expires_at = pd.NaT
+    for o in df_overrides.itertuples(index=False):
+        if o.start_time <= now <= o.end_time:
+            reasons.setdefault(o.boathouse, o.reason)
+        # The flags change the next time an override starts or ends.
+        for boundary in [o.start_time, o.end_time + pd.Timedelta(1, 'us')]:
+            if boundary > now:
+                expires_at = boundary if pd.isna(expires_at) \
+                    else min(expires_at, boundary)
+
+    boathouses = tuple(
+        BoathouseFlag(
+            boathouse=b.boathouse,
+            reach=b.reach,
+            latitude=b.latitude,
+            longitude=b.longitude,
+            safe=bool(safe.get(b.reach, False)) and b.boathouse not in reasons,
+            override_reason=reasons.get(b.boathouse)
+        )
+        for b in get_boathouse_metadata_dict()['boathouses']
+    )
+    return FlagSnapshot(
+        version=version,
+        model_time=df_model['time'].max(),
+        boathouses=boathouses,
+        expires_at=expires_at
+    )
+
+
+class CurrentFlags:
+    """The latest flag snapshot of this process."""
+
+    def __init__(self):
+        self._snapshot: Optional[FlagSnapshot] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> FlagSnapshot:
+        """Return the flag snapshot, making a new one first if the data version
+        changed or a manual override started or ended since it was made.
+        """
+        version = data_version.get()
+        snapshot = self._snapshot
+        if snapshot is None \
+                or not snapshot.is_current(version, pd.Timestamp.now()):
+            snapshot = self.rebuild(version)
+        return snapshot
+
+    def rebuild(self, version: Optional[int] = None) -> FlagSnapshot:
+        """Make a new flag snapshot and use it for all requests from now on.
+
+        Args:
+            version: (int) The data version that the database is at. Defaults
+                     to the version last seen by this process.
+
+        Returns:
+            The new snapshot.
+        """
+        if version is None:
+            version = data_version.get()
+        with self._lock:
+            # Another thread may have made the same snapshot while this one was
+            # waiting for the lock.
+            snapshot = self._snapshot
+            if snapshot is None \
+                    or not snapshot.is_current(version, pd.Timestamp.now()):
+                snapshot = build_flag_snapshot(version)
+                self._snapshot = snapshot
+            return snapshot
+
+
+current_flags = CurrentFlags()
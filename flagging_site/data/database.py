@@ -9,34 +9,54 @@ connected to the actual database in the `create_app` function: the app instance
 is passed in via `db.init_app(app)`, and the `db` object looks for the config
 variable `SQLALCHEMY_DATABASE_URI`.
 """
-import os
+import io
+import time
 import pandas as pd
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
 from typing import Optional
+from typing import Tuple
+from typing import Union
 from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_sqlalchemy import declarative_base
+from sqlalchemy import text
 from sqlalchemy.exc import ResourceClosedError
 from psycopg2 import connect
+from psycopg2.errors import LockNotAvailable
 from dataclasses import dataclass
 
 db = SQLAlchemy()
 Base = declarative_base()
 
 
-def execute_sql(query: str) -> Optional[pd.DataFrame]:
+def execute_sql(
+        query: str,
+        params: Optional[Dict[str, Any]] = None
+) -> Optional[pd.DataFrame]:
     """Execute arbitrary SQL in the database. This works for both read and
     write operations. If it is a write operation, it will return None;
     otherwise it returns a Pandas dataframe.
 
     Args:
         query: (str) A string that contains the contents of a SQL query.
+        params: (dict) Values for the query's bind parameters, which are
+                written as e.g. `:days` in the query.
 
     Returns:
         Either a Pandas Dataframe the selected data for read queries, or None
         for write queries.
     """
     with db.engine.connect() as conn:
-        res = conn.execute(query)
+        if params is None:
+            res = conn.execute(query)
+        else:
+            res = conn.execute(text(query), params)
         try:
             df = pd.DataFrame(
                 res.fetchall(),
@@ -47,21 +67,211 @@ def execute_sql(query: str) -> Optional[pd.DataFrame]:
             return None
 
 
-def execute_sql_from_file(file_name: str) -> Optional[pd.DataFrame]:
+def execute_sql_from_file(
+        file_name: str,
+        params: Optional[Dict[str, Any]] = None
+) -> Optional[pd.DataFrame]:
     """Execute SQL from a file in the `QUERIES_DIR` directory, which should be
-    located at `flagging_site/data/queries`.
+    located at `flagging_site/data/queries`. The files are read once when the
+    app is created, and single statements run as prepared statements; see
+    `query_catalog.py`.
 
     Args:
         file_name: (str) A file name inside the `QUERIES_DIR` directory. It
                    should be only the file name alone and not the full path.
+        params: (dict) Values for the query's bind parameters. See
+                `execute_sql()`.
 
     Returns:
         Either a Pandas Dataframe the selected data for read queries, or None
         for write queries.
     """
-    path = os.path.join(current_app.config['QUERIES_DIR'], file_name)
-    with current_app.open_resource(path) as f:
-        return execute_sql(f.read().decode('utf8'))
+    from .query_catalog import query_catalog
+    return query_catalog.execute(file_name, params=params)
+
+
+def get_table_columns(table_name: str, cursor=None) -> List[str]:
+    """Return the names of the columns in a table, in the order that they are
+    declared.
+
+    Args:
+        table_name: (str) Name of the table.
+        cursor: A psycopg2 cursor. If not set, a new connection is used.
+    """
+    query = (
+        'SELECT column_name FROM information_schema.columns '
+        'WHERE table_schema = current_schema() AND table_name = %s '
+        'ORDER BY ordinal_position;'
+    )
+    if cursor is None:
+        with db.engine.connect() as conn:
+            return [r[0] for r in conn.execute(query, (table_name,))]
+    cursor.execute(query, (table_name,))
+    return [r[0] for r in cursor.fetchall()]
+
+
+def bulk_write(
+        df: pd.DataFrame,
+        table_name: str,
+        truncate: bool = True,
+        cursor=None
+) -> None:
+    """Write a DataFrame into a table that already exists, using Postgres's
+    `COPY FROM STDIN`. This is a lot faster than `DataFrame.to_sql`, which
+    inserts one row at a time, and it keeps the column types and indexes
+    declared in `schema.sql` because the table is not dropped and recreated.
+
+    The DataFrame's columns are matched to the table's columns by name. Any of
+    the table's columns that are not in the DataFrame are left NULL. A
+    ValueError is raised if the DataFrame has a column that is not in the
+    table, or if the table has no columns (e.g. because it doesn't exist).
+
+    Args:
+        df: (pd.DataFrame) Data to write.
+        table_name: (str) Name of the table. This is put directly into the
+                    query, so it should never come from user input.
+        truncate: (bool) If True, the table's existing rows are removed first.
+                  Otherwise, the rows are appended.
+        cursor: A psycopg2 cursor. If set, the write happens within that
+                cursor's transaction, and it is up to the caller to commit.
+                Otherwise, the write happens in its own transaction.
+    """
+    if cursor is None:
+        conn = db.engine.raw_connection()
+        try:
+            bulk_write(df, table_name, truncate=truncate, cursor=conn.cursor())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return
+
+    table_columns = get_table_columns(table_name, cursor=cursor)
+    if not table_columns:
+        raise ValueError(f'The table {table_name!r} has no columns.')
+    extra_columns = [c for c in df.columns if c not in table_columns]
+    if extra_columns:
+        raise ValueError(
+            f'The columns {extra_columns} are not in the table {table_name!r}.'
+        )
+    columns = [c for c in table_columns if c in df.columns]
+
+    # In the CSV format, an empty unquoted value is NULL.
+    buffer = io.StringIO()
+    df[columns].to_csv(buffer, index=False, header=False, na_rep='')
+    buffer.seek(0)
+
+    if truncate:
+        cursor.execute(f'TRUNCATE {table_name};')
+    cursor.copy_expert(
+        f'COPY {table_name} ({", ".join(columns)}) '
+        'FROM STDIN WITH (FORMAT csv);',
+        buffer
+    )
+
+
+def swap_in_tables(dfs: Dict[str, pd.DataFrame]) -> None:
+    """Replace the contents of one or more tables so that anything reading from
+    them sees either all of the old data or all of the new data, never a table
+    that is empty or half-written.
+
+    This happens in two steps. First, each DataFrame is written into a new
+    "staging" copy of its table (with the same columns and indexes), which
+    nothing reads from. Then, all the staging tables are renamed to replace the
+    real tables inside of one transaction. Renaming a table is nearly instant,
+    so the tables are only locked for a moment.
+
+    If a slow query is still reading from a table, we give up waiting for it
+    after `lock_timeout` and try the swap again, instead of making every other
+    query wait behind the swap.
+
+    Args:
+        dfs: Dict where each key is the name of a table and each value is the
+             DataFrame to replace the table's contents with. The table names are
+             put directly into the queries, so they should never come from
+             user input.
+    """
+    conn = db.engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+
+        # Step 1: Write the new data to the staging tables.
+        for table_name, df in dfs.items():
+            cursor.execute(f'''
+                DROP TABLE IF EXISTS {table_name}_staging;
+                CREATE TABLE {table_name}_staging
+                    (LIKE {table_name} INCLUDING ALL);
+            ''')
+            bulk_write(df, f'{table_name}_staging', truncate=False,
+                       cursor=cursor)
+        conn.commit()
+
+        # Step 2: Swap the staging tables in.
+        attempts = current_app.config['TABLE_SWAP_ATTEMPTS']
+        for attempt in range(attempts):
+            try:
+                cursor.execute("SET LOCAL lock_timeout = '2s';")
+                for table_name in dfs:
+                    cursor.execute(f'''
+                        ALTER TABLE {table_name} RENAME TO {table_name}_old;
+                        ALTER TABLE {table_name}_staging RENAME TO {table_name};
+                        DROP TABLE {table_name}_old;
+                    ''')
+                conn.commit()
+                break
+            except LockNotAvailable:
+                conn.rollback()
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(1)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def replace_rows_since(
+        dfs: Dict[str, pd.DataFrame],
+        since: pd.Timestamp,
+        keep_since: Optional[Dict[str, pd.Timestamp]] = None
+) -> None:
+    """Replace the rows of one or more tables from a point in time onwards,
+    inside of one transaction. Unlike `swap_in_tables`, this does not lock the
+    whole table, and anything reading from the tables keeps seeing the old rows
+    until the transaction is committed.
+
+    Args:
+        dfs: Dict where each key is the name of a table with a `time` column
+             and each value is the DataFrame of new rows. The table names are
+             put directly into the queries, so they should never come from
+             user input.
+        since: (pd.Timestamp) Rows at or after this time are deleted before the
+               new rows are written.
+        keep_since: Dict where each key is the name of a table in `dfs` and
+                    each value is the time of the oldest row to keep. Older
+                    rows are deleted in the same transaction, so the tables
+                    don't grow without bound.
+    """
+    keep_since = keep_since or {}
+    conn = db.engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        for table_name, df in dfs.items():
+            cursor.execute(f'DELETE FROM {table_name} WHERE time >= %s;',
+                           (since.to_pydatetime(),))
+            bulk_write(df, table_name, truncate=False, cursor=cursor)
+            if table_name in keep_since:
+                cursor.execute(f'DELETE FROM {table_name} WHERE time < %s;',
+                               (keep_since[table_name].to_pydatetime(),))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
 
 def create_db() -> bool:
@@ -125,53 +335,340 @@ def init_db():
         Base.metadata.create_all(db.engine)
 
 
+def migrate_db():
+    """This moves a database that was set up with an older version of
+    `schema.sql` onto the current schema. The HOBOlink data (which is only ever
+    appended to) and the manual overrides are kept; every other table is
+    recreated and then repopulated from scratch.
+    """
+    with current_app.app_context():
+        execute_sql_from_file('migrate_schema_backup.sql')
+        execute_sql_from_file('schema.sql')
+        execute_sql_from_file('define_boathouse.sql')
+        execute_sql_from_file('migrate_schema_restore.sql')
+
+        # The fingerprint was cleared by `schema.sql`, so this always runs
+        # through the whole pipeline.
+        update_database()
+
+        Base.metadata.create_all(db.engine)
+
+
+def iter_live_data() -> Iterator[
+    Tuple[str, Union[Tuple[Optional[str], pd.DataFrame], Exception]]
+]:
+    """Download and parse the USGS and HOBOlink data at the same time on a
+    thread pool, and yield each source's data as soon as it is ready. This way
+    the refresh takes as long as the slowest source instead of both sources
+    added together.
+
+    Each source has its own timeout (`USGS_FETCH_TIMEOUT` and
+    `HOBOLINK_FETCH_TIMEOUT`), so a slow source does not hold up the other one.
+    If a source fails or times out, the exception is yielded in place of the
+    data.
+
+    Only the HOBOlink rows newer than what is in the `hobolink` table are
+    downloaded; see `get_hobolink_export_name`.
+
+    Yields:
+        Tuples of the source name ("usgs" or "hobolink"), and either a tuple of
+        the raw response's hash and a Pandas DataFrame, or the exception that
+        was raised.
+    """
+    from .usgs import download_usgs_data
+    from .hobolink import download_hobolink_data
+    from .hobolink import get_hobolink_export_name
+
+    app = current_app._get_current_object()
+
+    def _run_in_app_context(func, *args, **kwargs):
+        with app.app_context():
+            return func(*args, **kwargs)
+
+    latest_hobolink_time = get_latest_time('hobolink')
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    start_time = time.monotonic()
+    deadlines = {
+        'usgs': start_time + app.config['USGS_FETCH_TIMEOUT'],
+        'hobolink': start_time + app.config['HOBOLINK_FETCH_TIMEOUT'],
+    }
+    # The requests are given the same deadlines, so that their retries and
+    # timeouts stop when the time is up.
+    futures = {
+        'usgs': executor.submit(
+            _run_in_app_context,
+            download_usgs_data,
+            deadline=deadlines['usgs']
+        ),
+        'hobolink': executor.submit(
+            _run_in_app_context,
+            download_hobolink_data,
+            export_name=get_hobolink_export_name(latest_hobolink_time),
+            since=latest_hobolink_time,
+            deadline=deadlines['hobolink']
+        ),
+    }
+    # Don't wait here on threads that time out. Note that Python still waits
+    # for them when the process exits, so `flask update-db` can take a little
+    # longer than the timeouts: a request that is sending data slowly can go
+    # past its deadline, and the response is parsed before the thread ends.
+    executor.shutdown(wait=False)
+
+    while futures:
+        done, _ = wait(
+            futures.values(),
+            timeout=max(0, min(deadlines[k] for k in futures) - time.monotonic()),
+            return_when=FIRST_COMPLETED
+        )
+        for source, future in list(futures.items()):
+            if future in done:
+                del futures[source]
+                try:
+                    res = future.result()
+                except Exception as e:
+                    res = e
+                yield source, res
+            elif deadlines[source] <= time.monotonic():
+                del futures[source]
+                future.cancel()
+                yield source, TimeoutError(
+                    f'Retrieving the {source} data took too long.'
+                )
+
+
 def update_database():
     """This function basically controls all of our data refreshes. The
-    following tables are updated in order:
+    following tables are updated:
 
     - usgs
-    - hobolink
+    - hobolink (only new rows are appended)
     - processed_data
-    - model_outputs
+    - model_outputs (for every version in `get_model_registry()`)
+
+    The processed data is also added to the feature store on disk (see
+    `update_feature_store`).
+
+    Each time the data changes, the data version is increased, so that the
+    website's caches know to stop using responses made from the old data (see
+    `cache.py`).
+
+    The USGS and HOBOlink data are retrieved at the same time, and each one is
+    written to the database as soon as it arrives. Tables that are replaced
+    are swapped in with `swap_in_tables`, so the website never reads from a
+    half-written table. The `processed_data` and
+    `model_outputs` tables are only updated if both sources were retrieved
+    successfully; otherwise, an error is raised after writing whichever source
+    did succeed.
+
+    If the raw responses from both sources are the same as the ones that were
+    last processed, nothing is written and this function returns False.
+
+    Once the `processed_data` table has data in it, only the hours with new
+    measurements are processed and written (see `PROCESS_DATA_INCREMENTALLY`
+    and `process_new_data`).
 
     The functions run to calculate the data are imported from other files
     within the data folder.
+
+    Returns:
+        True if the database was updated, False if there was no new data.
     """
-    options = {
-        'con': db.engine,
-        'index': False,
-        'if_exists': 'replace'
-    }
+    from .payload_cache import get_last_fingerprint
+    from .payload_cache import save_fingerprint
+    from ..cache import bump_data_version
+
+    last_fingerprint = get_last_fingerprint()
+    latest_usgs_time = get_latest_time('usgs')
+    new_data_times = []
+    fingerprint = {}
+    errors = {}
+    for source, res in iter_live_data():
+        if isinstance(res, Exception):
+            errors[source] = res
+            continue
+
+        fingerprint[source], df_source = res
+        unchanged = (
+            fingerprint[source] is not None
+            and fingerprint[source] == last_fingerprint.get(source)
+        )
+
+        # Populate the `usgs` table.
+        if source == 'usgs':
+            df_usgs = df_source
+            if not unchanged:
+                swap_in_tables({'usgs': df_usgs})
+                new_data_times.append(
+                    df_usgs['time'].min() if pd.isna(latest_usgs_time)
+                    else df_usgs.loc[df_usgs['time'] > latest_usgs_time,
+                                     'time'].min()
+                )
+
+        # Populate the `hobolink` table. HOBOlink is slow, so we only download
+        # the smallest export that covers the time since the latest row we
+        # have, and then append the new rows. The default export is only used
+        # when the table is empty.
+        elif source == 'hobolink':
+            bulk_write(df_source.drop_duplicates('time'), 'hobolink',
+                       truncate=False)
+            new_data_times.append(df_source['time'].min())
+
+    if errors:
+        raise RuntimeError(
+            'Unable to retrieve the following data: '
+            + '; '.join(f'{k} ({v!r})' for k, v in errors.items())
+        )
+
+    # If neither source has changed since the last time the data was processed,
+    # then the processed data and model outputs would not change either.
+    if fingerprint == last_fingerprint:
+        return False
 
-    # Populate the `usgs` table.
-    from .usgs import get_live_usgs_data
-    df_usgs = get_live_usgs_data()
-    df_usgs.to_sql('usgs', **options)
+    from .predictive_models import all_model_versions
+
+    # Every hour after the last processed hour needs to be processed, plus any
+    # earlier hours that got new measurements (e.g. the last processed hour
+    # might have only had some of its measurements).
+    latest_processed_time = get_latest_time('processed_data')
+    restart_time = latest_processed_time + pd.Timedelta(hours=1)
+    for new_data_time in new_data_times:
+        if not pd.isna(new_data_time):
+            restart_time = min(restart_time, new_data_time.floor('h'))
+
+    # Process only the new hours when we can. The USGS data only goes back a
+    # few days, so if it doesn't cover every hour that needs to be processed
+    # (e.g. the website has not been updated in a while), everything is
+    # processed again.
+    if (
+            current_app.config['PROCESS_DATA_INCREMENTALLY']
+            and not pd.isna(latest_processed_time)
+            and df_usgs['time'].min() <= restart_time
+    ):
+        from .predictive_models import ROLLING_WINDOW_HOURS
+        from .predictive_models import process_new_data
+        previous = execute_sql('''
+            SELECT * FROM processed_data
+            WHERE time < :restart_time
+            ORDER BY time DESC
+            LIMIT :limit;
+        ''', params={
+            'restart_time': restart_time,
+            'limit': ROLLING_WINDOW_HOURS
+        }).iloc[::-1]
+        df_hobolink = execute_sql(
+            'SELECT * FROM hobolink WHERE time >= :restart_time ORDER BY time;',
+            params={'restart_time': restart_time}
+        )
+        # The time since the last significant rain falls back to the start of
+        # the last 21 days of HOBOlink data, the same as when everything is
+        # processed again (see `latest_hobolink_data`).
+        window_start = execute_sql('''
+            SELECT date_trunc('hour', MIN(time)) AS window_start
+            FROM hobolink
+            WHERE time > (SELECT MAX(time) - interval '21 days' FROM hobolink);
+        ''')['window_start'].iloc[0]
+        df = process_new_data(
+            df_hobolink=df_hobolink,
+            df_usgs=df_usgs.loc[df_usgs['time'] >= restart_time],
+            previous=previous,
+            window_start=window_start
+        )
+
+        # HOBOlink sets which hours are processed, so if it has no new hours
+        # (e.g. it stalled while the USGS data changed), there is nothing to
+        # write.
+        if len(df):
+            model_outs = all_model_versions(df, rows=len(df))
+
+            # Populate both tables at once, so the website never shows model
+            # outputs that don't match the processed data. The same rows are
+            # kept as when everything is processed again: the last 21 days of
+            # processed data, and the last 48 hours of model outputs (see
+            # `all_model_versions`).
+            replace_rows_since({
+                'processed_data': df,
+                'model_outputs': model_outs
+            }, since=restart_time, keep_since={
+                'processed_data': window_start,
+                'model_outputs': df['time'].max() - pd.Timedelta(hours=47)
+            })
+            update_feature_store(df, since=restart_time)
+
+        save_fingerprint(fingerprint)
+        bump_data_version()
+        update_snapshots()
+
+        return True
+
+    # Calculate the `processed_data` table.
+    if current_app.config['PROCESS_DATA_IN_DATABASE']:
+        from .predictive_models import process_data_in_database
+        df = process_data_in_database()
+    else:
+        from .hobolink import latest_hobolink_data
+        from .predictive_models import process_data
+        df_hobolink = latest_hobolink_data()
+        df = process_data(df_hobolink=df_hobolink, df_usgs=df_usgs)
+
+    # Calculate the `model_outputs` table.
+    model_outs = all_model_versions(df)
+
+    # Populate both tables at once, so the website never shows model outputs
+    # that don't match the processed data.
+    swap_in_tables({
+        'processed_data': df,
+        'model_outputs': model_outs
+    })
+    update_feature_store(df, since=df['time'].min())
+
+    save_fingerprint(fingerprint)
+    bump_data_version()
+    update_snapshots()
 
-    # Populate the `hobolink` table.
-    from .hobolink import get_live_hobolink_data
-    df_hobolink = get_live_hobolink_data()
-    df_hobolink.to_sql('hobolink', **options)
+    return True
 
-    # Populate the `processed_data` table.
-    from .predictive_models import process_data
-    df = process_data(df_hobolink=df_hobolink, df_usgs=df_usgs)
-    df.to_sql('processed_data', **options)
 
-    # Populate the `model_outputs` table.
-    from .predictive_models import all_models
-    model_outs = all_models(df)
-    model_outs.to_sql('model_outputs', **options)
+def update_snapshots() -> None:
+    """Publish the snapshots of the flags pages and the API (see
+    `snapshots.py`) for the new data. The website can render them again
+    itself, so if they can't be published, a warning is logged and the update
+    carries on.
+    """
+    from ..snapshots import published_snapshots
+    try:
+        published_snapshots.publish()
+    except Exception as e:
+        current_app.logger.warning(f'Unable to publish snapshots: {e!r}')
 
-    return True
+
+def update_feature_store(df: pd.DataFrame, since: pd.Timestamp) -> None:
+    """Add newly processed data to the feature store (see `feature_store.py`),
+    if `FEATURE_STORE_DIR` is set. The feature store is only a copy of the
+    `processed_data` table, so if it can't be written to, a warning is logged
+    and the update carries on; the missing hours are added the next time.
+
+    Args:
+        df: (pd.DataFrame) The processed data that was written to the
+            `processed_data` table.
+        since: (pd.Timestamp) The time that the rows in the `processed_data`
+               table were replaced from.
+    """
+    if not current_app.config['FEATURE_STORE_DIR']:
+        return
+    from .feature_store import append_features
+    try:
+        append_features(df, since=since)
+    except Exception as e:
+        current_app.logger.warning(f'Unable to update the feature store: {e!r}')
 
 
 @dataclass
 class Boathouses(db.Model):
     reach: int = db.Column(db.Integer, unique=False)
     boathouse: str = db.Column(db.String(255), primary_key=True)
-    latitude: float = db.Column(db.Numeric, unique=False)
-    longitude: float = db.Column(db.Numeric, unique=False)
+    latitude: float = db.Column(db.Float, unique=False)
+    longitude: float = db.Column(db.Float, unique=False)
 
 
 def get_boathouse_metadata_dict():
@@ -182,8 +679,16 @@ def get_boathouse_metadata_dict():
     return {'boathouses': boathouse_query}
 
 
-def get_latest_time():
+def get_latest_time(table_name: str = 'processed_data') -> pd.Timestamp:
     """
-    Returns the latest time in the processed data
+    Returns the latest time in a table; by default, the processed data. If the
+    table is empty, this returns NaT.
+
+    Args:
+        table_name: (str) Name of a table with a `time` column. This is put
+                    directly into the query, so it should never come from user
+                    input.
     """
-    return execute_sql('SELECT MAX(time) FROM processed_data;').iloc[0]['max']
+    return pd.to_datetime(
+        execute_sql(f'SELECT MAX(time) FROM {table_name};').iloc[0]['max']
+    )
@@ -0,0 +1,235 @@
+"""
+This file keeps a copy of the processed data on disk, so that anything that
+needs more than the last few days of features (e.g. retraining the models) can
+read them without going through the database or the live APIs.
+
+The features are stored in `FEATURE_STORE_DIR` in one file per month, named
+e.g. `2020-08.arrow`. The files are uncompressed Arrow IPC files (the same
+format as Feather v2, so `pd.read_feather` can read them too), which means
+they can be memory-mapped and read without copying or decoding them: reading
+a season of features only maps the files and slices the rows and columns that
+were asked for.
+
+`update_database` adds the newly processed hours to the store each time it
+runs. Files are replaced, never edited, so readers that have a file mapped
+keep seeing the old version of it until they read it again.
+"""
+import os
+import re
+from typing import List
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from flask import current_app
+
+FILE_NAME_PATTERN = re.compile(r'^(\d{4}-\d{2})\.arrow$')
+
+TIME_COLUMNS = ['time', 'last_sig_rain']
+
+
+def _store_dir(store_dir: Optional[str] = None) -> str:
+    return store_dir or current_app.config['FEATURE_STORE_DIR']
+
+
+def _month_files(store_dir: str) -> List[str]:
+    """Return the months in the store (e.g. "2020-08"), in order."""
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(
+        m.group(1) for m in map(FILE_NAME_PATTERN.match, os.listdir(store_dir))
+        if m
+    )
+
+
+def _fpath(store_dir: str, month: str) -> str:
+    return os.path.join(store_dir, f'{month}.arrow')
+
+
+def _read_month(store_dir: str, month: str) -> pa.Table:
+    """Memory-map one month of features. None of the data is read until it is
+    used.
+    """
+    with pa.memory_map(_fpath(store_dir, month), 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def _write_month(store_dir: str, month: str, df: pd.DataFrame) -> None:
+    """Write one month of features, replacing the file atomically."""
+    # The same types are used for every month, e.g. float64 even for features
+    # made with `low_memory=True`, so the months can be read together. Columns
+    # that are all NULL in the `processed_data` table come back as objects, so
+    # they are given the type that the column has when it has values.
+    df = df.astype({
+        c: 'datetime64[ns]' if c in TIME_COLUMNS else np.float64
+        for c, dtype in df.dtypes.items()
+        if dtype == object and df[c].isna().all()
+    })
+    df = df.astype({
+        c: np.float64 if pd.api.types.is_float_dtype(dtype) else np.int64
+        for c, dtype in df.dtypes.items()
+        if pd.api.types.is_numeric_dtype(dtype)
+        and not pd.api.types.is_bool_dtype(dtype)
+    })
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fpath = _fpath(store_dir, month)
+    tmp_fpath = f'{fpath}.{os.getpid()}.tmp'
+    with pa.OSFile(tmp_fpath, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_fpath, fpath)
+
+
+def write_features(
+        df: pd.DataFrame,
+        since: Optional[pd.Timestamp] = None,
+        store_dir: Optional[str] = None
+) -> None:
+    """Replace the features from `since` onwards with `df`, the same way that
+    `replace_rows_since` does for the `processed_data` table.
+
+    Args:
+        df: (pd.DataFrame) Processed data from `process_data()`, sorted by
+            time.
+        since: (pd.Timestamp) Features at or after this time are removed from
+               the store before `df` is added. Defaults to the first time in
+               `df`.
+        store_dir: (str) Directory of the store. Defaults to
+                   `FEATURE_STORE_DIR`.
+    """
+    store_dir = _store_dir(store_dir)
+    if since is None:
+        if not len(df):
+            return
+        since = df['time'].min()
+    os.makedirs(store_dir, exist_ok=True)
+
+    df_months = df['time'].dt.strftime('%Y-%m')
+    since_month = since.strftime('%Y-%m')
+    months = sorted(
+        set(m for m in _month_files(store_dir) if m >= since_month)
+        | set(df_months)
+    )
+    for month in months:
+        new_rows = df.loc[df_months == month]
+        if os.path.exists(_fpath(store_dir, month)):
+            old_rows = _read_month(store_dir, month).to_pandas()
+            old_rows = old_rows.loc[old_rows['time'] < since]
+            if len(old_rows):
+                new_rows = pd.concat([old_rows, new_rows], ignore_index=True)
+        if len(new_rows):
+            _write_month(store_dir, month, new_rows)
+        else:
+            os.remove(_fpath(store_dir, month))
+
+
+def read_feature_table(
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+        columns: Optional[List[str]] = None,
+        store_dir: Optional[str] = None
+) -> pa.Table:
+    """Read features from the store as an Arrow table. The table points at the
+    memory-mapped files, so this does not copy the data.
+
+    Args:
+        start: (pd.Timestamp) Only read features at or after this time.
+        end: (pd.Timestamp) Only read features before this time.
+        columns: (list) Only read these columns. The `time` column is always
+                 included.
+        store_dir: (str) Directory of the store. Defaults to
+                   `FEATURE_STORE_DIR`.
+
+    Returns:
+        Arrow table of the features, sorted by time. It is empty if the store
+        has no features in the time range.
+    """
+    store_dir = _store_dir(store_dir)
+    start = None if start is None else pd.Timestamp(start)
+    end = None if end is None else pd.Timestamp(end)
+    if columns is not None:
+        columns = ['time'] + [c for c in columns if c != 'time']
+
+    tables = []
+    for month in _month_files(store_dir):
+        # Skip the months that are outside of the time range without opening
+        # them.
+        month_start = pd.Timestamp(f'{month}-01')
+        if start is not None and month_start + pd.offsets.MonthBegin() <= start:
+            continue
+        if end is not None and month_start >= end:
+            continue
+
+        table = _read_month(store_dir, month)
+        if columns is not None:
+            table = table.select(columns)
+
+        # The rows are sorted by time, so the time range is a slice of the
+        # rows, which doesn't copy any data.
+        times = table.column('time').to_numpy()
+        lo = 0 if start is None else np.searchsorted(times, start.to_datetime64())
+        hi = len(times) if end is None \
+            else np.searchsorted(times, end.to_datetime64())
+        tables.append(table.slice(lo, hi - lo))
+
+    if not tables:
+        return pa.table({'time': pa.array([], type=pa.timestamp('ns'))})
+    return pa.concat_tables(tables)
+
+
+def read_features(
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+        columns: Optional[List[str]] = None,
+        store_dir: Optional[str] = None
+) -> pd.DataFrame:
+    """Read features from the store as a Pandas DataFrame. See
+    `read_feature_table()` for the arguments.
+
+    Columns without missing values are not copied out of the memory-mapped
+    files, so the DataFrame is read-only.
+
+    Returns:
+        Pandas DataFrame of the features, sorted by time.
+    """
+    table = read_feature_table(start=start, end=end, columns=columns,
+                               store_dir=store_dir)
+    return table.to_pandas(split_blocks=True)
+
+
+def get_latest_feature_time(store_dir: Optional[str] = None) -> pd.Timestamp:
+    """Return the time of the latest features in the store, or NaT if the store
+    is empty.
+    """
+    store_dir = _store_dir(store_dir)
+    months = _month_files(store_dir)
+    if not months:
+        return pd.NaT
+    times = _read_month(store_dir, months[-1]).column('time')
+    return pd.Timestamp(times[len(times) - 1].as_py())
+
+
+def append_features(df: pd.DataFrame, since: pd.Timestamp) -> None:
+    """Add newly processed data to the store. This is run by `update_database`
+    after the `processed_data` table is updated.
+
+    If the store is missing some hours before `since` (e.g. a previous update
+    could not write to the store), those hours are read from the
+    `processed_data` table too.
+
+    Args:
+        df: (pd.DataFrame) The processed data that was written to the
+            `processed_data` table.
+        since: (pd.Timestamp) The time that the rows in the `processed_data`
+               table were replaced from.
+    """
+    latest_time = get_latest_feature_time()
+    if not pd.isna(latest_time) and latest_time + pd.Timedelta(hours=1) < since:
+        from .database import execute_sql
+        since = latest_time + pd.Timedelta(hours=1)
+        df = execute_sql(
+            'SELECT * FROM processed_data WHERE time >= :since ORDER BY time;',
+            params={'since': since}
+        )
+    write_features(df, since=since)
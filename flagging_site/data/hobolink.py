@@ -5,14 +5,34 @@ formatting of the data that we receive from it.
 import os
 import io
 import requests
+import numpy as np
 import pandas as pd
+from typing import Optional
+from typing import Tuple
 from flask import abort
 from flask import current_app
+from werkzeug.exceptions import HTTPException
+
+from .http_client import http_client
+from .payload_cache import cache_payload
 
 # Constants
 
 HOBOLINK_URL = 'http://webservice.hobolink.com/restv2/data/custom/file'
 DEFAULT_HOBOLINK_EXPORT_NAME = 'code_for_boston_export_21d'
+# HOBOlink reports times in GMT-04:00 without a timezone. (The sign of the
+# 'Etc/GMT+4' timezone is inverted, as it is for all POSIX-style names.)
+HOBOLINK_TIMEZONE = 'Etc/GMT+4'
+# Each key is the name of an export on the HOBOlink dashboard; the value is the
+# number of days of data that the export covers. This is used to download the
+# smallest export that covers all the data missing from the database. The
+# exports need to be set up on the HOBOlink dashboard; if one of them is
+# missing, `download_hobolink_data` falls back to the default export.
+HOBOLINK_EXPORT_DAYS = {
+    'code_for_boston_export_1d': 1,
+    'code_for_boston_export_21d': 21,
+    'code_for_boston_export_90d': 90,
+}
 # Each key is the original column name; the value is the renamed column.
 HOBOLINK_COLUMNS = {
     'Time, GMT-04:00': 'time',
@@ -33,7 +53,8 @@ HOBOLINK_STATIC_FILE_NAME = 'hobolink.pickle'
 
 
 def get_live_hobolink_data(
-        export_name: str = DEFAULT_HOBOLINK_EXPORT_NAME
+        export_name: str = DEFAULT_HOBOLINK_EXPORT_NAME,
+        since: Optional[pd.Timestamp] = None
 ) -> pd.DataFrame:
     """This function runs through the whole process for retrieving data from
     HOBOlink: first we perform the request, and then we clean the data.
@@ -41,23 +62,121 @@ def get_live_hobolink_data(
     Args:
         export_name: (str) Name of the "export." On the Hobolink web dashboard,
                      go to Data > Exports and choose a name off the list.
+        since: (pd.Timestamp) If set, only rows with a time after this
+               timestamp are returned.
+
+    Returns:
+        Pandas Dataframe containing the cleaned-up Hobolink data.
+    """
+    return download_hobolink_data(export_name=export_name, since=since)[1]
+
+
+def download_hobolink_data(
+        export_name: str = DEFAULT_HOBOLINK_EXPORT_NAME,
+        since: Optional[pd.Timestamp] = None,
+        deadline: Optional[float] = None
+) -> Tuple[Optional[str], pd.DataFrame]:
+    """Retrieve and clean the HOBOlink data like `get_live_hobolink_data`, and
+    also save the raw response to the payload cache. If a non-default export
+    can't be downloaded (e.g. it doesn't exist), the default export is used.
+
+    Args:
+        export_name: (str) Name of the "export." On the Hobolink web dashboard,
+                     go to Data > Exports and choose a name off the list.
+        since: (pd.Timestamp) If set, only rows with a time after this
+               timestamp are returned.
+        deadline: (float) Time, from `time.monotonic()`, by which the
+                  request should be done. See `HttpClient.request`.
 
     Returns:
+        The hash of the raw response (None when using the mock data), and a
         Pandas Dataframe containing the cleaned-up Hobolink data.
     """
     if current_app.config['USE_MOCK_DATA']:
         fpath = os.path.join(
             current_app.config['DATA_STORE'], HOBOLINK_STATIC_FILE_NAME
         )
+        payload_hash = None
         df = pd.read_pickle(fpath)
     else:
-        res = request_to_hobolink(export_name=export_name)
+        try:
+            res = request_to_hobolink(export_name=export_name,
+                                      deadline=deadline)
+        except HTTPException as e:
+            # The smaller exports may not exist on the dashboard, so try the
+            # default export before giving up.
+            if export_name == DEFAULT_HOBOLINK_EXPORT_NAME:
+                raise
+            current_app.logger.warning(
+                f'Unable to download the HOBOlink export {export_name!r}, '
+                f'using {DEFAULT_HOBOLINK_EXPORT_NAME!r} instead: {e!r}'
+            )
+            res = request_to_hobolink(
+                export_name=DEFAULT_HOBOLINK_EXPORT_NAME,
+                deadline=deadline
+            )
+        payload_hash = cache_payload('hobolink', res.text)
         df = parse_hobolink_data(res.text)
-    return df
+
+    if since is not None and not pd.isna(since):
+        df = df.loc[df['time'] > since]
+
+    return payload_hash, df
+
+
+def get_hobolink_export_name(
+        latest_time: Optional[pd.Timestamp] = None
+) -> str:
+    """Choose the smallest HOBOlink export that covers all the data after
+    `latest_time`. When there is no `latest_time` (i.e. the database is empty),
+    the default export is used.
+
+    Args:
+        latest_time: (pd.Timestamp) Time of the latest HOBOlink data that we
+                     already have.
+
+    Returns:
+        Name of the HOBOlink export.
+    """
+    if latest_time is None or pd.isna(latest_time):
+        return DEFAULT_HOBOLINK_EXPORT_NAME
+
+    # Compare against the current time in the timezone of the HOBOlink data,
+    # not the server's local time.
+    now = pd.Timestamp.now(tz=HOBOLINK_TIMEZONE).tz_localize(None)
+    days_missing = (now - latest_time) / pd.Timedelta(days=1)
+    for export_name, days in sorted(
+            HOBOLINK_EXPORT_DAYS.items(),
+            key=lambda x: x[1]
+    ):
+        if days_missing < days:
+            return export_name
+
+    # If the gap is bigger than all of the exports, fill in what we can.
+    return max(HOBOLINK_EXPORT_DAYS, key=HOBOLINK_EXPORT_DAYS.get)
+
+
+def latest_hobolink_data() -> pd.DataFrame:
+    """Return the last 21 days of HOBOlink data stored in the database. The
+    database is filled incrementally, so this is what gets passed into the
+    model instead of the (partial) data we just downloaded.
+
+    Returns:
+        Pandas Dataframe containing the Hobolink data.
+    """
+    from .database import execute_sql_from_file
+    df = execute_sql_from_file('return_21_days_of_hobolink_data.sql')
+
+    # A column that is NULL in every row is read in as objects, so we convert
+    # the measurements to floats.
+    return df.astype({
+        col: float for col in HOBOLINK_COLUMNS.values() if col != 'time'
+    })
 
 
 def request_to_hobolink(
         export_name: str = DEFAULT_HOBOLINK_EXPORT_NAME,
+        deadline: Optional[float] = None
 ) -> requests.models.Response:
     """
     Get a request from the Hobolink server.
@@ -65,6 +184,8 @@ def request_to_hobolink(
     Args:
         export_name: (str) Name of the "export." On the Hobolink web dashboard,
                      go to Data > Exports and choose a name off the list.
+        deadline: (float) Time, from `time.monotonic()`, by which the
+                  request should be done. See `HttpClient.request`.
 
     Returns:
         Request Response containing the data from the request.
@@ -74,7 +195,8 @@ def request_to_hobolink(
         'authentication': current_app.config['HOBOLINK_AUTH']
     }
 
-    res = requests.post(HOBOLINK_URL, json=data)
+    res = http_client.post(HOBOLINK_URL, name='hobolink', json=data,
+                           deadline=deadline)
     # handle HOBOLINK errors by checking HTTP status code
     # status codes in 400's are client errors, in 500's are server errors
     if res.status_code // 100 in [4, 5]:
@@ -118,14 +240,9 @@ def parse_hobolink_data(res: str) -> pd.DataFrame:
             filter(lambda x: x.startswith(old_col_startswith), df.columns)
         ]
 
-        # Remove rows with missing data (i.e. the 05, 15, 25, 35, 45, and 55 min
-        # timestamps, which only include the battery status.)
-        subset_df = subset_df.loc[~subset_df.isna().all(axis=1)]
-
-        # Take the first nonmissing column value within the subset of rows we've
-        # selected. This trick is similar to doing a COALESCE in sql.
-        df[new_col] = subset_df \
-            .apply(lambda x: x[x.first_valid_index()], axis=1)
+        # Take the first nonmissing column value within each row. This trick is
+        # similar to doing a COALESCE in sql.
+        df[new_col] = coalesce_columns(subset_df)
 
     # Only keep these columns
     df = df[HOBOLINK_COLUMNS.values()]
@@ -137,3 +254,33 @@ def parse_hobolink_data(res: str) -> pd.DataFrame:
     df['time'] = pd.to_datetime(df['time'], format='%m/%d/%y %H:%M:%S')
 
     return df
+
+
+def coalesce_columns(df: pd.DataFrame) -> pd.Series:
+    """Take the first nonmissing value across the columns of a DataFrame for
+    each row, similar to doing a COALESCE in sql. Rows where every column is
+    missing (i.e. the 05, 15, 25, 35, 45, and 55 min timestamps, which only
+    include the battery status) are removed from the output.
+
+    This is done with array operations over the whole DataFrame at once instead
+    of looking up the first valid index row by row.
+
+    Args:
+        df: (pd.DataFrame) Columns that should be merged into one column.
+
+    Returns:
+        Pandas Series of the coalesced values.
+    """
+    values = df.to_numpy()
+    is_valid = df.notna().to_numpy()
+
+    # `argmax` returns the position of the first True in each row.
+    first_valid = is_valid.argmax(axis=1)
+    coalesced = pd.Series(
+        values[np.arange(len(values)), first_valid],
+        index=df.index
+    )
+
+    # Mixed dtypes are coerced to `object` by `to_numpy()`, so we infer the
+    # real dtype again after removing the rows with all missing values.
+    return coalesced.loc[is_valid.any(axis=1)].infer_objects()
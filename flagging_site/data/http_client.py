@@ -0,0 +1,216 @@
+"""
+This file handles the HTTP connections to the APIs that we get our data from
+(HOBOlink and the USGS). All requests go through the `http_client` object
+defined near the top of the file, which:
+
+- keeps a pool of keep-alive connections open, so each request does not need
+  to set up a new TCP and TLS connection;
+- applies connect and read timeouts to every request, so a stalled API cannot
+  hang the process that is waiting on it. A request can also be given a
+  deadline that bounds all of its attempts and the waits between them;
+- retries requests that fail with a 5xx status code or a connection error,
+  waiting a little longer (with some randomness) between each attempt;
+- counts the calls, retries, failures, and latency of requests for each API.
+
+The `http_client` object is configured with the app's config in the
+`create_app` function via `init_http_client(app)`.
+"""
+import time
+import random
+import threading
+from dataclasses import asdict
+from dataclasses import dataclass
+from typing import Dict
+from typing import Optional
+
+import requests
+from flask import Flask
+from requests.adapters import HTTPAdapter
+
+
+@dataclass
+class RequestStats:
+    """Counters for the requests sent to one API."""
+    calls: int = 0
+    retries: int = 0
+    failures: int = 0
+    total_latency: float = 0
+    last_latency: Optional[float] = None
+
+    @property
+    def mean_latency(self) -> Optional[float]:
+        if self.calls == 0:
+            return None
+        return self.total_latency / self.calls
+
+
+class HttpClient:
+    """A `requests.Session` with a connection pool, timeouts, and retries."""
+
+    def __init__(
+            self,
+            connect_timeout: float = 5,
+            read_timeout: float = 60,
+            max_retries: int = 3,
+            backoff_factor: float = 0.5,
+            backoff_max: float = 30,
+            pool_maxsize: int = 4
+    ):
+        """
+        Args:
+            connect_timeout: (float) Seconds to wait to connect to the server.
+            read_timeout: (float) Seconds to wait between bytes received from
+                          the server.
+            max_retries: (int) Number of times a failed request is retried.
+            backoff_factor: (float) The wait before the nth retry is a random
+                            number of seconds between 0 and
+                            `backoff_factor * 2 ** n`.
+            backoff_max: (float) Most number of seconds to wait between retries.
+            pool_maxsize: (int) Number of connections to keep open per host.
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+
+        # Retries are handled by `request()`, not by urllib3.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._stats: Dict[str, RequestStats] = {}
+        self._lock = threading.Lock()
+
+    def request(
+            self,
+            method: str,
+            url: str,
+            name: Optional[str] = None,
+            deadline: Optional[float] = None,
+            **kwargs
+    ) -> requests.models.Response:
+        """Send a request, retrying it if it fails with a 5xx status code or a
+        connection error. Other keyword arguments are passed to
+        `requests.Session.request`.
+
+        Args:
+            method: (str) HTTP method, e.g. "GET".
+            url: (str) URL to send the request to.
+            name: (str) Name that the request's stats are grouped under.
+                  Defaults to the URL.
+            deadline: (float) Time, from `time.monotonic()`, by which the
+                      request should be done. Each attempt's timeouts are cut
+                      down to the time that is left, and there are no more
+                      retries once the time is up.
+
+        Returns:
+            The response. If every attempt failed with a 5xx status code, the
+            last response is returned. If every attempt failed with a
+            connection error, the last error is raised.
+        """
+        name = name or url
+        timeout = kwargs.pop('timeout',
+                             (self.connect_timeout, self.read_timeout))
+        if not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+
+        for attempt in range(self.max_retries + 1):
+            if deadline is not None:
+                time_left = deadline - time.monotonic()
+                if time_left <= 0:
+                    raise requests.Timeout(
+                        f'The request to {name} ran out of time.'
+                    )
+                kwargs['timeout'] = tuple(min(t, time_left) for t in timeout)
+            else:
+                kwargs['timeout'] = timeout
+
+            start_time = time.perf_counter()
+            try:
+                res = self.session.request(method, url, **kwargs)
+                error = None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                res = None
+                error = e
+            latency = time.perf_counter() - start_time
+
+            failed = error is not None or res.status_code >= 500
+            wait = self.backoff_time(attempt)
+            is_last_attempt = (
+                attempt == self.max_retries
+                or deadline is not None
+                and time.monotonic() + wait >= deadline
+            )
+            self._record(
+                name,
+                latency=latency,
+                retry=failed and not is_last_attempt,
+                failure=failed and is_last_attempt
+            )
+
+            if not failed:
+                return res
+            elif is_last_attempt:
+                if error is not None:
+                    raise error
+                return res
+
+            time.sleep(wait)
+
+    def get(self, url: str, **kwargs) -> requests.models.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.models.Response:
+        return self.request('POST', url, **kwargs)
+
+    def backoff_time(self, attempt: int) -> float:
+        """Seconds to wait before retrying. This uses "full jitter," i.e. a
+        random wait between 0 and the exponential backoff, so that retries
+        from several processes do not all hit the server at the same time.
+        """
+        return random.uniform(
+            0,
+            min(self.backoff_max, self.backoff_factor * 2 ** attempt)
+        )
+
+    def _record(
+            self,
+            name: str,
+            latency: float,
+            retry: bool,
+            failure: bool
+    ) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(name, RequestStats())
+            stats.calls += 1
+            stats.retries += retry
+            stats.failures += failure
+            stats.total_latency += latency
+            stats.last_latency = latency
+
+    def get_stats(self) -> Dict[str, dict]:
+        """Return the request counters for each API, keyed by name."""
+        with self._lock:
+            return {
+                name: {**asdict(stats), 'mean_latency': stats.mean_latency}
+                for name, stats in self._stats.items()
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+http_client = HttpClient()
+
+
+def init_http_client(app: Flask):
+    """Uses the app instance's config to set the timeouts and retries of the
+    `http_client`.
+    """
+    http_client.connect_timeout = app.config['HTTP_CONNECT_TIMEOUT']
+    http_client.read_timeout = app.config['HTTP_READ_TIMEOUT']
+    http_client.max_retries = app.config['HTTP_MAX_RETRIES']
+    http_client.backoff_factor = app.config['HTTP_BACKOFF_FACTOR']
@@ -6,8 +6,11 @@ from sqlalchemy import TIMESTAMP
 from sqlalchemy import VARCHAR
 
 from ..admin import AdminModelView
+from ..cache import bump_data_version
+from .boathouse_flags import current_flags
 from .database import Base
 from .database import execute_sql_from_file
+from .database import update_snapshots
 
 
 class ManualOverrides(Base):
@@ -43,6 +46,16 @@ class ManualOverridesModelView(AdminModelView):
     def __init__(self, session):
         super().__init__(ManualOverrides, session)
 
+    def after_model_change(self, form, model, is_created):
+        # Let the website's caches know that the flags changed, and show the
+        # new flags in this process straight away.
+        current_flags.rebuild(bump_data_version())
+        update_snapshots()
+
+    def after_model_delete(self, model):
+        current_flags.rebuild(bump_data_version())
+        update_snapshots()
+
 
 def get_currently_overridden_boathouses() -> Set[int]:
     return set(
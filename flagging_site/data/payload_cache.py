@@ -0,0 +1,113 @@
+"""
+This file keeps track of the raw responses that we get from the HOBOlink and
+USGS APIs, so that `update_database` can skip the rest of the pipeline when
+neither API has any new data.
+
+- The raw responses are saved on disk in `RAW_DATA_CACHE_DIR`, and the file
+  names are the SHA-256 hashes of the responses' contents. Only the latest
+  `RAW_DATA_CACHE_SIZE` responses for each source are kept.
+- The hashes of the responses that were last processed (the "fingerprint") are
+  stored in the `payload_fingerprints` table. This is stored in the database
+  instead of on disk because the scheduled job that updates the website does
+  not always run on the same machine.
+"""
+import os
+import hashlib
+from typing import Dict
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy.exc import ProgrammingError
+
+
+def hash_payload(text: str) -> str:
+    """Return the SHA-256 hash of a raw response."""
+    return hashlib.sha256(text.encode('utf8')).hexdigest()
+
+
+def _cache_dir(source: str) -> str:
+    return os.path.join(current_app.config['RAW_DATA_CACHE_DIR'], source)
+
+
+def cache_payload(source: str, text: str) -> str:
+    """Save a raw response to the cache, and remove the oldest responses if
+    there are more than `RAW_DATA_CACHE_SIZE` for the source.
+
+    Args:
+        source: (str) Name of the API, e.g. "hobolink" or "usgs".
+        text: (str) Raw text of the response.
+
+    Returns:
+        The hash of the response.
+    """
+    payload_hash = hash_payload(text)
+    cache_dir = _cache_dir(source)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    fpath = os.path.join(cache_dir, f'{payload_hash}.txt')
+    if os.path.exists(fpath):
+        # Mark it as the most recent response.
+        os.utime(fpath)
+    else:
+        # Write to a temporary file first so a half-written file is never
+        # read from the cache.
+        tmp_fpath = f'{fpath}.{os.getpid()}.tmp'
+        with open(tmp_fpath, 'w', encoding='utf8') as f:
+            f.write(text)
+        os.replace(tmp_fpath, fpath)
+
+    cached_files = sorted(
+        (os.path.join(cache_dir, i) for i in os.listdir(cache_dir)
+         if i.endswith('.txt')),
+        key=os.path.getmtime
+    )
+    for old_fpath in cached_files[:-current_app.config['RAW_DATA_CACHE_SIZE']]:
+        os.remove(old_fpath)
+
+    return payload_hash
+
+
+def get_last_fingerprint() -> Dict[str, str]:
+    """Return the hashes of the raw responses that were last processed, keyed
+    by the source. If there is no fingerprint, an empty dict is returned.
+    """
+    from .database import execute_sql
+    try:
+        df = execute_sql('SELECT source, payload_hash FROM payload_fingerprints;')
+    except ProgrammingError:
+        # The table has not been created yet.
+        return {}
+    return dict(zip(df['source'], df['payload_hash']))
+
+
+def save_fingerprint(fingerprint: Dict[str, Optional[str]]) -> None:
+    """Store the hashes of the raw responses that were just processed.
+
+    Args:
+        fingerprint: Dict where the key is the source and the value is the hash
+                     of the response.
+    """
+    from .database import execute_sql
+    fingerprint = {
+        source: payload_hash for source, payload_hash in fingerprint.items()
+        if payload_hash is not None
+    }
+    query = '''
+        CREATE TABLE IF NOT EXISTS payload_fingerprints (
+            source          varchar(255) PRIMARY KEY,
+            payload_hash    varchar(64)
+        );
+        DELETE FROM payload_fingerprints;
+    '''
+    params = {}
+    if fingerprint:
+        values = []
+        for i, (source, payload_hash) in enumerate(fingerprint.items()):
+            values.append(f'(:source_{i}, :payload_hash_{i})')
+            params[f'source_{i}'] = source
+            params[f'payload_hash_{i}'] = payload_hash
+        query += f'''
+        INSERT INTO payload_fingerprints (source, payload_hash)
+        VALUES {', '.join(values)};
+        '''
+    execute_sql(query + 'COMMIT;', params=params)
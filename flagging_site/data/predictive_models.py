@@ -33,8 +33,17 @@ https://www.metrics24.de/WebRoot/Store5/Shops/62187045/5D79/1FE4/31E4/0996/0440/
 - Regulatory standards in MA:
 https://www.mass.gov/files/documents/2016/08/tz/36wqara.pdf
 """
+import json
+import os
 import numpy as np
 import pandas as pd
+from functools import lru_cache
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from flask import current_app
+from flask import has_app_context
 
 MODEL_VERSION = '2020'
 
@@ -46,38 +55,95 @@ def sigmoid(ser: np.ndarray) -> np.ndarray:
     return 1 / (1 + np.exp(-ser))
 
 
-def process_data(
+# The longest rolling window, in hours. This is how many hourly rows of state
+# the features for the next hour depend on (including the hour itself).
+ROLLING_WINDOW_HOURS = 48
+
+# A model is not run for an hour if one of its features is calculated from a
+# window of time that is missing more than this many hours of data.
+MAX_MISSING_HOURS = 3
+
+
+def hourly_grid(
+        df: pd.DataFrame,
+        start: Optional[pd.Timestamp] = None
+) -> pd.DataFrame:
+    """Put hourly data onto a grid with a row for every hour, so that each row
+    is exactly one hour after the previous row. Hours without any data get a
+    row of missing values.
+
+    Args:
+        df: Hourly data with a `time` column and no repeated hours.
+        start: First hour of the grid. Defaults to the first hour in `df`.
+
+    Returns:
+        Dataframe with a row for every hour from `start` to the last hour in
+        `df`.
+    """
+    if not len(df):
+        return df
+    if start is None:
+        start = df['time'].min()
+    hours = pd.date_range(start, df['time'].max(), freq='h', name='time')
+    return df.set_index('time').reindex(hours).reset_index()
+
+
+def window_sums(
+        values: np.ndarray,
+        hours: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Calculate the sum over each trailing window of `hours` rows of hourly
+    data (the row itself and the ones before it), using prefix sums so that
+    it takes the same time for any window size. Missing values are left out
+    of the sums and counted instead.
+
+    Args:
+        values: (np.ndarray) Values for every hour, from `hourly_grid()`.
+        hours: (int) Size of the window.
+
+    Returns:
+        The sum of the values that are not missing in each window, and the
+        number of hours that are missing from each window. Hours from before
+        the first row count as missing.
+    """
+    present = ~np.isnan(values)
+    total = np.concatenate([[0], np.cumsum(np.where(present, values, 0))])
+    count = np.concatenate([[0], np.cumsum(present)])
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(end - hours, 0)
+    return total[end] - total[start], hours - (count[end] - count[start])
+
+
+def aggregate_hourly(
         df_hobolink: pd.DataFrame,
-        df_usgs: pd.DataFrame
+        df_usgs: pd.DataFrame,
+        low_memory: bool = False
 ) -> pd.DataFrame:
-    """Combines the data from the Hobolink and the USGS into one table.
+    """Combines the data from the Hobolink and the USGS into one table with one
+    row per hour. This is the first step of `process_data()`.
 
     Args:
         df_hobolink: Hobolink data
         df_usgs: USGS NWIS data
+        low_memory: If True, the measurements are stored as float32 instead of
+                    float64.
 
     Returns:
-        Cleaned dataframe.
+        Hourly dataframe, without any of the features.
     """
-    df_hobolink = df_hobolink.copy()
-    df_usgs = df_usgs.copy()
-
-    # Convert all timestamps to hourly in preparation for aggregation.
-    df_usgs['time'] = df_usgs['time'].dt.floor('h')
-    df_hobolink['time'] = df_hobolink['time'].dt.floor('h')
-
-    # Now collapse the data.
+    # Now collapse the data. The rows are grouped by the hour they're in, which
+    # doesn't modify (or need a copy of) the input data.
     # Take the mean measurements of everything except rain; rain is the sum
     # within an hour. (HOBOlink devices record all rain seen in 10 minutes).
     df_usgs = (
         df_usgs
-        .groupby('time')
+        .groupby(df_usgs['time'].dt.floor('h'))
+        [[c for c in df_usgs.columns if c != 'time']]
         .mean()
-        .reset_index()
     )
     df_hobolink = (
         df_hobolink
-        .groupby('time')
+        .groupby(df_hobolink['time'].dt.floor('h'))
         .agg({
             'pressure': np.mean,
             'par': np.mean,
@@ -90,32 +156,108 @@ def process_data(
             'water_temp': np.mean,
             'air_temp': np.mean,
         })
-        .reset_index()
     )
+    if low_memory:
+        df_usgs = df_usgs.astype(np.float32)
+        df_hobolink = df_hobolink.astype(np.float32)
 
     # This is an outer join to include all the data (we collect more Hobolink
     # data than USGS data). With that said, for the most recent value, we need
     # to make sure one of the sources didn't update before the other one did.
     # Note that usually Hobolink updates first.
-    df = df_hobolink.merge(right=df_usgs, how='left', on='time')
-    df = df.sort_values('time')
+    df = df_hobolink.join(df_usgs, how='left')
+
+    # Add rows for the hours that are missing, so that the windows for the
+    # features cover the right amount of time.
+    if len(df):
+        df = df.reindex(pd.date_range(df.index.min(), df.index.max(),
+                                      freq='h', name='time'))
     df = df.reset_index()
 
     # Drop last row if either Hobolink or USGS is missing.
     # We drop instead of `ffill()` because we want the model to output
     # consistently each hour.
-    if df.iloc[-1, :][['stream_flow', 'rain']].isna().any():
+    if len(df) and df.iloc[-1, :][['stream_flow', 'rain']].isna().any():
         df = df.drop(df.index[-1])
 
-    # The code from here on consists of feature transformations.
+    return df
+
+
+def add_features(
+        df: pd.DataFrame,
+        previous: Optional[pd.DataFrame] = None,
+        low_memory: bool = False,
+        window_start: Optional[pd.Timestamp] = None
+) -> pd.DataFrame:
+    """Calculate the features that the models use from the hourly data. This is
+    the second step of `process_data()`.
+
+    Args:
+        df: Hourly data from `aggregate_hourly()`.
+        previous: Processed data for the hours right before the first hour in
+                  `df`, or None if there are none. Only the last
+                  `ROLLING_WINDOW_HOURS - 1` rows and the last row's
+                  `last_sig_rain` are used.
+        low_memory: If True, the features are stored as float32 instead of
+                    float64, and they are added to `df` in place instead of
+                    to a copy of it.
+        window_start: First hour of all of the data that is being processed.
+                      When there has been no significant rain since this hour,
+                      `last_sig_rain` falls back to it. Defaults to the first
+                      hour of `df`, or if `previous` is set, to the value
+                      carried over from it.
+
+    Returns:
+        Dataframe with the features added.
+    """
+    if low_memory:
+        float_dtype, count_dtype = np.float32, np.int8
+    else:
+        df = df.copy()
+        float_dtype, count_dtype = float, int
+
+    # Prepend the end of the previous hours so the windows for the first few
+    # hours are complete.
+    if previous is not None and len(previous):
+        state = previous[
+            ['time', 'par', 'stream_flow', 'rain']
+        ].tail(ROLLING_WINDOW_HOURS - 1)
+        last_sig_rain = previous['last_sig_rain'].iloc[-1]
+    else:
+        state = df.iloc[:0][['time', 'par', 'stream_flow', 'rain']]
+        last_sig_rain = df['time'].min()
+    # Significant rain from before the start of the data doesn't count, the
+    # same as when all of the data is processed at once.
+    if window_start is not None \
+            and (pd.isna(last_sig_rain) or last_sig_rain < window_start):
+        last_sig_rain = window_start
+    windows = pd.concat([state, df], ignore_index=True)
+
+    def _window_sums(col: str, hours: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Drop the previous hours from the outputs. The sums are always
+        # calculated with float64, since they are differences of running
+        # totals.
+        sums, missing = window_sums(windows[col].to_numpy(dtype=float), hours)
+        return (sums[len(state):].astype(float_dtype),
+                missing[len(state):].astype(count_dtype))
+
+    # The code from here on consists of feature transformations. Every row is
+    # one hour, so the windows are windows of time. Each window's missing hours
+    # are counted so the models can skip windows without enough data.
 
     # Calculate rolling means
-    df['par_1d_mean'] = df['par'].rolling(24).mean()
-    df['stream_flow_1d_mean'] = df['stream_flow'].rolling(24).mean()
+    for col, feature in [('par', 'par_1d'), ('stream_flow', 'stream_flow_1d')]:
+        sums, missing = _window_sums(col, 24)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df[f'{feature}_mean'] = np.where(missing < 24,
+                                             sums / (24 - missing), np.nan)
+        df[f'{feature}_missing'] = missing
 
     # Calculate rolling sums
-    df[f'rain_0_to_24h_sum'] = df['rain'].rolling(24).sum()
-    df[f'rain_0_to_48h_sum'] = df['rain'].rolling(48).sum()
+    for hours in [24, 48]:
+        sums, missing = _window_sums('rain', hours)
+        df[f'rain_0_to_{hours}h_sum'] = sums
+        df[f'rain_0_to_{hours}h_missing'] = missing
     df[f'rain_24_to_48h_sum'] = df[f'rain_0_to_48h_sum'] - df[f'rain_0_to_24h_sum']
 
     # Lastly, they measure the "time since last significant rain." Significant
@@ -125,15 +267,364 @@ def process_data(
         df['time']
         .where(df['sig_rain'])
         .ffill()
-        .fillna(df['time'].min())
+        .fillna(last_sig_rain)
     )
     df['days_since_sig_rain'] = (
-        (df['time'] - df['last_sig_rain']).dt.seconds / 60 / 60 / 24
+        ((df['time'] - df['last_sig_rain']).dt.seconds / 60 / 60 / 24)
+        .astype(float_dtype)
     )
 
     return df
 
 
+def process_data(
+        df_hobolink: pd.DataFrame,
+        df_usgs: pd.DataFrame,
+        low_memory: bool = False
+) -> pd.DataFrame:
+    """Combines the data from the Hobolink and the USGS into one table.
+
+    Args:
+        df_hobolink: Hobolink data
+        df_usgs: USGS NWIS data
+        low_memory: If True, the measurements and features are stored as
+                    float32 instead of float64, which halves the memory used
+                    for long stretches of data (e.g. backtests).
+
+    Returns:
+        Cleaned dataframe.
+    """
+    df = aggregate_hourly(df_hobolink=df_hobolink, df_usgs=df_usgs,
+                          low_memory=low_memory)
+    return add_features(df, low_memory=low_memory)
+
+
+def process_new_data(
+        df_hobolink: pd.DataFrame,
+        df_usgs: pd.DataFrame,
+        previous: pd.DataFrame,
+        window_start: Optional[pd.Timestamp] = None
+) -> pd.DataFrame:
+    """Incremental version of `process_data()`: calculate the processed data for
+    only the hours after the ones that were already processed. The rolling
+    windows and the time of the last significant rain pick up from the end of
+    `previous`, so the output is the same as what `process_data()` would
+    return for these hours given all of the data.
+
+    Args:
+        df_hobolink: Hobolink data. This must include every measurement from
+                     each hour after `previous`, but earlier measurements are
+                     ignored.
+        df_usgs: USGS NWIS data, with the same requirement as `df_hobolink`.
+        previous: The processed data for the hours right before the new hours,
+                  sorted by time. At least the last `ROLLING_WINDOW_HOURS - 1`
+                  hours are needed for the rolling windows to be complete.
+        window_start: First hour of the data that `process_data()` would
+                      process, which `last_sig_rain` falls back to when there
+                      has been no significant rain since then. See
+                      `add_features()`.
+
+    Returns:
+        Cleaned dataframe for the new hours. This is empty if there are no new
+        hours, e.g. because there is no new HOBOlink data.
+    """
+    # The HOBOlink data sets which hours are processed.
+    if not len(df_hobolink):
+        return previous.iloc[:0]
+    df = aggregate_hourly(df_hobolink=df_hobolink, df_usgs=df_usgs)
+    if len(previous):
+        # The grid starts right after the previous hours, even if the first
+        # new hours are missing.
+        start = previous['time'].max() + pd.Timedelta(hours=1)
+        df = hourly_grid(df.loc[df['time'] >= start], start=start)
+    if not len(df):
+        return previous.iloc[:0]
+    return add_features(df, previous=previous, window_start=window_start)
+
+
+def process_data_in_database(
+        days: int = 21,
+        hobolink_table: str = 'hobolink',
+        usgs_table: str = 'usgs'
+) -> pd.DataFrame:
+    """Database version of `process_data()`: calculate the processed data from
+    the `hobolink` and `usgs` tables with window functions inside of Postgres
+    (see `queries/process_data.sql`), so that only the processed rows are sent
+    over the wire instead of all of the raw measurements.
+
+    Args:
+        days: (int) Days of HOBOlink data to process, counting back from the
+              latest measurement.
+        hobolink_table: (str) Name of the table to read the HOBOlink data from,
+                        e.g. for tests and benchmarks that shouldn't touch the
+                        live data. This is put directly into the query, so it
+                        should never come from user input.
+        usgs_table: (str) Name of the table to read the USGS data from. See
+                    `hobolink_table`.
+
+    Returns:
+        The same dataframe as `process_data()` returns for the last `days` days
+        of data in the `hobolink` table and the data in the `usgs` table.
+    """
+    from .database import execute_sql
+    from .database import execute_sql_from_file
+    params = {
+        'days': days,
+        'significant_rain': SIGNIFICANT_RAIN,
+    }
+    if (hobolink_table, usgs_table) == ('hobolink', 'usgs'):
+        df = execute_sql_from_file('process_data.sql', params=params)
+    else:
+        # Names in a WITH clause take precedence over tables with the same
+        # name, so the query reads from the other tables instead.
+        from .query_catalog import query_catalog
+        query = query_catalog.queries['process_data.sql'].sql
+        df = execute_sql(f'''
+            WITH hobolink AS (SELECT * FROM {hobolink_table}),
+            usgs AS (SELECT * FROM {usgs_table})
+            SELECT * FROM (
+                {query.strip().rstrip(';')}
+            ) AS processed_data
+            ORDER BY time;
+        ''', params=params)
+    # Columns where every value is missing come back as objects.
+    return df.astype({
+        c: float for c in df.columns
+        if c not in ['time', 'sig_rain', 'last_sig_rain']
+        and not c.endswith('_missing')
+    })
+
+
+# Each column is a feature from `process_data()` that is used in the models.
+MODEL_FEATURES = [
+    'rain_0_to_24h_sum',
+    'rain_24_to_48h_sum',
+    'rain_0_to_48h_sum',
+    'days_since_sig_rain',
+    'par_1d_mean',
+    'stream_flow_1d_mean',
+]
+
+# The number of missing hours in the window that each feature is calculated
+# from.
+MODEL_FEATURES_MISSING_HOURS = {
+    'rain_0_to_24h_sum': 'rain_0_to_24h_missing',
+    'rain_24_to_48h_sum': 'rain_0_to_48h_missing',
+    'rain_0_to_48h_sum': 'rain_0_to_48h_missing',
+    'par_1d_mean': 'par_1d_missing',
+    'stream_flow_1d_mean': 'stream_flow_1d_missing',
+}
+
+# Each row is the model for a reach; each column is the coefficient of a
+# feature. A feature that is not used by a reach's model has a coefficient of 0.
+MODEL_COEFFICIENTS = pd.DataFrame(
+    [
+        # intercept  a        b        c        d         f          e
+        [0.6233,     0.3531,  0,       0,       -0.0362,  -0.000312, 0],
+        [0.5157,     0.267,   0.1681,  0,       -0.02855, 0,         0],
+        [0.5791,     0.30276, 0.1611,  0,       -0.02267, -0.000427, 0],
+        [0.3333,     0,       0,       0.1091,  -0.01355, 0,         0.000342],
+    ],
+    index=pd.Index([2, 3, 4, 5], name='reach'),
+    columns=['intercept'] + MODEL_FEATURES
+)
+
+
+@lru_cache(maxsize=8)
+def _read_model_coefficients(
+        fpath: str,
+        mtime: float
+) -> Tuple[str, pd.DataFrame]:
+    with open(fpath) as f:
+        data = json.load(f)
+    coefficients = pd.DataFrame.from_dict(
+        {int(reach): coefs for reach, coefs in data['coefficients'].items()},
+        orient='index'
+    )
+    coefficients.index.name = 'reach'
+    # Features that the file doesn't have are not used by any of its models.
+    coefficients = (
+        coefficients
+        .reindex(columns=['intercept'] + MODEL_FEATURES)
+        .fillna(0)
+        .sort_index()
+    )
+    return str(data['version']), coefficients
+
+
+def load_model_coefficients(fpath: str) -> Tuple[str, pd.DataFrame]:
+    """Load a file of model coefficients made by `retraining.py`. The file is
+    only read again if it has changed.
+
+    Args:
+        fpath: (str) Path to the JSON file.
+
+    Returns:
+        The model version and the coefficients, in the same format as
+        `MODEL_COEFFICIENTS`.
+    """
+    return _read_model_coefficients(fpath, os.path.getmtime(fpath))
+
+
+def get_model_coefficients() -> Tuple[str, pd.DataFrame]:
+    """Return the version and coefficients of the models that the website runs.
+    These come from the `MODEL_COEFFICIENTS_FILE` if it is set, and otherwise
+    they are `MODEL_VERSION` and `MODEL_COEFFICIENTS`.
+    """
+    if has_app_context() and current_app.config.get('MODEL_COEFFICIENTS_FILE'):
+        return load_model_coefficients(
+            current_app.config['MODEL_COEFFICIENTS_FILE']
+        )
+    return MODEL_VERSION, MODEL_COEFFICIENTS
+
+
+def get_model_registry() -> Dict[str, pd.DataFrame]:
+    """Return the coefficients of every registered model version, keyed by the
+    version. The registered versions are:
+
+    - The version that the website runs, from `get_model_coefficients()`. This
+      is always first.
+    - The 2020 models defined in this file.
+    - The versions in the `EXTRA_MODEL_COEFFICIENTS_FILES`, which are run
+      alongside the website's version so that their outputs can be compared.
+    """
+    current_version, current_coefficients = get_model_coefficients()
+    registry = {current_version: current_coefficients}
+    registry.setdefault(MODEL_VERSION, MODEL_COEFFICIENTS)
+    if has_app_context():
+        for fpath in current_app.config.get('EXTRA_MODEL_COEFFICIENTS_FILES',
+                                            []):
+            version, coefficients = load_model_coefficients(fpath)
+            registry.setdefault(version, coefficients)
+    return registry
+
+
+def _run_models(
+        df: pd.DataFrame,
+        rows: int,
+        coefficients: pd.DataFrame
+) -> pd.DataFrame:
+    """Run the models for a stack of coefficients, where each row is indexed by
+    the model version and the reach. The features for all the rows are put into
+    one matrix, so the log odds for all the models and rows come from a single
+    matrix multiplication.
+    """
+    df = df.tail(n=rows)
+    if not df['time'].is_monotonic_increasing:
+        df = df.sort_values('time')
+
+    # Features from `process_data(low_memory=True)` are float32, but the
+    # models always run in float64, so that rounding doesn't change which side
+    # of `SAFETY_THRESHOLD` a probability falls on.
+    x = df[MODEL_FEATURES].to_numpy(dtype=float)
+    weights = coefficients[MODEL_FEATURES].to_numpy(dtype=float)
+
+    # Missing features are filled with 0 for the multiplication, and then the
+    # outputs for the reaches that use those features are set to missing.
+    # (Otherwise, a missing feature would make the outputs missing for reaches
+    # that don't even use it, since 0 * NaN is NaN.)
+    is_missing = np.isnan(x)
+
+    # Features from windows that are missing too many hours of data are also
+    # treated as missing.
+    for i, feature in enumerate(MODEL_FEATURES):
+        missing_hours = MODEL_FEATURES_MISSING_HOURS.get(feature)
+        if missing_hours in df:
+            is_missing[:, i] |= df[missing_hours].to_numpy() > MAX_MISSING_HOURS
+
+    log_odds = (
+        np.where(is_missing, 0, x) @ weights.T
+        + coefficients['intercept'].to_numpy(dtype=float)
+    )
+    log_odds[(is_missing @ (weights != 0).T)] = np.nan
+
+    # Transpose so the outputs are ordered by version and reach, then time.
+    log_odds = log_odds.T.ravel()
+    probability = sigmoid(log_odds)
+
+    return pd.DataFrame({
+        'model_version': np.repeat(
+            coefficients.index.get_level_values('model_version').to_numpy(),
+            len(df)
+        ),
+        'reach': np.repeat(
+            coefficients.index.get_level_values('reach').to_numpy(),
+            len(df)
+        ),
+        'time': np.tile(df['time'].to_numpy(), len(coefficients)),
+        'log_odds': log_odds,
+        'probability': probability,
+        'safe': probability <= SAFETY_THRESHOLD,
+    })
+
+
+def all_models(
+        df: pd.DataFrame,
+        rows: int = 48,
+        reaches: Optional[List[int]] = None,
+        coefficients: Optional[pd.DataFrame] = None,
+        version: Optional[str] = None
+) -> pd.DataFrame:
+    """Run the model for every reach at once. The features for all the rows are
+    put into one matrix, so the log odds for all reaches and rows come from a
+    single matrix multiplication with the coefficients.
+
+    Args:
+        df: (pd.DataFrame) Input data from `process_data()`
+        rows: (int) Number of rows to return for each reach.
+        reaches: (list) Reaches to run the model for. Defaults to all reaches.
+        coefficients: (pd.DataFrame) Coefficients of the models, in the same
+                      format as `MODEL_COEFFICIENTS`. Defaults to the ones from
+                      `get_model_coefficients()`.
+        version: (str) Model version for the `model_version` column of the
+                 outputs. Defaults to the version from
+                 `get_model_coefficients()` if `coefficients` is not set.
+
+    Returns:
+        Outputs for the models as a dataframe, sorted by reach and time.
+    """
+    if coefficients is None:
+        version, coefficients = get_model_coefficients()
+    if reaches is not None:
+        coefficients = coefficients.loc[reaches]
+    coefficients = pd.concat({version: coefficients}, names=['model_version'])
+    return _run_models(df, rows=rows, coefficients=coefficients)
+
+
+def all_model_versions(
+        df: pd.DataFrame,
+        rows: int = 48,
+        reaches: Optional[List[int]] = None,
+        registry: Optional[Dict[str, pd.DataFrame]] = None
+) -> pd.DataFrame:
+    """Run every registered model version over the same features. The
+    coefficients of all the versions are stacked into one matrix, so this is
+    still a single matrix multiplication.
+
+    Args:
+        df: (pd.DataFrame) Input data from `process_data()`
+        rows: (int) Number of rows to return for each reach and version.
+        reaches: (list) Reaches to run the models for. Defaults to all reaches.
+        registry: (dict) Coefficients keyed by the model version. Defaults to
+                  `get_model_registry()`.
+
+    Returns:
+        Outputs for the models as a dataframe, sorted by version, reach and
+        time.
+    """
+    if registry is None:
+        registry = get_model_registry()
+    coefficients = pd.concat(
+        {version: c.sort_index() for version, c in registry.items()},
+        names=['model_version']
+    )
+    if reaches is not None:
+        coefficients = coefficients.loc[
+            coefficients.index.get_level_values('reach').isin(reaches)
+        ]
+    return _run_models(df, rows=rows, coefficients=coefficients)
+
+
 def reach_2_model(df: pd.DataFrame, rows: int = 48) -> pd.DataFrame:
     """Model params:
     a- rainfall sum 0-24 hrs
@@ -148,20 +639,7 @@ def reach_2_model(df: pd.DataFrame, rows: int = 48) -> pd.DataFrame:
     Returns:
         Outputs for model as a dataframe.
     """
-    df = df.tail(n=rows).copy()
-
-    df['log_odds'] = (
-        0.6233
-        + 0.3531 * df['rain_0_to_24h_sum']
-        - 0.0362 * df['days_since_sig_rain']
-        - 0.000312 * df['par_1d_mean']
-    )
-
-    df['probability'] = sigmoid(df['log_odds'])
-    df['safe'] = df['probability'] <= SAFETY_THRESHOLD
-    df['reach'] = 2
-
-    return df[['reach', 'time', 'log_odds', 'probability', 'safe']]
+    return all_models(df, rows=rows, reaches=[2])
 
 
 def reach_3_model(df: pd.DataFrame, rows: int = 48) -> pd.DataFrame:
@@ -178,20 +656,7 @@ def reach_3_model(df: pd.DataFrame, rows: int = 48) -> pd.DataFrame:
     Returns:
         Outputs for model as a dataframe.
     """
-    df = df.tail(n=rows).copy()
-
-    df['log_odds'] = (
-        0.5157
-        + 0.267 * df['rain_0_to_24h_sum']
-        + 0.1681 * df['rain_24_to_48h_sum']
-        - 0.02855 * df['days_since_sig_rain']
-    )
-
-    df['probability'] = sigmoid(df['log_odds'])
-    df['safe'] = df['probability'] <= SAFETY_THRESHOLD
-    df['reach'] = 3
-
-    return df[['reach', 'time', 'log_odds', 'probability', 'safe']]
+    return all_models(df, rows=rows, reaches=[3])
 
 
 def reach_4_model(df: pd.DataFrame, rows: int = 48) -> pd.DataFrame:
@@ -209,21 +674,7 @@ def reach_4_model(df: pd.DataFrame, rows: int = 48) -> pd.DataFrame:
     Returns:
         Outputs for model as a dataframe.
     """
-    df = df.tail(n=rows).copy()
-
-    df['log_odds'] = (
-        0.5791
-        + 0.30276 * df['rain_0_to_24h_sum']
-        + 0.1611 * df['rain_24_to_48h_sum']
-        - 0.02267 * df['days_since_sig_rain']
-        - 0.000427 * df['par_1d_mean']
-    )
-
-    df['probability'] = sigmoid(df['log_odds'])
-    df['safe'] = df['probability'] <= SAFETY_THRESHOLD
-    df['reach'] = 4
-
-    return df[['reach', 'time', 'log_odds', 'probability', 'safe']]
+    return all_models(df, rows=rows, reaches=[4])
 
 
 def reach_5_model(df: pd.DataFrame, rows: int = 48) -> pd.DataFrame:
@@ -240,54 +691,39 @@ def reach_5_model(df: pd.DataFrame, rows: int = 48) -> pd.DataFrame:
     Returns:
         Outputs for model as a dataframe.
     """
-    df = df.tail(n=rows).copy()
-
-    df['log_odds'] = (
-        0.3333
-        + 0.1091 * df['rain_0_to_48h_sum']
-        - 0.01355 * df['days_since_sig_rain']
-        + 0.000342 * df['stream_flow_1d_mean']
-    )
-
-    df['probability'] = sigmoid(df['log_odds'])
-    df['safe'] = df['probability'] <= SAFETY_THRESHOLD
-    df['reach'] = 5
-
-    return df[['reach', 'time', 'log_odds', 'probability', 'safe']]
+    return all_models(df, rows=rows, reaches=[5])
 
 
-def all_models(df: pd.DataFrame, *args, **kwargs):
-    out = pd.concat([
-        reach_2_model(df, *args, **kwargs),
-        reach_3_model(df, *args, **kwargs),
-        reach_4_model(df, *args, **kwargs),
-        reach_5_model(df, *args, **kwargs),
-    ], axis=0)
-    out = out.sort_values(['reach', 'time'])
-    return out
+def latest_model_outputs(
+        hours: int = 1,
+        version: Optional[str] = None,
+        reaches: Optional[List[int]] = None
+) -> pd.DataFrame:
+    """Return the latest model outputs for one model version. The hours,
+    version and reaches are filtered in the database, so only the rows that are
+    returned are read.
 
+    Args:
+        hours: (int) Number of hours of model outputs to return.
+        version: (str) Model version. Defaults to the version that the website
+                 runs.
+        reaches: (list) Reaches to return the outputs of. Defaults to all the
+                 reaches.
 
-def latest_model_outputs(hours: int = 1) -> pd.DataFrame:
+    Returns:
+        Pandas DataFrame of the model outputs, sorted by reach and time.
+    """
     from .database import execute_sql_from_file
 
-    if hours == 1:
-        df = execute_sql_from_file('return_1_hour_of_model_outputs.sql')
-
-    elif hours > 1:
-        # pull out 48 hours of model outputs
-        df = execute_sql_from_file('return_48_hours_of_model_outputs.sql')
-
-        # find most recent timestamp
-        latest_time = df['time'].max()
-
-        # create pandas Timedelta, based on input parameter hours
-        time_interval = pd.Timedelta(str(hours) + ' hours')
-
-        # reset df to exclude anything from before time_interval ago
-        df = df[latest_time - df['time'] < time_interval]
-        
-    else:
+    if hours < 1:
         raise ValueError('Hours of data to pull must be a number and it '
                          'cannot be less than one')
 
-    return df
+    if version is None:
+        version, _ = get_model_coefficients()
+
+    return execute_sql_from_file('return_latest_model_outputs.sql', params={
+        'hours': int(hours),
+        'version': version,
+        'reaches': None if reaches is None else [int(i) for i in reaches],
+    })
@@ -0,0 +1,10 @@
+-- Step 1 of `migrate_db`: copy the data that can't be downloaded again before
+-- `schema.sql` recreates the tables.
+
+DROP TABLE IF EXISTS hobolink_backup;
+CREATE TABLE hobolink_backup AS SELECT * FROM hobolink;
+
+DROP TABLE IF EXISTS manual_overrides_backup;
+CREATE TABLE manual_overrides_backup AS SELECT * FROM manual_overrides;
+
+COMMIT;
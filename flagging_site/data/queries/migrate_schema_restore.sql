@@ -0,0 +1,26 @@
+-- Step 2 of `migrate_db`: copy the backed up data into the recreated tables.
+-- Duplicate rows are dropped since the new tables have primary keys.
+
+INSERT INTO hobolink (
+    time, pressure, par, rain, rh, dew_point, wind_speed, gust_speed, wind_dir,
+    water_temp, air_temp
+)
+SELECT DISTINCT ON (time)
+    time, pressure, par, rain, rh, dew_point, wind_speed, gust_speed, wind_dir,
+    water_temp, air_temp
+FROM hobolink_backup
+WHERE time IS NOT NULL
+ORDER BY time;
+
+INSERT INTO manual_overrides (boathouse, start_time, end_time, reason)
+SELECT DISTINCT ON (boathouse, start_time, end_time)
+    boathouse, start_time, end_time, reason
+FROM manual_overrides_backup
+WHERE boathouse IS NOT NULL
+    AND start_time IS NOT NULL
+    AND end_time IS NOT NULL;
+
+DROP TABLE hobolink_backup;
+DROP TABLE manual_overrides_backup;
+
+COMMIT;
@@ -0,0 +1,165 @@
+-- This query calculates the same processed data as `process_data()` in
+-- `predictive_models.py`, for up to the last :days days of HOBOlink data, with
+-- window functions inside of the database. Only the processed rows are
+-- returned. See `process_data_in_database()`.
+--
+-- The rolling sums are calculated the same way as `window_sums()`: as the
+-- difference between running totals, with the missing hours counted instead
+-- of added up, so that the results match up to floating point rounding.
+
+WITH hobolink_hourly AS (
+    -- Take the mean measurements of everything except rain; rain is the sum
+    -- within an hour. An hour where every rain measurement is missing has 0
+    -- rain, the same as in Pandas.
+    SELECT
+        date_trunc('hour', time) AS time,
+        avg(pressure) AS pressure,
+        avg(par) AS par,
+        coalesce(sum(rain), 0) AS rain,
+        avg(rh) AS rh,
+        avg(dew_point) AS dew_point,
+        avg(wind_speed) AS wind_speed,
+        avg(gust_speed) AS gust_speed,
+        avg(wind_dir) AS wind_dir,
+        avg(water_temp) AS water_temp,
+        avg(air_temp) AS air_temp
+    FROM hobolink
+    WHERE time > (SELECT MAX(time) - :days * interval '1 day' FROM hobolink)
+    GROUP BY 1
+),
+
+usgs_hourly AS (
+    SELECT
+        date_trunc('hour', time) AS time,
+        avg(stream_flow) AS stream_flow,
+        avg(gage_height) AS gage_height
+    FROM usgs
+    GROUP BY 1
+),
+
+-- One row for every hour from the first to the last hour of HOBOlink data. The
+-- USGS data is only kept for hours with HOBOlink data, like in Pandas.
+hourly AS (
+    SELECT
+        hours.time,
+        h.pressure,
+        h.par,
+        h.rain,
+        h.rh,
+        h.dew_point,
+        h.wind_speed,
+        h.gust_speed,
+        h.wind_dir,
+        h.water_temp,
+        h.air_temp,
+        u.stream_flow,
+        u.gage_height
+    FROM generate_series(
+        (SELECT MIN(time) FROM hobolink_hourly),
+        (SELECT MAX(time) FROM hobolink_hourly),
+        interval '1 hour'
+    ) AS hours (time)
+    LEFT JOIN hobolink_hourly AS h ON h.time = hours.time
+    LEFT JOIN usgs_hourly AS u ON u.time = h.time
+),
+
+-- Drop the last hour if either the HOBOlink or the USGS data is missing.
+trimmed AS (
+    SELECT *
+    FROM hourly
+    WHERE
+        time < (SELECT MAX(time) FROM hourly)
+        OR (stream_flow IS NOT NULL AND rain IS NOT NULL)
+),
+
+totals AS (
+    SELECT
+        *,
+        sum(coalesce(par, 0)) OVER w AS par_total,
+        count(par) OVER w AS par_count,
+        sum(coalesce(stream_flow, 0)) OVER w AS stream_flow_total,
+        count(stream_flow) OVER w AS stream_flow_count,
+        sum(rain) OVER w AS rain_total,
+        count(rain) OVER w AS rain_count
+    FROM trimmed
+    WINDOW w AS (ORDER BY time ROWS UNBOUNDED PRECEDING)
+),
+
+windows AS (
+    SELECT
+        *,
+        par_total - coalesce(lag(par_total, 24) OVER w, 0)
+            AS par_1d_sum,
+        24 - (par_count - coalesce(lag(par_count, 24) OVER w, 0))
+            AS par_1d_missing,
+        stream_flow_total - coalesce(lag(stream_flow_total, 24) OVER w, 0)
+            AS stream_flow_1d_sum,
+        24 - (stream_flow_count - coalesce(lag(stream_flow_count, 24) OVER w, 0))
+            AS stream_flow_1d_missing,
+        rain_total - coalesce(lag(rain_total, 24) OVER w, 0)
+            AS rain_0_to_24h_sum,
+        24 - (rain_count - coalesce(lag(rain_count, 24) OVER w, 0))
+            AS rain_0_to_24h_missing,
+        rain_total - coalesce(lag(rain_total, 48) OVER w, 0)
+            AS rain_0_to_48h_sum,
+        48 - (rain_count - coalesce(lag(rain_count, 48) OVER w, 0))
+            AS rain_0_to_48h_missing
+    FROM totals
+    WINDOW w AS (ORDER BY time)
+),
+
+features AS (
+    SELECT
+        *,
+        rain_0_to_24h_sum >= :significant_rain AS sig_rain
+    FROM windows
+),
+
+last_sig_rain AS (
+    SELECT
+        *,
+        -- The times are in order, so the latest significant rain so far is the
+        -- largest time with significant rain so far.
+        coalesce(
+            MAX(CASE WHEN sig_rain THEN time END)
+                OVER (ORDER BY time ROWS UNBOUNDED PRECEDING),
+            MIN(time) OVER ()
+        ) AS last_sig_rain
+    FROM features
+)
+
+SELECT
+    time,
+    pressure,
+    par,
+    rain,
+    rh,
+    dew_point,
+    wind_speed,
+    gust_speed,
+    wind_dir,
+    water_temp,
+    air_temp,
+    stream_flow,
+    gage_height,
+    CASE WHEN par_1d_missing < 24
+        THEN par_1d_sum / (24 - par_1d_missing)
+    END AS par_1d_mean,
+    par_1d_missing,
+    CASE WHEN stream_flow_1d_missing < 24
+        THEN stream_flow_1d_sum / (24 - stream_flow_1d_missing)
+    END AS stream_flow_1d_mean,
+    stream_flow_1d_missing,
+    rain_0_to_24h_sum,
+    rain_0_to_24h_missing,
+    rain_0_to_48h_sum,
+    rain_0_to_48h_missing,
+    rain_0_to_48h_sum - rain_0_to_24h_sum AS rain_24_to_48h_sum,
+    sig_rain,
+    last_sig_rain,
+    -- Like `process_data()`, this only counts the part of the time since the
+    -- last significant rain that is less than a day.
+    mod(extract(epoch FROM time - last_sig_rain)::numeric, 86400)
+        ::double precision / 60 / 60 / 24 AS days_since_sig_rain
+FROM last_sig_rain
+ORDER BY time
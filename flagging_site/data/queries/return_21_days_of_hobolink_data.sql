@@ -0,0 +1,6 @@
+-- This query returns up to 21 days of the latest HOBOlink data
+
+SELECT *
+FROM hobolink
+WHERE time > (SELECT MAX(time) - interval '21 days' FROM hobolink)
+ORDER BY time
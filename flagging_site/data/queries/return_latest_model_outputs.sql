@@ -0,0 +1,14 @@
+-- This query returns the model outputs of one model version from the last
+-- :hours hours, counted back from the latest model outputs. If :reaches is not
+-- null, only the outputs for those reaches are returned.
+
+SELECT reach, time, log_odds, probability, safe
+FROM model_outputs
+WHERE
+    model_version = :version
+    AND time > (SELECT MAX(time) FROM model_outputs) - :hours * interval '1 hour'
+    AND (
+        CAST(:reaches AS int[]) IS NULL
+        OR reach = ANY(CAST(:reaches AS int[]))
+    )
+ORDER BY reach, time
@@ -1,48 +1,101 @@
+-- Measurements are stored as double precision (not decimal) so that they are
+-- read back as floats. Every table that is queried by time has an index on its
+-- `time` column.
+
 DROP TABLE IF EXISTS usgs;
 CREATE TABLE IF NOT EXISTS usgs (
     time            timestamp,
-    stream_flow     decimal,
-    gage_height     decimal
+    stream_flow     double precision,
+    gage_height     double precision
 );
+-- Not a primary key: the USGS reports local times, which repeat when daylight
+-- savings time ends.
+CREATE INDEX IF NOT EXISTS usgs_time_idx ON usgs (time);
 
 DROP TABLE IF EXISTS hobolink;
 CREATE TABLE IF NOT EXISTS hobolink (
-    time            timestamp,
-    pressure        decimal,
-    par             decimal, -- photosynthetically active radiation
-    rain            decimal,
-    rh              decimal, -- relative humidity
-    dew_point       decimal,
-    wind_speed      decimal,
-    gust_speed      decimal,
-    wind_dir        decimal,
-    water_temp      decimal,
-    air_temp        decimal
+    time            timestamp PRIMARY KEY,
+    pressure        double precision,
+    par             double precision, -- photosynthetically active radiation
+    rain            double precision,
+    rh              double precision, -- relative humidity
+    dew_point       double precision,
+    wind_speed      double precision,
+    gust_speed      double precision,
+    wind_dir        double precision,
+    water_temp      double precision,
+    air_temp        double precision
 );
 
 DROP TABLE IF EXISTS boathouses;
 CREATE TABLE IF NOT EXISTS boathouses (
     reach           int,
-    boathouse       varchar(255),
-    latitude        decimal,
-    longitude       decimal
+    boathouse       varchar(255) PRIMARY KEY,
+    latitude        double precision,
+    longitude       double precision
+);
+
+DROP TABLE IF EXISTS processed_data;
+CREATE TABLE IF NOT EXISTS processed_data (
+    time                    timestamp PRIMARY KEY,
+    pressure                double precision,
+    par                     double precision,
+    rain                    double precision,
+    rh                      double precision,
+    dew_point               double precision,
+    wind_speed              double precision,
+    gust_speed              double precision,
+    wind_dir                double precision,
+    water_temp              double precision,
+    air_temp                double precision,
+    stream_flow             double precision,
+    gage_height             double precision,
+    par_1d_mean             double precision,
+    stream_flow_1d_mean     double precision,
+    rain_0_to_24h_sum       double precision,
+    rain_0_to_48h_sum       double precision,
+    rain_24_to_48h_sum      double precision,
+    sig_rain                boolean,
+    last_sig_rain           timestamp,
+    days_since_sig_rain     double precision,
+    par_1d_missing          int,
+    stream_flow_1d_missing  int,
+    rain_0_to_24h_missing   int,
+    rain_0_to_48h_missing   int
 );
 
 DROP TABLE IF EXISTS model_outputs;
 CREATE TABLE IF NOT EXISTS model_outputs (
+    model_version   varchar(32),
     reach           int,
     time            timestamp,
-    log_odds        decimal,
-    probability     decimal,
-    safe            boolean
+    log_odds        double precision,
+    probability     double precision,
+    safe            boolean,
+    PRIMARY KEY (model_version, reach, time)
 );
+CREATE INDEX IF NOT EXISTS model_outputs_time_idx ON model_outputs (time);
 
 DROP TABLE IF EXISTS manual_overrides;
 CREATE TABLE IF NOT EXISTS manual_overrides (
     boathouse       varchar(255),
     start_time      timestamp,
     end_time        timestamp,
-    reason          varchar(255)
+    reason          varchar(255),
+    PRIMARY KEY (boathouse, start_time, end_time)
+);
+
+DROP TABLE IF EXISTS payload_fingerprints;
+CREATE TABLE IF NOT EXISTS payload_fingerprints (
+    source          varchar(255) PRIMARY KEY,
+    payload_hash    varchar(64)
+);
+
+-- Not dropped, so the version keeps going up when the database is set up
+-- again, and the website's caches never mistake new data for old data.
+CREATE TABLE IF NOT EXISTS data_version (
+    version         bigint PRIMARY KEY,
+    updated_at      timestamptz NOT NULL
 );
 
 COMMIT;
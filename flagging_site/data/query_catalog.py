@@ -0,0 +1,259 @@
+"""
+This file keeps the SQL queries in `QUERIES_DIR` in memory, so they are not
+read from disk every time they run. All queries run from files go through the
+`query_catalog` object defined near the bottom of the file, which:
+
+- reads and checks every `.sql` file once, when the app is created;
+- runs each query that is a single statement as a prepared statement, so
+  Postgres only parses and plans it once per connection instead of once per
+  call. Bind parameters are written as e.g. `:hours` in the files, the same as
+  for `execute_sql()`;
+- counts the calls and run times of each query.
+
+Files with more than one statement (e.g. `schema.sql`) are run as plain SQL.
+
+The `query_catalog` object is loaded with the app's config in the `create_app`
+function via `init_query_catalog(app)`.
+"""
+import os
+import re
+import threading
+import time
+from dataclasses import asdict
+from dataclasses import dataclass
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import pandas as pd
+from flask import Flask
+from psycopg2.errors import FeatureNotSupported
+from psycopg2.errors import InvalidSqlStatementName
+
+# The same pattern that SQLAlchemy's `text()` uses for bind parameters, so
+# e.g. `::numeric` casts are not mistaken for parameters.
+BIND_PARAM_PATTERN = re.compile(r'(?<![:\w\\]):(\w+)(?!:)')
+
+PREPARABLE_STATEMENTS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE',
+                         'VALUES')
+
+
+def _strip_comments(sql: str) -> str:
+    return re.sub(r'--[^\n]*', '', sql)
+
+
+@dataclass(frozen=True)
+class Query:
+    """One SQL file from `QUERIES_DIR`."""
+    name: str
+    """The file name, e.g. "process_data.sql"."""
+    sql: str
+    params: Tuple[str, ...]
+    """Names of the query's bind parameters, in the order they first appear."""
+    statement_name: Optional[str]
+    """Name of the query's prepared statement, or None if the query is not
+    prepared because it has more than one statement.
+    """
+
+    @classmethod
+    def from_file(cls, fpath: str) -> 'Query':
+        name = os.path.basename(fpath)
+        with open(fpath, encoding='utf8') as f:
+            sql = f.read()
+
+        body = _strip_comments(sql).strip().rstrip(';').strip()
+        if not body:
+            raise ValueError(f'The query {name!r} is empty.')
+
+        params = tuple(dict.fromkeys(BIND_PARAM_PATTERN.findall(body)))
+        single_statement = (
+            ';' not in body
+            and body.split(None, 1)[0].upper() in PREPARABLE_STATEMENTS
+        )
+        statement_name = None
+        if single_statement:
+            stem = os.path.splitext(name)[0]
+            statement_name = 'flagging_' + re.sub(r'\W', '_', stem)
+        return cls(name=name, sql=sql, params=params,
+                   statement_name=statement_name)
+
+    @property
+    def prepare_statement(self) -> str:
+        """The `PREPARE` statement, with the bind parameters as $1, $2, ..."""
+        positions = {p: i for i, p in enumerate(self.params, start=1)}
+        body = BIND_PARAM_PATTERN.sub(
+            lambda m: f'${positions[m.group(1)]}',
+            _strip_comments(self.sql).strip().rstrip(';')
+        )
+        return f'PREPARE {self.statement_name} AS {body}'
+
+    @property
+    def execute_statement(self) -> str:
+        """The `EXECUTE` statement, with DBAPI placeholders for the values."""
+        if not self.params:
+            return f'EXECUTE {self.statement_name}'
+        placeholders = ', '.join(['%s'] * len(self.params))
+        return f'EXECUTE {self.statement_name} ({placeholders})'
+
+    def args(self, params: Optional[Dict[str, Any]]) -> List[Any]:
+        """Return the values of the bind parameters, in order."""
+        params = params or {}
+        missing = [p for p in self.params if p not in params]
+        if missing:
+            raise ValueError(
+                f'Missing values for the parameters {missing} of the query '
+                f'{self.name!r}.'
+            )
+        return [params[p] for p in self.params]
+
+
+@dataclass
+class QueryStats:
+    """Counters for the runs of one query."""
+    calls: int = 0
+    total_time: float = 0
+    last_time: Optional[float] = None
+
+    @property
+    def mean_time(self) -> Optional[float]:
+        if self.calls == 0:
+            return None
+        return self.total_time / self.calls
+
+
+class QueryCatalog:
+    """The queries in `QUERIES_DIR`, loaded once and run as prepared
+    statements.
+    """
+
+    def __init__(self, prepare: bool = True):
+        """
+        Args:
+            prepare: (bool) Whether to run the queries as prepared statements.
+        """
+        self.prepare = prepare
+        self.queries: Dict[str, Query] = {}
+        self._stats: Dict[str, QueryStats] = {}
+        self._lock = threading.Lock()
+
+    def load(self, queries_dir: str) -> None:
+        """Read and check every `.sql` file in a directory. This replaces any
+        queries that were loaded before.
+        """
+        self.queries = {
+            q.name: q for q in (
+                Query.from_file(os.path.join(queries_dir, file_name))
+                for file_name in sorted(os.listdir(queries_dir))
+                if file_name.endswith('.sql')
+            )
+        }
+
+    def execute(
+            self,
+            name: str,
+            params: Optional[Dict[str, Any]] = None
+    ) -> Optional[pd.DataFrame]:
+        """Run a query. See `execute_sql_from_file()`.
+
+        Args:
+            name: (str) File name of the query, e.g. "process_data.sql".
+            params: (dict) Values for the query's bind parameters.
+
+        Returns:
+            Either a Pandas Dataframe the selected data for read queries, or
+            None for write queries.
+        """
+        from .database import execute_sql
+        try:
+            query = self.queries[name]
+        except KeyError:
+            raise KeyError(f'There is no query named {name!r} in the query '
+                           'catalog.') from None
+
+        start_time = time.perf_counter()
+        if self.prepare and query.statement_name is not None:
+            df = self._execute_prepared(query, query.args(params))
+        else:
+            df = execute_sql(query.sql, params=params)
+        self._record(name, time.perf_counter() - start_time)
+        return df
+
+    def _execute_prepared(
+            self,
+            query: Query,
+            args: List[Any]
+    ) -> Optional[pd.DataFrame]:
+        from .database import db
+
+        # Prepared statements belong to one connection, so each pooled
+        # connection keeps track of the statements it has prepared. This is
+        # cleared whenever the pool replaces the connection.
+        conn = db.engine.raw_connection()
+        try:
+            prepared = conn.info.setdefault('prepared_queries', set())
+            for attempt in range(2):
+                try:
+                    with conn.cursor() as cursor:
+                        if query.statement_name not in prepared:
+                            cursor.execute(query.prepare_statement)
+                            prepared.add(query.statement_name)
+                        cursor.execute(query.execute_statement, args)
+                        df = None if cursor.description is None \
+                            else pd.DataFrame(
+                                cursor.fetchall(),
+                                columns=[c[0] for c in cursor.description]
+                            )
+                    conn.commit()
+                    return df
+                except (InvalidSqlStatementName, FeatureNotSupported) as e:
+                    # Prepare the statement again if it is gone, or if the
+                    # tables it reads were changed (e.g. by `init_db`) so that
+                    # its plan can't be used anymore.
+                    conn.rollback()
+                    stale_plan = isinstance(e, FeatureNotSupported) \
+                        and 'cached plan' in str(e)
+                    if attempt or not (
+                            stale_plan
+                            or isinstance(e, InvalidSqlStatementName)
+                    ):
+                        raise
+                    if stale_plan:
+                        with conn.cursor() as cursor:
+                            cursor.execute(
+                                f'DEALLOCATE {query.statement_name}'
+                            )
+                        conn.commit()
+                    prepared.discard(query.statement_name)
+        finally:
+            # This rolls back anything that was not committed.
+            conn.close()
+
+    def _record(self, name: str, run_time: float) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(name, QueryStats())
+            stats.calls += 1
+            stats.total_time += run_time
+            stats.last_time = run_time
+
+    def get_stats(self) -> Dict[str, dict]:
+        """Return the counters for each query, keyed by file name."""
+        with self._lock:
+            return {
+                name: {**asdict(stats), 'mean_time': stats.mean_time}
+                for name, stats in self._stats.items()
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+query_catalog = QueryCatalog()
+
+
+def init_query_catalog(app: Flask):
+    """Loads the queries in the app's `QUERIES_DIR` into the `query_catalog`."""
+    query_catalog.prepare = app.config['PREPARE_QUERIES']
+    query_catalog.load(app.config['QUERIES_DIR'])
@@ -0,0 +1,294 @@
+"""
+This file refits the coefficients of the reach models when CRWA has new
+bacteria samples, so that a new model version can be made without redoing the
+analysis by hand.
+
+The samples are read from CSV files with one row per sample and these columns:
+
+- `reach`: (int) The reach the sample was taken from.
+- `time`: (datetime) When the sample was taken.
+- `ecoli`: (float) E. coli in cfu/100mL.
+
+Each sample is matched with the features in the processed data for the hour it
+was taken in, and a logistic regression is fit for each reach, where the
+outcome is whether the sample was above `ECOLI_THRESHOLD`. The logistic
+regressions are fit with iteratively reweighted least squares (IRLS), and all
+the cross-validation folds of a reach are fit at the same time as one batch of
+matrix operations. The reaches are fit in parallel on a process pool.
+
+The coefficients are saved to a JSON file, which the website uses in place of
+the 2020 models when the `MODEL_COEFFICIENTS_FILE` config option points to it.
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from .predictive_models import MAX_MISSING_HOURS
+from .predictive_models import MODEL_COEFFICIENTS
+from .predictive_models import MODEL_FEATURES
+from .predictive_models import MODEL_FEATURES_MISSING_HOURS
+from .predictive_models import SAFETY_THRESHOLD
+from .predictive_models import sigmoid
+
+ECOLI_THRESHOLD = 630
+"""Samples above this many cfu/100mL of E. coli are unsafe for boating."""
+
+
+def default_reach_features() -> Dict[int, List[str]]:
+    """Return the features used by each reach in the 2020 models."""
+    return {
+        reach: [f for f in MODEL_FEATURES if row[f] != 0]
+        for reach, row in MODEL_COEFFICIENTS.iterrows()
+    }
+
+
+def load_samples(fpaths: List[str]) -> pd.DataFrame:
+    """Read and combine CSV files of bacteria samples.
+
+    Args:
+        fpaths: (list) Paths to CSV files with `reach`, `time` and `ecoli`
+                columns.
+
+    Returns:
+        Pandas DataFrame of the samples.
+    """
+    df = pd.concat(
+        [pd.read_csv(fpath, parse_dates=['time']) for fpath in fpaths],
+        ignore_index=True
+    )
+    return df[['reach', 'time', 'ecoli']].dropna()
+
+
+def join_features(
+        samples: pd.DataFrame,
+        features: pd.DataFrame,
+        threshold: float = ECOLI_THRESHOLD
+) -> pd.DataFrame:
+    """Match each sample with the processed data for the hour it was taken in.
+    Samples without processed data for their hour are dropped, and features
+    from windows that are missing more than `MAX_MISSING_HOURS` hours of data
+    are set to missing.
+
+    Args:
+        samples: (pd.DataFrame) Samples from `load_samples()`.
+        features: (pd.DataFrame) Processed data from `process_data()`.
+        threshold: (float) E. coli level above which a sample is unsafe.
+
+    Returns:
+        Pandas DataFrame of the samples and their features, with an `unsafe`
+        column.
+    """
+    missing_hours = [
+        c for c in dict.fromkeys(MODEL_FEATURES_MISSING_HOURS.values())
+        if c in features
+    ]
+    df = samples.assign(time=samples['time'].dt.floor('h'))
+    df = df.merge(features[['time'] + MODEL_FEATURES + missing_hours],
+                  on='time', how='inner')
+
+    # Features from windows that are missing too much data are left out, the
+    # same way as when the models are run.
+    for feature, col in MODEL_FEATURES_MISSING_HOURS.items():
+        if col in df:
+            df.loc[df[col] > MAX_MISSING_HOURS, feature] = np.nan
+    df = df.drop(columns=missing_hours)
+    df['unsafe'] = df['ecoli'] > threshold
+    return df.sort_values(['reach', 'time']).reset_index(drop=True)
+
+
+def fit_logistic(
+        x: np.ndarray,
+        y: np.ndarray,
+        sample_weights: np.ndarray,
+        l2: float = 1e-6,
+        max_iter: int = 100,
+        tol: float = 1e-10
+) -> np.ndarray:
+    """Fit a batch of logistic regressions on the same data with IRLS. Each fit
+    has its own weights for the rows, so e.g. the training rows of each
+    cross-validation fold can have a weight of 1 and the rest a weight of 0.
+
+    Args:
+        x: (np.ndarray) Array of shape (rows, features). The first column
+           should be all ones for the intercept.
+        y: (np.ndarray) Array of shape (rows,) with the outcomes, 0 or 1.
+        sample_weights: (np.ndarray) Array of shape (fits, rows).
+        l2: (float) L2 penalty on the coefficients, except the intercept. A
+            small penalty keeps the fit stable when the outcomes can be
+            perfectly separated.
+        max_iter: (int) Maximum number of iterations.
+        tol: (float) The fit stops once no coefficient changes by more than
+             this much in an iteration.
+
+    Returns:
+        Array of shape (fits, features) with the coefficients of each fit.
+    """
+    n_fits = sample_weights.shape[0]
+    n_features = x.shape[1]
+    penalty = l2 * np.eye(n_features)
+    penalty[0, 0] = 0
+
+    beta = np.zeros((n_fits, n_features))
+    for _ in range(max_iter):
+        mu = sigmoid(beta @ x.T)
+        w = sample_weights * mu * (1 - mu)
+        hessian = np.einsum('kn,ni,nj->kij', w, x, x, optimize=True) + penalty
+        gradient = (sample_weights * (y - mu)) @ x - beta @ penalty
+        step = np.linalg.solve(hessian, gradient[..., np.newaxis])[..., 0]
+        beta += step
+        if np.abs(step).max() < tol:
+            break
+    return beta
+
+
+def _auc(y: np.ndarray, p: np.ndarray) -> float:
+    """Area under the ROC curve, from the ranks of the predictions."""
+    n_pos = y.sum()
+    n_neg = len(y) - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return np.nan
+    ranks = pd.Series(p).rank().to_numpy()
+    return (ranks[y == 1].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg)
+
+
+def _fit_reach(
+        x: np.ndarray,
+        y: np.ndarray,
+        folds: int,
+        seed: int
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """Fit one reach's model on all of its samples, and cross-validate it.
+    This runs in the process pool.
+
+    The features are standardized before fitting, which helps IRLS converge
+    since e.g. PAR is a few orders of magnitude larger than rainfall. The
+    returned coefficients are for the original features.
+    """
+    mean = x.mean(axis=0)
+    std = x.std(axis=0)
+    std[std == 0] = 1
+    x_std = np.column_stack([np.ones(len(x)), (x - mean) / std])
+
+    # Each row is one fit: one for each fold (trained on the other folds),
+    # and a last one on all of the samples.
+    fold_ids = np.random.default_rng(seed).permutation(len(x)) % folds
+    sample_weights = np.vstack([
+        (fold_ids[np.newaxis, :] != np.arange(folds)[:, np.newaxis]),
+        np.ones((1, len(x)))
+    ]).astype(float)
+    beta = fit_logistic(x_std, y, sample_weights)
+
+    # Predict each sample with the fit that did not see it.
+    p = sigmoid(np.einsum('ni,ni->n', x_std, beta[fold_ids]))
+    p_clipped = np.clip(p, 1e-15, 1 - 1e-15)
+    cv_results = {
+        'samples': int(len(y)),
+        'unsafe_samples': int(y.sum()),
+        'log_loss': float(-np.mean(
+            y * np.log(p_clipped) + (1 - y) * np.log(1 - p_clipped)
+        )),
+        'accuracy': float(np.mean((p > SAFETY_THRESHOLD) == y)),
+        'auc': float(_auc(y, p)),
+    }
+
+    coefs = beta[-1, 1:] / std
+    intercept = beta[-1, 0] - (coefs * mean).sum()
+    return np.concatenate([[intercept], coefs]), cv_results
+
+
+def retrain(
+        data: pd.DataFrame,
+        reach_features: Optional[Dict[int, List[str]]] = None,
+        folds: int = 10,
+        workers: Optional[int] = None,
+        seed: int = 0
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Fit each reach's model and cross-validate it.
+
+    Args:
+        data: (pd.DataFrame) Samples and features from `join_features()`.
+        reach_features: (dict) Features used by each reach's model. Defaults to
+                        the same features as the 2020 models.
+        folds: (int) Number of cross-validation folds.
+        workers: (int) Number of processes. Defaults to the number of CPUs.
+        seed: (int) Seed for splitting the samples into folds.
+
+    Returns:
+        The coefficients in the same format as `MODEL_COEFFICIENTS`, and the
+        cross-validation results for each reach.
+    """
+    if reach_features is None:
+        reach_features = default_reach_features()
+
+    tasks = {}
+    for reach, features in reach_features.items():
+        df = data.loc[data['reach'] == reach, features + ['unsafe']].dropna()
+        if len(df) < folds:
+            raise ValueError(f'Reach {reach} only has {len(df)} samples, '
+                             f'which is not enough for {folds} folds.')
+        tasks[reach] = (df[features].to_numpy(dtype=float),
+                        df['unsafe'].to_numpy(dtype=float))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            reach: executor.submit(_fit_reach, x, y, folds, seed)
+            for reach, (x, y) in tasks.items()
+        }
+        results = {reach: future.result() for reach, future in futures.items()}
+
+    coefficients = pd.DataFrame(
+        0.0,
+        index=pd.Index(sorted(results), name='reach'),
+        columns=['intercept'] + MODEL_FEATURES
+    )
+    for reach, (coefs, _) in results.items():
+        coefficients.loc[reach, ['intercept'] + reach_features[reach]] = coefs
+
+    cv_results = pd.DataFrame.from_dict(
+        {reach: res for reach, (_, res) in results.items()},
+        orient='index'
+    ).sort_index()
+    cv_results.index.name = 'reach'
+
+    return coefficients, cv_results
+
+
+def save_model_coefficients(
+        fpath: str,
+        version: str,
+        coefficients: pd.DataFrame,
+        cv_results: Optional[pd.DataFrame] = None
+) -> None:
+    """Write the coefficients to a JSON file that can be loaded with
+    `predictive_models.load_model_coefficients()`.
+
+    Args:
+        fpath: (str) Path of the file to write.
+        version: (str) Name of the model version, e.g. "2021".
+        coefficients: (pd.DataFrame) Coefficients from `retrain()`.
+        cv_results: (pd.DataFrame) Cross-validation results from `retrain()`,
+                    which are saved alongside the coefficients for reference.
+    """
+    # Features with a coefficient of 0 are left out, since they are not used.
+    data = {
+        'version': version,
+        'coefficients': {
+            str(reach): {
+                k: float(v) for k, v in row.items()
+                if k == 'intercept' or v != 0
+            }
+            for reach, row in coefficients.iterrows()
+        },
+    }
+    if cv_results is not None:
+        data['cross_validation'] = json.loads(cv_results.to_json(orient='index'))
+    os.makedirs(os.path.dirname(os.path.abspath(fpath)), exist_ok=True)
+    with open(fpath, 'w') as f:
+        json.dump(data, f, indent=2)
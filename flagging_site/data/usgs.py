@@ -6,15 +6,33 @@ Link  to the web interface (not the api)
 https://waterdata.usgs.gov/nwis/uv?site_no=01104500
 """
 import os
+import io
 import pandas as pd
 import requests
+from typing import Optional
+from typing import Tuple
 from flask import abort
 from flask import current_app
 
+from .http_client import http_client
+from .payload_cache import cache_payload
+
 # Constants
 USGS_URL = 'https://waterdata.usgs.gov/nwis/uv'
 
 USGS_STATIC_FILE_NAME = 'usgs.pickle'
+# Each key is the original column name; the value is the renamed column.
+USGS_COLUMNS = {
+    'datetime': 'time',
+    '66190_00060': 'stream_flow',
+    '66191_00065': 'gage_height'
+}
+# Instead of a number, the USGS sometimes reports a code for why a value is
+# missing, e.g. "Ice" when the gauge is frozen or "Eqp" for equipment issues.
+USGS_MISSING_VALUE_CODES = [
+    'Ice', 'Eqp', 'Bkw', 'Dis', 'Dry', 'Fld', 'Mnt', 'Pr', 'Rat', 'Ssn', 'Tst',
+    'ZFl', '***', '--'
+]
 # ~ ~ ~ ~
 
 
@@ -25,21 +43,48 @@ def get_live_usgs_data(days_ago: int = 5) -> pd.DataFrame:
     Returns:
         Pandas Dataframe containing the usgs data.
     """
+    return download_usgs_data(days_ago=days_ago)[1]
+
+
+def download_usgs_data(
+        days_ago: int = 5,
+        deadline: Optional[float] = None
+) -> Tuple[Optional[str], pd.DataFrame]:
+    """Retrieve and parse the usgs data like `get_live_usgs_data`, and also
+    save the raw response to the payload cache.
+
+    Args:
+        days_ago: (int) Days of data to retrieve.
+        deadline: (float) Time, from `time.monotonic()`, by which the
+                  request should be done. See `HttpClient.request`.
+
+    Returns:
+        The hash of the raw response (None when using the mock data), and a
+        Pandas Dataframe containing the usgs data.
+    """
     if current_app.config['USE_MOCK_DATA']:
         fpath = os.path.join(
             current_app.config['DATA_STORE'], USGS_STATIC_FILE_NAME
         )
+        payload_hash = None
         df = pd.read_pickle(fpath)
     else:
-        res = request_to_usgs(days_ago=days_ago)
+        res = request_to_usgs(days_ago=days_ago, deadline=deadline)
+        payload_hash = cache_payload('usgs', res.text)
         df = parse_usgs_data(res)
-    return df
+    return payload_hash, df
 
 
-def request_to_usgs(days_ago: int = 5) -> requests.models.Response:
+def request_to_usgs(
+        days_ago: int = 5,
+        deadline: Optional[float] = None
+) -> requests.models.Response:
     """Get a request from the USGS.
 
-
+    Args:
+        days_ago: (int) Days of data to retrieve.
+        deadline: (float) Time, from `time.monotonic()`, by which the
+                  request should be done. See `HttpClient.request`.
 
     Returns:
         Request Response containing the data from the request.
@@ -53,7 +98,8 @@ def request_to_usgs(days_ago: int = 5) -> requests.models.Response:
         'period': days_ago
     }
 
-    res = requests.get(USGS_URL, params=payload)
+    res = http_client.get(USGS_URL, name='usgs', params=payload,
+                          deadline=deadline)
     if res.status_code // 100 in [4, 5]:
         error_msg = 'API request to the USGS endpoint failed with status code '\
                     + str(res.status_code)
@@ -63,42 +109,49 @@ def request_to_usgs(days_ago: int = 5) -> requests.models.Response:
 
 def parse_usgs_data(res) -> pd.DataFrame:
     """
-    Clean the response from the USGS API.
+    Clean the response from the USGS API. The response is in the USGS's "RDB"
+    format: a tab-separated table with comment lines starting with `#` at the
+    top, followed by a row of column headers, followed by a row that describes
+    the width and type of each column, followed by the data.
 
     Args:
-        res: response object from USGS
+        res: response object from USGS, or the text of the response.
 
     Returns:
         Pandas DataFrame containing the usgs data.
     """
-
-    raw_data = [
-        i.split('\t')
-        for i in res.text.split('\n')
-        if not i.startswith('#') and i != ''
-    ]
-
-    # First row is column headers
-    # Second row is ????
-    # Third row downward is the data
-    df = pd.DataFrame(raw_data[2:], columns=raw_data[0])
-
-    df = df.rename(columns={
-        'datetime': 'time',
-        '66190_00060': 'stream_flow',
-        '66191_00065': 'gage_height'
-    })
+    if not isinstance(res, str):
+        res = res.text
+
+    # Skip the comments at the top, and the row of column formats right below
+    # the column headers.
+    header_start = 0
+    while res.startswith('#', header_start):
+        line_end = res.find('\n', header_start)
+        if line_end == -1:
+            raise ValueError('The USGS response has no column headers or '
+                             'data, only comments.')
+        header_start = line_end + 1
+
+    df = pd.read_csv(
+        io.StringIO(res[header_start:]),
+        sep='\t',
+        skiprows=[1],
+        usecols=USGS_COLUMNS.keys(),
+        na_values=USGS_MISSING_VALUE_CODES
+    )
+
+    df = df.rename(columns=USGS_COLUMNS)
 
     # Filter columns
-    df = df[['time', 'stream_flow', 'gage_height']]
-
-    # Convert types
-    df['time'] = pd.to_datetime(df['time'])
-    # Note to self: ran this once in a test and it gave the following error:
-    # FAILED tests/test_data.py::test_usgs_data_is_recent - ValueError: could not convert string to float: ''
-    # Reran and it went away
-    # The error was here in this line casting `stream_flow` to a float:
-    df['stream_flow'] = df['stream_flow'].astype(float)
-    df['gage_height'] = df['gage_height'].astype(float)
+    df = df[list(USGS_COLUMNS.values())]
+
+    # Convert types. The measurements are usually read in as floats already,
+    # but any code we have not seen before would be read in as a string.
+    df['time'] = pd.to_datetime(df['time'], format='%Y-%m-%d %H:%M')
+    df['stream_flow'] = pd.to_numeric(df['stream_flow'], errors='coerce')\
+        .astype(float)
+    df['gage_height'] = pd.to_numeric(df['gage_height'], errors='coerce')\
+        .astype(float)
 
     return df
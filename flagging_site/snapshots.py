@@ -0,0 +1,315 @@
+"""
+This file publishes the website's most requested responses as static files:
+
+- `/` (`index.html`)
+- `/flags` (`flags.html`), the iframe with the flags that other websites embed
+- `/api/v1/model` with the default parameters (`model.json`)
+- `/api/v1/boathouses` (`boathouses.json`)
+
+These only change when the data or the manual overrides change, so they are
+rendered once each time `update_database` runs or an override is edited, and
+written to `SNAPSHOT_DIR` along with a `manifest.json` that says which data
+version they were made from. The directory can be served by a static file
+server as-is.
+
+The website also serves these requests from the snapshots (see
+`init_snapshots`), so they don't run any queries or templates. A snapshot is
+only used while the data version it was made from is current, and until the
+next manual override starts or ends or the data becomes out of date; after
+that, the next request renders and publishes new snapshots. Each process keeps
+the snapshots in memory once it has read them.
+
+The snapshots are only published if both `SNAPSHOT_DIR` and `SNAPSHOT_BASE_URL`
+are set. The absolute links in the pages use `SNAPSHOT_BASE_URL`. The root URL is never taken from a request, since
+anyone can send a request with a made-up `Host` header. For the same reason,
+the snapshots are only served to requests for that host; other requests are
+rendered as usual.
+"""
+import os
+import threading
+from urllib.parse import urlsplit
+from typing import Dict
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+import pandas as pd
+from flask import Blueprint
+from flask import Response
+from flask import current_app
+from flask import json
+from flask import request
+
+from .cache import STALE_DATA_HOURS
+from .cache import data_version
+from .cache import latest_time
+
+SNAPSHOT_PAGES: Dict[str, str] = {
+    '/': 'index.html',
+    '/flags': 'flags.html',
+    '/api/v1/model': 'model.json',
+    '/api/v1/boathouses': 'boathouses.json',
+}
+"""Paths of the pages that are published, and the files they are written to."""
+
+MANIFEST_FILE = 'manifest.json'
+
+RENDERING_SNAPSHOT = 'flagging_site.rendering_snapshot'
+"""Key in the WSGI environ of the requests that render the snapshots, so they
+are not served from the old snapshots.
+"""
+
+
+class Snapshots(NamedTuple):
+    version: int
+    """Data version that the snapshots were made from."""
+    base_url: str
+    """The `SNAPSHOT_BASE_URL` that was used for the absolute links in the
+    pages.
+    """
+    expires_at: pd.Timestamp
+    """When the next manual override starts or ends or the data becomes out of
+    date, or NaT if neither will happen.
+    """
+    pages: Dict[str, Tuple[bytes, str]]
+    """The body and mimetype of each page, keyed by path."""
+
+    def is_current(self, version: int, now: pd.Timestamp) -> bool:
+        return (
+            self.version == version
+            and (pd.isna(self.expires_at) or now < self.expires_at)
+        )
+
+
+def _base_url() -> Optional[str]:
+    """Return `SNAPSHOT_BASE_URL` with a trailing slash, or None if the
+    snapshots are turned off because it or `SNAPSHOT_DIR` is not set.
+    """
+    base_url = current_app.config['SNAPSHOT_BASE_URL']
+    if not base_url or not current_app.config['SNAPSHOT_DIR']:
+        return None
+    return base_url.rstrip('/') + '/'
+
+
+def _request_is_for(base_url: str) -> bool:
+    """Whether the current request is for the website at a root URL. The
+    scheme is not compared, since the website may be behind a proxy that
+    handles HTTPS.
+    """
+    url = urlsplit(base_url)
+    return (
+        request.host.lower() == url.netloc.lower()
+        and request.script_root == url.path.rstrip('/')
+    )
+
+
+def _snapshot_dir(snapshot_dir: Optional[str] = None) -> str:
+    return snapshot_dir or current_app.config['SNAPSHOT_DIR']
+
+
+def _expires_at(now: pd.Timestamp) -> pd.Timestamp:
+    from .data.boathouse_flags import current_flags
+    expires_at = current_flags.get().expires_at
+    stale_at = latest_time.get() + pd.Timedelta(hours=STALE_DATA_HOURS)
+    if not pd.isna(stale_at) and stale_at > now:
+        expires_at = stale_at if pd.isna(expires_at) \
+            else min(expires_at, stale_at)
+    return expires_at
+
+
+def render_snapshots(base_url: str) -> Snapshots:
+    """Render the pages in `SNAPSHOT_PAGES` with the app's views.
+
+    Args:
+        base_url: (str) Root URL of the website.
+
+    Returns:
+        The snapshots.
+    """
+    version = data_version.get()
+    expires_at = _expires_at(pd.Timestamp.now())
+    pages = {}
+    for path in SNAPSHOT_PAGES:
+        # This can run inside of another request (e.g. an admin edit of the
+        # manual overrides), and the request context would reuse that
+        # request's app context. A new app context gives each page its own `g`,
+        # so rendering doesn't overwrite the outer request's `g`.
+        with current_app.app_context(), current_app.test_request_context(
+                path,
+                base_url=base_url,
+                environ_overrides={RENDERING_SNAPSHOT: True}
+        ):
+            res = current_app.full_dispatch_request()
+        if res.status_code != 200:
+            raise RuntimeError(f'Rendering {path} returned {res.status}.')
+        pages[path] = (res.get_data(), res.mimetype)
+    return Snapshots(version=version, base_url=base_url,
+                     expires_at=expires_at, pages=pages)
+
+
+def _write_file(fpath: str, data: bytes) -> None:
+    tmp_fpath = f'{fpath}.{os.getpid()}.tmp'
+    with open(tmp_fpath, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_fpath, fpath)
+
+
+def write_snapshots(
+        snapshots: Snapshots,
+        snapshot_dir: Optional[str] = None
+) -> None:
+    """Write the snapshots to the snapshot directory. Each file is replaced
+    atomically, and the manifest is written last.
+    """
+    snapshot_dir = _snapshot_dir(snapshot_dir)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    manifest = {
+        'version': snapshots.version,
+        'base_url': snapshots.base_url,
+        'expires_at': None if pd.isna(snapshots.expires_at)
+        else snapshots.expires_at.isoformat(),
+        'pages': {},
+    }
+    for path, (body, mimetype) in snapshots.pages.items():
+        file_name = SNAPSHOT_PAGES[path]
+        _write_file(os.path.join(snapshot_dir, file_name), body)
+        manifest['pages'][path] = {'file': file_name, 'mimetype': mimetype}
+    _write_file(os.path.join(snapshot_dir, MANIFEST_FILE),
+                json.dumps(manifest, indent=2).encode('utf8'))
+
+
+def read_snapshots(snapshot_dir: Optional[str] = None) -> Optional[Snapshots]:
+    """Read the snapshots from the snapshot directory, or return None if there
+    aren't any.
+    """
+    snapshot_dir = _snapshot_dir(snapshot_dir)
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        pages = {}
+        for path, page in manifest['pages'].items():
+            with open(os.path.join(snapshot_dir, page['file']), 'rb') as f:
+                pages[path] = (f.read(), page['mimetype'])
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+    return Snapshots(
+        version=manifest['version'],
+        base_url=manifest['base_url'],
+        expires_at=pd.Timestamp(manifest['expires_at']),
+        pages=pages
+    )
+
+
+class PublishedSnapshots:
+    """The latest snapshots of this process."""
+
+    def __init__(self):
+        self._snapshots: Optional[Snapshots] = None
+        self._failed_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[Snapshots]:
+        """Return the current snapshots. If this process's snapshots are not
+        current, the ones in the snapshot directory are used if they are, or
+        else new snapshots are published.
+
+        Returns:
+            The snapshots, or None if the snapshots are turned off or could not
+            be published.
+        """
+        base_url = _base_url()
+        if base_url is None:
+            return None
+        version = data_version.get()
+        snapshots = self._snapshots
+        if snapshots is None or not self._is_current(snapshots, version,
+                                                     base_url):
+            with self._lock:
+                snapshots = self._refresh(version, base_url)
+        return snapshots
+
+    @staticmethod
+    def _is_current(snapshots: Snapshots, version: int, base_url: str) -> bool:
+        return (
+            snapshots.base_url == base_url
+            and snapshots.is_current(version, pd.Timestamp.now())
+        )
+
+    def _refresh(self, version: int, base_url: str) -> Optional[Snapshots]:
+        # Another thread or process may have published them already.
+        for snapshots in [self._snapshots, read_snapshots()]:
+            if snapshots is not None \
+                    and self._is_current(snapshots, version, base_url):
+                self._snapshots = snapshots
+                return snapshots
+        # Don't try again on every request if the pages can't be rendered.
+        if self._failed_version == version:
+            return None
+        try:
+            return self.publish()
+        except Exception as e:
+            self._failed_version = version
+            current_app.logger.warning(f'Unable to publish snapshots: {e!r}')
+            return None
+
+    def publish(self) -> Optional[Snapshots]:
+        """Render the snapshots with `SNAPSHOT_BASE_URL`, write them to the
+        snapshot directory, and serve them from now on.
+
+        Returns:
+            The snapshots, or None if the snapshots are turned off.
+        """
+        base_url = _base_url()
+        if base_url is None:
+            return None
+        snapshots = render_snapshots(base_url)
+        write_snapshots(snapshots)
+        self._snapshots = snapshots
+        self._failed_version = None
+        return snapshots
+
+
+published_snapshots = PublishedSnapshots()
+
+
+def _with_time_returned(body: bytes) -> bytes:
+    """Replace the `time_returned` at the end of a model API response with the
+    current time.
+    """
+    body = body[:body.rindex(b', "time_returned": ')]
+    time_returned = json.dumps(pd.to_datetime('today')).encode('utf8')
+    return body + b', "time_returned": ' + time_returned + b'}\n'
+
+
+def init_snapshots(bp: Blueprint) -> None:
+    """Serve a blueprint's pages in `SNAPSHOT_PAGES` from the snapshots, if
+    `SERVE_SNAPSHOTS` is True.
+
+    Only requests for the host in `SNAPSHOT_BASE_URL` are served from the
+    snapshots, and only those requests can publish them.
+
+    The snapshots are served from a `before_request` function, so they skip
+    the blueprint's `before_request` functions that are registered after this
+    is run. `after_request` functions still run.
+    """
+
+    @bp.before_request
+    def _serve_snapshot() -> Optional[Response]:
+        if (
+                request.path not in SNAPSHOT_PAGES
+                or request.method != 'GET'
+                or request.query_string
+                or request.environ.get(RENDERING_SNAPSHOT)
+                or not current_app.config['SERVE_SNAPSHOTS']
+        ):
+            return None
+        base_url = _base_url()
+        if base_url is None or not _request_is_for(base_url):
+            return None
+        snapshots = published_snapshots.get()
+        if snapshots is None:
+            return None
+        body, mimetype = snapshots.pages[request.path]
+        if request.path == '/api/v1/model':
+            body = _with_time_returned(body)
+        return current_app.response_class(body, mimetype=mimetype)
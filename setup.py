@@ -35,7 +35,8 @@ setup(
         'Flask-SQLAlchemy',
         'Flask-Admin',
         'Flask-BasicAuth',
-        'py7zr'
+        'py7zr',
+        'pyarrow'
     ],
     extras_require={
         'windows': ['psycopg2'],
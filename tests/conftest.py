@@ -3,6 +3,8 @@ import pytest
 
 from flagging_site import create_app
 from flagging_site import config as _config
+from synthetic_data import synthetic_hobolink_data
+from synthetic_data import synthetic_usgs_data
 
 
 @pytest.fixture(scope='session')
@@ -23,3 +25,13 @@ def client(app):
     """A test client for the app."""
     return app.test_client()
 
+
+@pytest.fixture(scope='session')
+def synthetic_data():
+    """Returns a function that makes synthetic HOBOlink and USGS data (see
+    `tests/synthetic_data.py`) for a number of days.
+    """
+    def _synthetic_data(days: int, usgs_days: int = None):
+        return (synthetic_hobolink_data(days=days),
+                synthetic_usgs_data(days=usgs_days or days))
+    return _synthetic_data
@@ -0,0 +1,37 @@
+"""Synthetic HOBOlink and USGS data for the tests and the benchmarks.
+
+The data is built by repeating the measurements in the data store's pickles
+until they cover the requested number of days, so it has the same columns and
+types as the parsed API data.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from flagging_site.config import DATA_STORE
+from flagging_site.data.hobolink import HOBOLINK_STATIC_FILE_NAME
+from flagging_site.data.usgs import USGS_STATIC_FILE_NAME
+
+END_TIME = '2020-09-01'
+
+
+def _stretch(df: pd.DataFrame, days: int, freq: str) -> pd.DataFrame:
+    periods = int(pd.Timedelta(days=days) / pd.Timedelta(freq))
+    df = df.iloc[np.arange(periods) % len(df)].reset_index(drop=True)
+    df['time'] = pd.date_range(end=END_TIME, periods=periods, freq=freq)
+    return df
+
+
+def synthetic_hobolink_data(days: int = 90) -> pd.DataFrame:
+    """HOBOlink data in 10 minute increments."""
+    df = pd.read_pickle(os.path.join(DATA_STORE, HOBOLINK_STATIC_FILE_NAME))
+    return _stretch(df, days=days, freq='10min')
+
+
+def synthetic_usgs_data(days: int = 90) -> pd.DataFrame:
+    """USGS data in 15 minute increments."""
+    df = pd.read_pickle(os.path.join(DATA_STORE, USGS_STATIC_FILE_NAME))
+    df = _stretch(df, days=days, freq='15min')
+    df['stream_flow'] = df['stream_flow'].astype(float)
+    return df
@@ -0,0 +1,315 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+from sqlalchemy import event
+
+from flagging_site import cache
+from flagging_site.cache import TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set('a', 1)
+    c.set('b', 2)
+    assert c.get('a') == 1
+    c.set('c', 3)
+    assert c.get('b') is None
+    assert c.get('a') == 1
+    assert c.get('c') == 3
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set('a', 1)
+    now[0] += 59
+    assert c.get('a') == 1
+    now[0] += 1
+    assert c.get('a') is None
+    assert len(c) == 0
+
+
+@contextmanager
+def record_queries(app):
+    """Yields a list of the queries that are run inside of the `with` block."""
+    from flagging_site.data.database import db
+    queries = []
+
+    def _record(conn, cursor, statement, *args, **kwargs):
+        queries.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _record)
+    try:
+        yield queries
+    finally:
+        event.remove(engine, 'before_cursor_execute', _record)
+
+
+def test_model_api_is_cached_until_data_changes(app, client):
+    """Tests that a repeated request to the model API doesn't touch the
+    database, and that a new data version makes a new response.
+    """
+    with record_queries(app) as queries:
+        first = client.get('/api/v1/model?reach=2&hours=3')
+        queries.clear()
+        second = client.get('/api/v1/model?reach=2&hours=3')
+        assert queries == []
+
+        with app.app_context():
+            cache.bump_data_version()
+        queries.clear()
+        client.get('/api/v1/model?reach=2&hours=3')
+        assert queries != []
+
+    first, second = json.loads(first.data), json.loads(second.data)
+    assert first.pop('time_returned') <= second.pop('time_returned')
+    assert first == second
+
+
+def test_model_api_cache_key_is_normalized(app, client):
+    """Tests that requests that only differ in the order or repeats of the
+    reaches, or in hours past the limit, share one cache entry.
+    """
+    max_hours = app.config['API_MAX_HOURS']
+    with record_queries(app) as queries:
+        first = client.get(f'/api/v1/model?reach=3&reach=2&hours={max_hours}')
+        queries.clear()
+        for query_string in [
+            f'reach=2&reach=3&hours={max_hours}',
+            f'reach=2&reach=3&reach=2&hours={max_hours + 1}',
+        ]:
+            res = client.get(f'/api/v1/model?{query_string}')
+            assert queries == []
+            assert json.loads(res.data)['model_outputs'] \
+                == json.loads(first.data)['model_outputs']
+
+    assert [i['reach'] for i in json.loads(first.data)['model_outputs']] \
+        == [2, 3]
+
+
+def test_conditional_get(app, client):
+    """Tests that the flags page can be revalidated with its ETag or its
+    Last-Modified time, and that changing the data changes the ETag.
+    """
+    res = client.get('/flags')
+    assert res.status_code == 200
+    assert 'public' in res.headers['Cache-Control']
+    assert 'Set-Cookie' not in res.headers
+    etag = res.headers['ETag']
+    last_modified = res.headers['Last-Modified']
+
+    res = client.get('/flags', headers={'If-None-Match': etag})
+    assert res.status_code == 304
+    assert res.data == b''
+    assert res.headers['ETag'] == etag
+
+    res = client.get('/flags', headers={'If-Modified-Since': last_modified})
+    assert res.status_code == 304
+
+    with app.app_context():
+        cache.bump_data_version()
+    res = client.get('/flags', headers={'If-None-Match': etag})
+    assert res.status_code == 200
+    assert res.headers['ETag'] != etag
+
+
+def test_last_modified_is_in_the_data_timezone(app, client, monkeypatch):
+    """Tests that the Last-Modified time reads the times in the database as
+    GMT-04:00, the timezone of the HOBOlink data, and not the server's local
+    time.
+    """
+    monkeypatch.setenv('TZ', 'Asia/Tokyo')
+    time.tzset()
+    try:
+        with app.app_context():
+            version = cache.data_version.get()
+        latest_time = pd.Timestamp('2020-07-01 12:00')
+        cache.response_cache.set(('page_state', version), {
+            'latest_time': latest_time,
+            'updated_at': 0,
+            'overrides': [],
+        })
+        res = client.get('/flags')
+    finally:
+        monkeypatch.delenv('TZ')
+        time.tzset()
+        cache.response_cache.clear()
+
+    # The data went out of date 48 hours after 12:00 GMT-04:00, i.e. at
+    # 16:00 UTC two days later.
+    assert res.headers['Last-Modified'] == 'Fri, 03 Jul 2020 16:00:00 GMT'
+
+
+def test_latest_time_is_read_once_per_data_version(app, client):
+    """Tests that the check for out of date data doesn't query the database on
+    every request.
+    """
+    client.get('/about')
+    with record_queries(app) as queries:
+        client.get('/about')
+        client.get('/api')
+        assert queries == []
+
+        with app.app_context():
+            cache.bump_data_version()
+        queries.clear()
+        client.get('/about')
+        assert any('processed_data' in q for q in queries)
+
+
+def test_flag_pages_use_the_flag_snapshot(app, client):
+    """Tests that the flags pages are made without querying the database, and
+    that a manual override gives its boathouse a red flag.
+    """
+    from flagging_site.data.boathouse_flags import current_flags
+    from flagging_site.data.database import execute_sql
+
+    client.get('/flags')
+    with record_queries(app) as queries:
+        client.get('/flags')
+        client.get('/')
+        assert queries == []
+
+    now = pd.Timestamp.now()
+    with app.app_context():
+        override = {
+            'boathouse': current_flags.get().boathouses[0].boathouse,
+            'start_time': now - pd.Timedelta(hours=1),
+            'end_time': now + pd.Timedelta(hours=1),
+        }
+        execute_sql(
+            'INSERT INTO manual_overrides (boathouse, start_time, end_time, '
+            'reason) VALUES (:boathouse, :start_time, :end_time, \'sewage\');',
+            override
+        )
+        try:
+            snapshot = current_flags.rebuild(cache.bump_data_version())
+        finally:
+            execute_sql(
+                'DELETE FROM manual_overrides WHERE boathouse = :boathouse '
+                'AND start_time = :start_time AND end_time = :end_time;',
+                override
+            )
+            cache.bump_data_version()
+
+    flag = snapshot.boathouses[0]
+    assert not flag.safe
+    assert flag.override_reason == 'sewage'
+    assert snapshot.flags()[flag.boathouse] is False
+    assert now < snapshot.expires_at
+    assert snapshot.expires_at <= override['end_time'] + pd.Timedelta(1, 'us')
+
+
+def test_flag_snapshot_shows_missing_model_outputs_as_red_flags(
+        app, monkeypatch
+):
+    """Tests that a reach whose model output is missing (e.g. because its
+    features come from windows that are missing too many hours) gets a red
+    flag, and that the other reaches still get their own flags.
+    """
+    from flagging_site.data import boathouse_flags
+    from flagging_site.data import predictive_models
+
+    features = pd.DataFrame({
+        'time': [pd.Timestamp('2020-07-01 12:00')],
+        'rain_0_to_24h_sum': [0.0],
+        'rain_24_to_48h_sum': [0.0],
+        'rain_0_to_48h_sum': [0.0],
+        'days_since_sig_rain': [1.0],
+        'par_1d_mean': [float('nan')],
+        'stream_flow_1d_mean': [100.0],
+    })
+    df_model = predictive_models.all_models(features, rows=1)
+    monkeypatch.setattr(boathouse_flags, 'latest_model_outputs',
+                        lambda: df_model)
+
+    with app.app_context():
+        snapshot = boathouse_flags.build_flag_snapshot(version=0)
+
+    # Reaches 2 and 4 use the PAR, so they have no outputs.
+    missing = df_model.loc[df_model['probability'].isna(), 'reach'].tolist()
+    assert missing == [2, 4]
+    assert df_model['safe'].tolist() == [False, True, False, True]
+    assert {flag.reach for flag in snapshot.boathouses} >= {2, 3, 4, 5}
+    for flag in snapshot.boathouses:
+        if flag.override_reason is None:
+            assert flag.safe == (flag.reach not in missing)
+
+
+def test_snapshots_are_served_until_data_changes(app, client):
+    """Tests that the snapshotted pages are published to the snapshot
+    directory and served from it without querying the database, and that they
+    are published again when the data changes.
+    """
+    from flagging_site.snapshots import read_snapshots
+
+    client.get('/flags')
+    with record_queries(app) as queries:
+        for path in ['/', '/flags', '/api/v1/model', '/api/v1/boathouses']:
+            assert client.get(path).status_code == 200
+        assert queries == []
+
+    fpath = os.path.join(app.config['SNAPSHOT_DIR'], 'flags.html')
+    with open(fpath, 'rb') as f:
+        published = f.read()
+    assert client.get('/flags').data == published
+
+    # The snapshots are the same as the pages that the views make.
+    app.config['SERVE_SNAPSHOTS'] = False
+    try:
+        assert client.get('/flags').data == published
+        boathouses = client.get('/api/v1/boathouses').data
+    finally:
+        app.config['SERVE_SNAPSHOTS'] = True
+    assert client.get('/api/v1/boathouses').data == boathouses
+
+    with app.app_context():
+        version = cache.bump_data_version()
+    client.get('/flags')
+    with app.app_context():
+        assert read_snapshots().version == version
+
+
+def test_snapshots_ignore_requests_for_other_hosts(app, client):
+    """Tests that a request with a different `Host` header is rendered as
+    usual, and doesn't publish snapshots with links to that host.
+    """
+    from flagging_site.snapshots import read_snapshots
+
+    client.get('/flags')
+    with app.app_context():
+        version = cache.bump_data_version()
+
+    res = client.get('/flags', headers={'Host': 'example.com'})
+    assert res.status_code == 200
+    assert b'http://example.com/' in res.data
+    with app.app_context():
+        assert read_snapshots().version != version
+
+    res = client.get('/flags')
+    assert b'example.com' not in res.data
+    with app.app_context():
+        snapshots = read_snapshots()
+    assert snapshots.version == version
+    assert snapshots.base_url == app.config['SNAPSHOT_BASE_URL']
+
+
+def test_render_snapshots_keeps_the_outer_request_g(app):
+    """Tests that rendering the snapshots inside of another request (e.g. an
+    admin edit) doesn't change that request's `g`.
+    """
+    from flask import g
+    from flagging_site.snapshots import render_snapshots
+
+    with app.test_request_context('/admin/'):
+        g.notices = ['outer']
+        g.etag = 'outer'
+        render_snapshots(app.config['SNAPSHOT_BASE_URL'])
+        assert g.notices == ['outer']
+        assert g.etag == 'outer'
@@ -1,10 +1,15 @@
 import io
 import pandas as pd
 import pickle
+import pytest
+import time
+from flask import abort
 
+from flagging_site.data import database
 from flagging_site.data import hobolink
 from flagging_site.data.hobolink import get_live_hobolink_data
 from flagging_site.data.usgs import get_live_usgs_data
+from flagging_site.data.usgs import parse_usgs_data
 
 
 def test_hobolink_data_is_recent(app):
@@ -41,8 +46,107 @@ def test_hobolink_handles_erroneous_csv(app, monkeypatch):
     monkeypatch.setattr(
         hobolink,
         'request_to_hobolink',
-        lambda export_name: MockHobolinkResponse()
+        lambda export_name, deadline=None: MockHobolinkResponse()
     )
 
     with app.app_context():
         assert get_live_hobolink_data().equals(expected_dataframe)
+
+
+def test_coalesce_columns():
+    """Tests that duplicated columns are merged by taking the first nonmissing
+    value in each row, and that rows with no data are dropped.
+    """
+    df = pd.DataFrame({
+        'Temp': [1.0, None, None, None],
+        'Temp.1': [None, 2.0, None, 5.0],
+        'Temp.2': [None, 3.0, 4.0, None],
+    })
+    coalesced = hobolink.coalesce_columns(df)
+    expected = pd.Series([1.0, 2.0, 4.0, 5.0], index=[0, 1, 2, 3])
+    assert coalesced.equals(expected)
+
+    df.loc[2, 'Temp.2'] = None
+    assert hobolink.coalesce_columns(df).index.tolist() == [0, 1, 3]
+
+
+def test_hobolink_export_name_covers_missing_data():
+    """Tests that the smallest HOBOlink export that covers the gap since the
+    last stored row is chosen, and that a cold start uses the default export.
+    """
+    now = pd.Timestamp.now(tz=hobolink.HOBOLINK_TIMEZONE).tz_localize(None)
+    assert hobolink.get_hobolink_export_name(None) \
+        == hobolink.DEFAULT_HOBOLINK_EXPORT_NAME
+    assert hobolink.get_hobolink_export_name(now - pd.Timedelta(hours=2)) \
+        == 'code_for_boston_export_1d'
+    assert hobolink.get_hobolink_export_name(now - pd.Timedelta(days=5)) \
+        == 'code_for_boston_export_21d'
+    assert hobolink.get_hobolink_export_name(now - pd.Timedelta(days=365)) \
+        == 'code_for_boston_export_90d'
+
+
+def test_latest_hobolink_data_has_float_columns(monkeypatch):
+    """Tests that the measurements are floats even when one of them is NULL
+    in every row, which the database driver reads in as objects.
+    """
+    df = pd.DataFrame({
+        'time': pd.date_range('2020-07-01', periods=3, freq='10min'),
+        **{
+            col: [None] * 3 if col == 'water_temp' else [1.0, 2.0, 3.0]
+            for col in hobolink.HOBOLINK_COLUMNS.values() if col != 'time'
+        }
+    })
+    monkeypatch.setattr(database, 'execute_sql_from_file', lambda *_: df)
+
+    out = hobolink.latest_hobolink_data()
+    assert out['water_temp'].dtype == float
+    assert out['water_temp'].isna().all()
+    assert (out.drop(columns='time').dtypes == float).all()
+
+def test_usgs_response_with_only_comments_raises_error():
+    with pytest.raises(ValueError, match='only comments'):
+        parse_usgs_data('# USGS\n# No sites found')
+
+
+def test_hobolink_export_name_uses_the_data_timezone(monkeypatch):
+    """Tests that the time since the last stored row is measured in the
+    timezone of the HOBOlink data, not the server's local time.
+    """
+    monkeypatch.setenv('TZ', 'UTC')
+    time.tzset()
+    try:
+        now = pd.Timestamp.now(tz=hobolink.HOBOLINK_TIMEZONE).tz_localize(None)
+        assert hobolink.get_hobolink_export_name(now - pd.Timedelta(hours=22)) \
+            == 'code_for_boston_export_1d'
+    finally:
+        monkeypatch.delenv('TZ')
+        time.tzset()
+
+
+def test_hobolink_falls_back_to_default_export(app, monkeypatch):
+    """Tests that the default export is downloaded when a smaller export
+    doesn't exist on the HOBOlink dashboard.
+    """
+    with io.open('tests/static/split_columns_hobolink_export.csv', 'r') as f:
+        csv_text = f.read()
+
+    class MockHobolinkResponse:
+        text = csv_text
+
+    requested = []
+
+    def _request_to_hobolink(export_name, deadline=None):
+        requested.append(export_name)
+        if export_name != hobolink.DEFAULT_HOBOLINK_EXPORT_NAME:
+            abort(404)
+        return MockHobolinkResponse()
+
+    monkeypatch.setattr(hobolink, 'request_to_hobolink', _request_to_hobolink)
+    monkeypatch.setitem(app.config, 'USE_MOCK_DATA', False)
+
+    with app.app_context():
+        df = get_live_hobolink_data(export_name='code_for_boston_export_1d')
+    assert requested == [
+        'code_for_boston_export_1d', hobolink.DEFAULT_HOBOLINK_EXPORT_NAME
+    ]
+    assert len(df)
@@ -0,0 +1,286 @@
+import base64
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+from psycopg2.errors import UniqueViolation
+
+from flagging_site import cache
+from flagging_site.data import database
+from flagging_site.data import payload_cache
+from flagging_site.data.database import bulk_write
+from flagging_site.data.database import execute_sql
+from flagging_site.data.database import get_latest_time
+from flagging_site.data.database import replace_rows_since
+from flagging_site.data.database import swap_in_tables
+from flagging_site.data.database import update_database
+from flagging_site.data.payload_cache import cache_payload
+
+
+def test_swap_in_tables_under_concurrent_reads(app):
+    """Tests that pages and queries that run while the tables are being
+    swapped never fail or see empty tables.
+    """
+    with app.app_context():
+        processed_data = execute_sql('SELECT * FROM processed_data')
+        model_outputs = execute_sql('SELECT * FROM model_outputs')
+
+    errors = []
+    stop = threading.Event()
+
+    def _read_pages():
+        client = app.test_client()
+        while not stop.is_set():
+            for page in ['/', '/flags', '/api/v1/model']:
+                status_code = client.get(page).status_code
+                if status_code != 200:
+                    errors.append(f'{page} returned {status_code}')
+
+    def _read_latest_time():
+        with app.app_context():
+            while not stop.is_set():
+                if pd.isna(get_latest_time()):
+                    errors.append('processed_data was empty')
+
+    readers = [
+        threading.Thread(target=_read_pages),
+        threading.Thread(target=_read_latest_time),
+    ]
+    for t in readers:
+        t.start()
+
+    try:
+        with app.app_context():
+            for _ in range(5):
+                swap_in_tables({
+                    'processed_data': processed_data,
+                    'model_outputs': model_outputs
+                })
+    finally:
+        stop.set()
+        for t in readers:
+            t.join()
+
+    assert errors == []
+    with app.app_context():
+        assert len(execute_sql('SELECT * FROM model_outputs')) \
+            == len(model_outputs)
+
+
+def test_cache_payload_keeps_latest_responses(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'RAW_DATA_CACHE_DIR', str(tmp_path))
+    monkeypatch.setitem(app.config, 'RAW_DATA_CACHE_SIZE', 2)
+
+    def _cache(text, age):
+        payload_hash = cache_payload('usgs', text)
+        # Give each response its own modified time, oldest first.
+        fpath = tmp_path / 'usgs' / f'{payload_hash}.txt'
+        if age is not None:
+            os.utime(fpath, (time.time() - age, time.time() - age))
+        return payload_hash
+
+    with app.app_context():
+        _cache('a', age=30)
+        b = _cache('b', age=20)
+        c = _cache('c', age=10)
+        assert sorted(os.listdir(tmp_path / 'usgs')) \
+            == sorted([f'{b}.txt', f'{c}.txt'])
+
+        # Caching a response again makes it the most recent one.
+        _cache('b', age=None)
+        d = _cache('d', age=None)
+        assert sorted(os.listdir(tmp_path / 'usgs')) \
+            == sorted([f'{b}.txt', f'{d}.txt'])
+
+
+def test_update_database_skips_unchanged_data(app, monkeypatch):
+    """Tests that nothing is processed or written when both sources return the
+    same responses as last time.
+    """
+    with app.app_context():
+        df_usgs = execute_sql('SELECT * FROM usgs')
+    df_hobolink = pd.DataFrame(columns=['time'])
+    last_fingerprint = {'usgs': 'usgs-hash', 'hobolink': 'hobolink-hash'}
+
+    def _unexpected(*args, **kwargs):
+        raise AssertionError('The database should not be updated.')
+
+    monkeypatch.setattr(payload_cache, 'get_last_fingerprint',
+                        lambda: dict(last_fingerprint))
+    monkeypatch.setattr(payload_cache, 'save_fingerprint', _unexpected)
+    monkeypatch.setattr(database, 'iter_live_data', lambda: iter([
+        ('usgs', ('usgs-hash', df_usgs)),
+        ('hobolink', ('hobolink-hash', df_hobolink)),
+    ]))
+    monkeypatch.setattr(database, 'swap_in_tables', _unexpected)
+    monkeypatch.setattr(database, 'replace_rows_since', _unexpected)
+    monkeypatch.setattr(database, 'update_snapshots', _unexpected)
+
+    with app.app_context():
+        version = cache.data_version.get()
+        assert update_database() is False
+        assert cache.data_version.get() == version
+
+
+def test_update_database_without_new_hobolink_hours(app, monkeypatch):
+    """Tests that new USGS data with no new HOBOlink hours (e.g. when HOBOlink
+    has stalled) is saved without processing or deleting any hours.
+    """
+    with app.app_context():
+        df_usgs = execute_sql('SELECT * FROM usgs')
+        latest_hobolink_time = get_latest_time('hobolink')
+    df_hobolink = pd.DataFrame(columns=['time'])
+    saved_fingerprint = {}
+    swapped_tables = []
+
+    def _get_latest_time(table_name='processed_data'):
+        # Every HOBOlink hour has been processed already.
+        if table_name == 'processed_data':
+            return latest_hobolink_time.floor('h')
+        return get_latest_time(table_name)
+
+    def _unexpected(*args, **kwargs):
+        raise AssertionError('No hours should be processed.')
+
+    monkeypatch.setitem(app.config, 'PROCESS_DATA_INCREMENTALLY', True)
+    monkeypatch.setattr(payload_cache, 'get_last_fingerprint',
+                        lambda: {'usgs': 'old-hash', 'hobolink': 'hash'})
+    monkeypatch.setattr(payload_cache, 'save_fingerprint',
+                        saved_fingerprint.update)
+    monkeypatch.setattr(database, 'iter_live_data', lambda: iter([
+        ('usgs', ('new-hash', df_usgs)),
+        ('hobolink', ('hash', df_hobolink)),
+    ]))
+    monkeypatch.setattr(database, 'get_latest_time', _get_latest_time)
+    monkeypatch.setattr(database, 'swap_in_tables',
+                        lambda dfs: swapped_tables.extend(dfs))
+    monkeypatch.setattr(database, 'replace_rows_since', _unexpected)
+    monkeypatch.setattr(database, 'update_feature_store', _unexpected)
+    monkeypatch.setattr(database, 'update_snapshots', lambda: None)
+
+    with app.app_context():
+        version = cache.data_version.get()
+        assert update_database() is True
+        assert cache.data_version.get() != version
+    assert swapped_tables == ['usgs']
+    assert saved_fingerprint == {'usgs': 'new-hash', 'hobolink': 'hash'}
+
+
+def test_bulk_write_rejects_unknown_columns(app):
+    with app.app_context():
+        rows = len(execute_sql('SELECT * FROM usgs'))
+        df = execute_sql('SELECT * FROM usgs LIMIT 1')
+        df['not_a_column'] = 1
+        with pytest.raises(ValueError, match='not_a_column'):
+            bulk_write(df, 'usgs', truncate=False)
+        with pytest.raises(ValueError, match='has no columns'):
+            bulk_write(df, 'not_a_table', truncate=False)
+        assert len(execute_sql('SELECT * FROM usgs')) == rows
+
+
+def test_replace_rows_since_deletes_old_rows(app):
+    with app.app_context():
+        df = execute_sql('''
+            SELECT * FROM processed_data ORDER BY time DESC LIMIT 10;
+        ''').iloc[::-1].reset_index(drop=True)
+        try:
+            execute_sql('''
+                DROP TABLE IF EXISTS test_processed_data;
+                CREATE TABLE test_processed_data
+                    (LIKE processed_data INCLUDING ALL);
+                COMMIT;
+            ''')
+            bulk_write(df.iloc[:8], 'test_processed_data')
+            replace_rows_since(
+                {'test_processed_data': df.iloc[6:]},
+                since=df['time'].iloc[6],
+                keep_since={'test_processed_data': df['time'].iloc[3]}
+            )
+            times = execute_sql(
+                'SELECT time FROM test_processed_data ORDER BY time;'
+            )['time']
+        finally:
+            execute_sql('DROP TABLE IF EXISTS test_processed_data; COMMIT;')
+    assert times.tolist() == df['time'].iloc[3:].tolist()
+
+
+def test_admin_update_shows_fetch_errors(app, monkeypatch):
+    """Tests that the admin update page reports a failed fetch instead of
+    returning a 500, since `update_database` raises when a source fails.
+    """
+    def _failed_update():
+        raise RuntimeError('hobolink: timed out')
+
+    monkeypatch.setattr(database, 'update_database', _failed_update)
+
+    client = app.test_client()
+    res = client.get('/admin/db/update/run-update', headers={
+        'Authorization': 'Basic ' + base64.b64encode(
+            f"{app.config['BASIC_AUTH_USERNAME']}:"
+            f"{app.config['BASIC_AUTH_PASSWORD']}".encode()
+        ).decode()
+    })
+    assert res.status_code == 200
+    assert b'hobolink: timed out' in res.data
+
+
+def test_migrate_db_keeps_hobolink_data_and_overrides(app, monkeypatch):
+    """Tests that `migrate_db` moves tables from the old schema (decimal
+    columns and no primary keys) onto the current schema, keeping the
+    HOBOlink data and the manual overrides without their duplicate rows.
+    """
+    # The other tables are rebuilt by `update_database`, which would download
+    # the live data; they're written back at the end instead.
+    monkeypatch.setattr(database, 'update_database', lambda: True)
+    tables = ['usgs', 'hobolink', 'processed_data', 'model_outputs',
+              'manual_overrides']
+
+    with app.app_context():
+        before = {
+            t: execute_sql(f'SELECT * FROM {t} ORDER BY 1, 2;') for t in tables
+        }
+        override = {
+            'boathouse': 'Union Boat Club',
+            'start_time': pd.Timestamp('2020-07-01 12:00'),
+            'end_time': pd.Timestamp('2020-07-01 13:00'),
+            'reason': 'other'
+        }
+
+        measurements = [c for c in before['hobolink'].columns if c != 'time']
+        execute_sql(
+            'DROP TABLE hobolink;'
+            'CREATE TABLE hobolink (time timestamp, '
+            + ', '.join(f'{c} decimal' for c in measurements) + ');'
+            'DROP TABLE manual_overrides;'
+            'CREATE TABLE manual_overrides (boathouse varchar(255), '
+            'start_time timestamp, end_time timestamp, reason varchar(255));'
+        )
+        bulk_write(before['hobolink'], 'hobolink')
+        bulk_write(before['hobolink'].tail(3), 'hobolink', truncate=False)
+        bulk_write(before['manual_overrides'], 'manual_overrides')
+        for _ in range(2):
+            execute_sql(
+                'INSERT INTO manual_overrides '
+                'VALUES (:boathouse, :start_time, :end_time, :reason);',
+                params=override
+            )
+
+        try:
+            database.migrate_db()
+
+            hobolink = execute_sql('SELECT * FROM hobolink ORDER BY time;')
+            assert hobolink.equals(before['hobolink'])
+            assert (hobolink[measurements].dtypes == float).all()
+            overrides = execute_sql(
+                'SELECT * FROM manual_overrides WHERE start_time = :start_time;',
+                params=override
+            )
+            assert len(overrides) == 1
+            with pytest.raises(UniqueViolation):
+                bulk_write(before['hobolink'].tail(1), 'hobolink',
+                           truncate=False)
+        finally:
+            for t in tables:
+                bulk_write(before[t], t)
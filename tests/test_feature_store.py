@@ -0,0 +1,89 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from flagging_site.data import feature_store
+from flagging_site.data.predictive_models import process_data
+
+
+@pytest.fixture(scope='module')
+def features(synthetic_data) -> pd.DataFrame:
+    return process_data(*synthetic_data(days=40))
+
+
+def test_read_features_with_filters(features, tmp_path):
+    store_dir = str(tmp_path)
+    feature_store.write_features(features, store_dir=store_dir)
+    assert sorted(os.listdir(store_dir)) == \
+        ['2020-07.arrow', '2020-08.arrow', '2020-09.arrow']
+
+    pd.testing.assert_frame_equal(
+        feature_store.read_features(store_dir=store_dir), features
+    )
+
+    start, end = pd.Timestamp('2020-07-30 05:00'), pd.Timestamp('2020-08-10')
+    columns = ['rain_0_to_24h_sum', 'par_1d_mean']
+    df = feature_store.read_features(start=start, end=end, columns=columns,
+                                     store_dir=store_dir)
+    expected = features.loc[
+        (features['time'] >= start) & (features['time'] < end),
+        ['time'] + columns
+    ].reset_index(drop=True)
+    pd.testing.assert_frame_equal(df, expected)
+    assert feature_store.get_latest_feature_time(store_dir) == \
+        features['time'].max()
+
+
+def test_read_feature_table_does_not_copy(features, tmp_path):
+    store_dir = str(tmp_path)
+    feature_store.write_features(features, store_dir=store_dir)
+
+    allocated = pa.total_allocated_bytes()
+    table = feature_store.read_feature_table(start='2020-08-01',
+                                             end='2020-09-01',
+                                             columns=['rain_0_to_48h_sum'],
+                                             store_dir=store_dir)
+    assert table.num_rows == 31 * 24
+    assert pa.total_allocated_bytes() - allocated < 1024
+
+
+def test_write_features_replaces_rows_since(features, tmp_path):
+    store_dir = str(tmp_path)
+    feature_store.write_features(features, store_dir=store_dir)
+
+    # Rewrite everything from the middle of August, with less data than
+    # before, so September ends up empty.
+    since = pd.Timestamp('2020-08-15 12:00')
+    new = features.loc[
+        (features['time'] >= since) & (features['time'] < '2020-08-20')
+    ].assign(rain=1.0)
+    feature_store.write_features(new, since=since, store_dir=store_dir)
+
+    assert '2020-09.arrow' not in os.listdir(store_dir)
+    expected = pd.concat([features.loc[features['time'] < since], new],
+                         ignore_index=True)
+    pd.testing.assert_frame_equal(
+        feature_store.read_features(store_dir=store_dir), expected
+    )
+
+
+def test_write_features_keeps_types_of_null_columns(features, tmp_path):
+    """Tests that a month where a feature is all NULL, which comes back from
+    the database as an object column, can be read together with the others.
+    """
+    store_dir = str(tmp_path)
+    since = pd.Timestamp('2020-09-01')
+    feature_store.write_features(features.loc[features['time'] < since],
+                                 store_dir=store_dir)
+
+    new = features.loc[features['time'] >= since].reset_index(drop=True)
+    new['par_1d_mean'] = pd.Series([None] * len(new), dtype=object)
+    feature_store.write_features(new, store_dir=store_dir)
+
+    df = feature_store.read_features(store_dir=store_dir)
+    assert df['par_1d_mean'].dtype == features['par_1d_mean'].dtype
+    assert df.loc[df['time'] >= since, 'par_1d_mean'].isna().all()
+    pd.testing.assert_frame_equal(df.loc[df['time'] < since],
+                                  features.loc[features['time'] < since])
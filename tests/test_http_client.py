@@ -0,0 +1,132 @@
+"""This file tests the HTTP client used for the HOBOlink and USGS APIs against
+a local stand-in HTTP server.
+"""
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import pytest
+import requests
+
+from flagging_site.data.http_client import HttpClient
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Returns a 503 for the first `server.failures` requests, and a 200 after
+    that, each after waiting `server.delay` seconds. Each response includes the
+    client's port, so the tests can check whether connections are reused.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        self.server.requests_seen += 1
+        if self.server.requests_seen <= self.server.failures:
+            status = 503
+        else:
+            status = 200
+        body = str(self.client_address[1]).encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    httpd.failures = 0
+    httpd.delay = 0
+    httpd.requests_seen = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def client():
+    return HttpClient(
+        connect_timeout=1,
+        read_timeout=1,
+        max_retries=2,
+        backoff_factor=0
+    )
+
+
+def url(server) -> str:
+    return f'http://127.0.0.1:{server.server_address[1]}/'
+
+
+def test_connections_are_reused(server, client):
+    ports = {client.get(url(server)).text for _ in range(3)}
+    assert len(ports) == 1
+
+
+def test_server_errors_are_retried(server, client):
+    server.failures = 2
+    res = client.get(url(server), name='stand-in')
+    assert res.status_code == 200
+
+    stats = client.get_stats()['stand-in']
+    assert stats['calls'] == 3
+    assert stats['retries'] == 2
+    assert stats['failures'] == 0
+    assert stats['last_latency'] is not None
+
+
+def test_last_response_returned_after_retries(server, client):
+    server.failures = 10
+    res = client.get(url(server), name='stand-in')
+    assert res.status_code == 503
+
+    stats = client.get_stats()['stand-in']
+    assert stats['calls'] == 3
+    assert stats['retries'] == 2
+    assert stats['failures'] == 1
+
+
+def test_connection_errors_are_retried_then_raised(client):
+    # Find a port that nothing is listening on.
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    with pytest.raises(requests.ConnectionError):
+        client.get(f'http://127.0.0.1:{port}/', name='closed')
+
+    stats = client.get_stats()['closed']
+    assert stats['calls'] == 3
+    assert stats['failures'] == 1
+
+
+def test_backoff_time_is_bounded(client):
+    client.backoff_factor = 1
+    client.backoff_max = 5
+    for attempt in range(10):
+        assert 0 <= client.backoff_time(attempt) <= min(5, 2 ** attempt)
+
+
+def test_deadline_stops_retries(server, client):
+    server.failures = 1000
+    client.max_retries = 1000
+    client.backoff_factor = 0.05
+    start_time = time.monotonic()
+    res = client.get(url(server), name='stand-in', deadline=start_time + 0.5)
+    assert res.status_code == 503
+    assert time.monotonic() - start_time < 1
+    assert client.get_stats()['stand-in']['failures'] == 1
+
+
+def test_deadline_cuts_timeouts_short(server, client):
+    server.delay = 2
+    start_time = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        client.get(url(server), deadline=start_time + 0.3)
+    assert time.monotonic() - start_time < 1
@@ -0,0 +1,314 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from flagging_site.data import predictive_models
+
+
+@pytest.fixture
+def features() -> pd.DataFrame:
+    """Random model inputs in the format of `process_data()`, with some
+    missing values.
+    """
+    rng = np.random.default_rng(0)
+    n = 100
+    df = pd.DataFrame({
+        'time': pd.date_range('2020-06-01', periods=n, freq='h'),
+        'rain_0_to_24h_sum': rng.exponential(0.1, n),
+        'rain_24_to_48h_sum': rng.exponential(0.1, n),
+        'days_since_sig_rain': rng.uniform(0, 1, n),
+        'par_1d_mean': rng.uniform(0, 1000, n),
+        'stream_flow_1d_mean': rng.uniform(50, 500, n),
+    })
+    df['rain_0_to_48h_sum'] = df['rain_0_to_24h_sum'] + df['rain_24_to_48h_sum']
+    df.loc[:30, 'par_1d_mean'] = np.nan
+    df.loc[:10, 'stream_flow_1d_mean'] = np.nan
+    return df
+
+
+def test_all_models_matches_equations(features):
+    """Tests that the matrix form of the models gives the same outputs as the
+    equations at the top of `predictive_models.py`.
+    """
+    a = features['rain_0_to_24h_sum']
+    b = features['rain_24_to_48h_sum']
+    c = features['rain_0_to_48h_sum']
+    d = features['days_since_sig_rain']
+    e = features['stream_flow_1d_mean']
+    f = features['par_1d_mean']
+    expected_log_odds = {
+        2: 0.3531 * a - 0.0362 * d - 0.000312 * f + 0.6233,
+        3: 0.267 * a + 0.1681 * b - 0.02855 * d + 0.5157,
+        4: 0.30276 * a + 0.1611 * b - 0.02267 * d - 0.000427 * f + 0.5791,
+        5: 0.1091 * c - 0.01355 * d + 0.000342 * e + 0.3333,
+    }
+
+    out = predictive_models.all_models(features, rows=len(features))
+
+    assert out[['reach', 'time']].equals(
+        out[['reach', 'time']].sort_values(['reach', 'time'])
+    )
+    for reach, log_odds in expected_log_odds.items():
+        reach_out = out.loc[out['reach'] == reach]
+        np.testing.assert_allclose(reach_out['log_odds'], log_odds)
+        assert reach_out['safe'].tolist() == (
+            predictive_models.sigmoid(log_odds)
+            <= predictive_models.SAFETY_THRESHOLD
+        ).tolist()
+
+
+def test_reach_model_returns_last_rows(features):
+    out = predictive_models.reach_3_model(features, rows=24)
+    assert len(out) == 24
+    assert (out['reach'] == 3).all()
+    assert out['time'].tolist() == features['time'].tail(24).tolist()
+
+
+@pytest.mark.parametrize('rain', [True, False])
+@pytest.mark.parametrize('cutoff', ['2020-08-20 00:00', '2020-08-31 13:00'])
+def test_process_new_data_matches_process_data(cutoff, rain, synthetic_data):
+    """Tests that processing the new hours incrementally gives the same data as
+    processing everything at once, including when it never rains.
+    """
+    df_hobolink, df_usgs = synthetic_data(days=21)
+    if not rain:
+        df_hobolink['rain'] = 0.0
+
+    expected = predictive_models.process_data(df_hobolink, df_usgs)
+
+    previous = expected.loc[expected['time'] < cutoff]
+    new = predictive_models.process_new_data(
+        df_hobolink.loc[df_hobolink['time'] >= cutoff],
+        df_usgs.loc[df_usgs['time'] >= cutoff],
+        previous=previous.tail(predictive_models.ROLLING_WINDOW_HOURS)
+    )
+    combined = pd.concat([previous, new], ignore_index=True)
+
+    pd.testing.assert_frame_equal(combined, expected)
+
+
+@pytest.mark.parametrize('rain', [True, False])
+def test_process_new_data_uses_window_start(rain, synthetic_data):
+    """Tests that the new hours get the same time since the last significant
+    rain as when the data is processed again from a later start, as happens
+    when the last 21 days are processed in full.
+    """
+    df_hobolink, df_usgs = synthetic_data(days=21)
+    if not rain:
+        df_hobolink['rain'] = 0.0
+    cutoff = pd.Timestamp('2020-08-31 13:00')
+    window_start = pd.Timestamp('2020-08-20 00:00')
+
+    # The hours before the cutoff were processed from an earlier start.
+    previous = predictive_models.process_data(
+        df_hobolink.loc[df_hobolink['time'] < cutoff],
+        df_usgs.loc[df_usgs['time'] < cutoff]
+    )
+    expected = predictive_models.process_data(
+        df_hobolink.loc[df_hobolink['time'] >= window_start],
+        df_usgs.loc[df_usgs['time'] >= window_start]
+    )
+    expected = expected.loc[expected['time'] >= cutoff]
+
+    new = predictive_models.process_new_data(
+        df_hobolink.loc[df_hobolink['time'] >= cutoff],
+        df_usgs.loc[df_usgs['time'] >= cutoff],
+        previous=previous.tail(predictive_models.ROLLING_WINDOW_HOURS),
+        window_start=window_start
+    )
+
+    pd.testing.assert_frame_equal(new, expected.reset_index(drop=True))
+
+
+def test_backtest_matches_process_data(tmp_path, synthetic_data):
+    """Tests that running the models over the data in chunks gives the same
+    outputs as processing all of the data at once.
+    """
+    from flagging_site.data.backtest import run_backtest
+    df_hobolink, df_usgs = synthetic_data(days=15, usgs_days=12)
+    # Leave a gap in the HOBOlink data.
+    df_hobolink = df_hobolink.loc[
+        (df_hobolink['time'] < '2020-08-24')
+        | (df_hobolink['time'] >= '2020-08-27 06:00')
+    ]
+    df_hobolink.to_csv(tmp_path / 'hobolink.csv', index=False)
+    df_usgs.to_csv(tmp_path / 'usgs.csv', index=False)
+
+    summary = run_backtest(
+        hobolink_fpath=str(tmp_path / 'hobolink.csv'),
+        usgs_fpath=str(tmp_path / 'usgs.csv'),
+        out_dir=str(tmp_path / 'out'),
+        chunk_days=2,
+        workers=2
+    )
+
+    df = predictive_models.process_data(
+        pd.read_csv(tmp_path / 'hobolink.csv', parse_dates=['time']),
+        pd.read_csv(tmp_path / 'usgs.csv', parse_dates=['time'])
+    )
+    expected = predictive_models.all_models(df, rows=len(df))
+    for reach, df_reach in expected.groupby('reach'):
+        actual = pd.read_csv(tmp_path / 'out' / f'model_outputs_reach_{reach}.csv',
+                             parse_dates=['time'],
+                             dtype={'model_version': str})
+        pd.testing.assert_frame_equal(actual,
+                                      df_reach.reset_index(drop=True))
+        reach_summary = summary.set_index('reach').loc[reach]
+        assert reach_summary['hours'] == len(df_reach)
+        assert reach_summary['flag_days'] == \
+            df_reach.loc[~df_reach['safe'], 'time'].dt.date.nunique()
+
+
+def test_all_model_versions_matches_each_version(features):
+    """Tests that running the versions together gives the same outputs as
+    running each version on its own.
+    """
+    registry = {
+        '2020': predictive_models.MODEL_COEFFICIENTS,
+        'test': predictive_models.MODEL_COEFFICIENTS.iloc[::-1] * 1.1,
+    }
+
+    out = predictive_models.all_model_versions(features, rows=30,
+                                               reaches=[3, 5],
+                                               registry=registry)
+
+    expected = pd.concat([
+        predictive_models.all_models(features, rows=30, reaches=[3, 5],
+                                     coefficients=coefficients,
+                                     version=version)
+        for version, coefficients in registry.items()
+    ], ignore_index=True)
+    pd.testing.assert_frame_equal(out, expected)
+
+
+def test_low_memory_matches_process_data(synthetic_data):
+    """Tests that the float32 pipeline gives the same features and model
+    outputs as the default one, up to float32 precision.
+    """
+    df_hobolink, df_usgs = synthetic_data(days=21)
+
+    expected = predictive_models.process_data(df_hobolink, df_usgs)
+    df = predictive_models.process_data(df_hobolink, df_usgs, low_memory=True)
+
+    assert (df[predictive_models.MODEL_FEATURES].dtypes == np.float32).all()
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False,
+                                  rtol=1e-5)
+
+    out = predictive_models.all_models(df, rows=len(df))
+    expected_out = predictive_models.all_models(expected, rows=len(expected))
+    pd.testing.assert_frame_equal(out, expected_out, rtol=1e-4)
+    assert out['log_odds'].dtype == np.float64
+    assert out['safe'].tolist() == expected_out['safe'].tolist()
+
+
+def test_process_data_windows_cover_hours(synthetic_data):
+    """Tests that the windows cover a fixed number of hours when some hours are
+    missing from the data, and that the missing hours are counted.
+    """
+    df_hobolink, df_usgs = synthetic_data(days=5)
+    gap = (df_hobolink['time'] >= '2020-08-29 10:00') \
+        & (df_hobolink['time'] < '2020-08-29 15:00')
+
+    df = predictive_models.process_data(df_hobolink.loc[~gap], df_usgs)
+    full = predictive_models.process_data(df_hobolink, df_usgs)
+
+    # Every hour has a row, and the missing hours have no measurements.
+    assert df['time'].tolist() == full['time'].tolist()
+    df = df.set_index('time')
+    full = full.set_index('time')
+    assert df.loc['2020-08-29 10:00':'2020-08-29 14:00', 'rain'].isna().all()
+
+    # A window that includes the missing hours only adds up the hours that are
+    # there, and counts the ones that aren't.
+    expected_sum = (
+        full.loc['2020-08-28 21:00':'2020-08-29 20:00', 'rain'].sum()
+        - full.loc['2020-08-29 10:00':'2020-08-29 14:00', 'rain'].sum()
+    )
+    assert df.loc['2020-08-29 20:00', 'rain_0_to_24h_sum'] \
+        == pytest.approx(expected_sum)
+    assert df.loc['2020-08-29 20:00', 'rain_0_to_24h_missing'] == 5
+    assert df.loc['2020-08-29 20:00', 'rain_0_to_48h_missing'] == 5
+    assert df.loc['2020-08-30 20:00', 'rain_0_to_24h_missing'] == 0
+
+    # Windows without missing hours are the same as before.
+    complete = df['rain_0_to_48h_missing'] == 0
+    for col in ['rain_0_to_24h_sum', 'rain_0_to_48h_sum', 'par_1d_mean']:
+        np.testing.assert_allclose(df.loc[complete, col],
+                                   full.loc[complete, col])
+
+    # Models that use windows with too many missing hours are skipped.
+    out = predictive_models.all_models(df.reset_index(), rows=len(df))
+    reach_2 = out.loc[out['reach'] == 2].set_index('time')
+    max_missing = predictive_models.MAX_MISSING_HOURS
+    expected_skipped = (
+        (df['rain_0_to_24h_missing'] > max_missing)
+        | (df['par_1d_missing'] > max_missing)
+        | df[['rain_0_to_24h_sum', 'par_1d_mean']].isna().any(axis=1)
+    )
+    assert expected_skipped.loc['2020-08-29 20:00']
+    assert reach_2['log_odds'].isna().tolist() == expected_skipped.tolist()
+
+
+def test_process_data_in_database_matches_process_data(app, synthetic_data):
+    """Tests that the window functions in `process_data.sql` give the same
+    processed data as Pandas.
+    """
+    from flagging_site.data.database import bulk_write
+    from flagging_site.data.database import execute_sql
+    df_hobolink, df_usgs = synthetic_data(days=10)
+    # Leave a gap in the HOBOlink data.
+    df_hobolink = df_hobolink.loc[
+        (df_hobolink['time'] < '2020-08-25')
+        | (df_hobolink['time'] >= '2020-08-25 05:00')
+    ]
+
+    # The data is written to copies of the tables, so the live data is never
+    # touched.
+    with app.app_context():
+        try:
+            for table_name, df_table in [('hobolink', df_hobolink),
+                                         ('usgs', df_usgs)]:
+                execute_sql(f'''
+                    DROP TABLE IF EXISTS test_{table_name};
+                    CREATE TABLE test_{table_name}
+                        (LIKE {table_name} INCLUDING ALL);
+                    COMMIT;
+                ''')
+                bulk_write(df_table, f'test_{table_name}')
+            df = predictive_models.process_data_in_database(
+                days=10,
+                hobolink_table='test_hobolink',
+                usgs_table='test_usgs'
+            )
+        finally:
+            execute_sql('''
+                DROP TABLE IF EXISTS test_hobolink;
+                DROP TABLE IF EXISTS test_usgs;
+                COMMIT;
+            ''')
+
+    expected = predictive_models.process_data(df_hobolink, df_usgs)
+    pd.testing.assert_frame_equal(df, expected, rtol=1e-9)
+
+
+def test_latest_model_outputs_filters_in_database(app):
+    """Tests that the hours and reaches are filtered the same way as when all
+    the model outputs are read.
+    """
+    from flagging_site.data.database import execute_sql
+    with app.app_context():
+        version, _ = predictive_models.get_model_coefficients()
+        df_all = execute_sql(
+            'SELECT * FROM model_outputs ORDER BY reach, time;'
+        )
+        df = predictive_models.latest_model_outputs(
+            hours=5, version=version, reaches=[3, 4]
+        )
+
+    expected = df_all.loc[
+        (df_all['model_version'] == version)
+        & (df_all['time'] > df_all['time'].max() - pd.Timedelta(hours=5))
+        & df_all['reach'].isin([3, 4])
+    ].drop(columns=['model_version']).reset_index(drop=True)
+    assert len(df) == 10
+    pd.testing.assert_frame_equal(df, expected)
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from flagging_site.data.query_catalog import Query
+
+
+def test_query_from_file(tmp_path):
+    fpath = tmp_path / 'example.sql'
+    fpath.write_text(
+        '-- Comments are not parsed, e.g. :not_a_param\n'
+        'SELECT x::numeric FROM t WHERE a = :a AND b > :b AND c = :a;\n'
+    )
+    query = Query.from_file(str(fpath))
+    assert query.name == 'example.sql'
+    assert query.params == ('a', 'b')
+    assert query.statement_name == 'flagging_example'
+    assert query.prepare_statement == (
+        'PREPARE flagging_example AS '
+        'SELECT x::numeric FROM t WHERE a = $1 AND b > $2 AND c = $1'
+    )
+    assert query.execute_statement == 'EXECUTE flagging_example (%s, %s)'
+    assert query.args({'b': 2, 'a': 1}) == [1, 2]
+    with pytest.raises(ValueError):
+        query.args({'a': 1})
+
+
+def test_scripts_are_not_prepared(tmp_path):
+    fpath = tmp_path / 'script.sql'
+    fpath.write_text('DROP TABLE IF EXISTS t;\nCREATE TABLE t (x int);\n')
+    assert Query.from_file(str(fpath)).statement_name is None
+
+    fpath = tmp_path / 'empty.sql'
+    fpath.write_text('-- Nothing here.\n')
+    with pytest.raises(ValueError):
+        Query.from_file(str(fpath))
+
+
+def test_prepared_query_matches_plain_query(app):
+    """Tests that a query gives the same results when it is prepared, and that
+    its runs are counted.
+    """
+    from flagging_site.data.predictive_models import get_model_coefficients
+    from flagging_site.data.query_catalog import query_catalog
+    name = 'return_latest_model_outputs.sql'
+    with app.app_context():
+        version, _ = get_model_coefficients()
+        params = {'hours': 3, 'version': version, 'reaches': [2, 3]}
+        query_catalog.reset_stats()
+        query_catalog.prepare = False
+        try:
+            expected = query_catalog.execute(name, params)
+        finally:
+            query_catalog.prepare = True
+        for _ in range(2):
+            df = query_catalog.execute(name, params)
+            pd.testing.assert_frame_equal(df, expected)
+
+    stats = query_catalog.get_stats()[name]
+    assert stats['calls'] == 3
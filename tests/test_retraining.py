@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from flagging_site.data import predictive_models
+from flagging_site.data import retraining
+
+
+def _simulate_samples(features: pd.DataFrame, n: int = 8000) -> pd.DataFrame:
+    """Draw samples whose outcomes follow the 2020 models."""
+    rng = np.random.default_rng(1)
+    outputs = predictive_models.all_models(features, rows=len(features))
+    outputs = outputs.dropna().sample(n=n, replace=True, random_state=1)
+    unsafe = rng.uniform(size=n) < outputs['probability'].to_numpy()
+    return pd.DataFrame({
+        'reach': outputs['reach'].to_numpy(),
+        'time': outputs['time'].to_numpy() + pd.Timedelta('20min'),
+        'ecoli': np.where(unsafe, 2000, 100),
+    })
+
+
+def test_fit_logistic_matches_newton_solution():
+    rng = np.random.default_rng(0)
+    x = np.column_stack([np.ones(500), rng.normal(size=(500, 2))])
+    y = (rng.uniform(size=500) < predictive_models.sigmoid(
+        x @ np.array([0.5, 1.0, -2.0]))).astype(float)
+    weights = np.vstack([np.ones(500), (np.arange(500) % 2).astype(float)])
+
+    beta = retraining.fit_logistic(x, y, weights, l2=0)
+
+    # At the maximum likelihood, the gradient is zero for every fit.
+    for b, w in zip(beta, weights):
+        mu = predictive_models.sigmoid(x @ b)
+        np.testing.assert_allclose((w * (y - mu)) @ x, 0, atol=1e-8)
+
+
+def test_retrain_recovers_coefficients(tmp_path, synthetic_data):
+    features = predictive_models.process_data(*synthetic_data(days=60))
+    samples = _simulate_samples(features)
+    samples.to_csv(tmp_path / 'samples.csv', index=False)
+
+    data = retraining.join_features(
+        retraining.load_samples([str(tmp_path / 'samples.csv')]),
+        features
+    )
+    coefficients, cv_results = retraining.retrain(data, folds=5, workers=2)
+
+    assert coefficients.index.tolist() == [2, 3, 4, 5]
+    assert (cv_results['samples'] == data.groupby('reach').size()).all()
+    assert cv_results['log_loss'].notna().all()
+    # Unused features stay at 0.
+    expected = predictive_models.MODEL_COEFFICIENTS
+    assert ((coefficients == 0) == (expected == 0)).all().all()
+
+    # Check the coefficients through the model outputs, since the features
+    # are correlated.
+    fpath = str(tmp_path / 'model.json')
+    retraining.save_model_coefficients(fpath, 'test', coefficients, cv_results)
+    version, loaded = predictive_models.load_model_coefficients(fpath)
+    assert version == 'test'
+    pd.testing.assert_frame_equal(loaded, coefficients)
+
+    refit = predictive_models.all_models(features, rows=len(features),
+                                         coefficients=loaded)
+    original = predictive_models.all_models(features, rows=len(features))
+    np.testing.assert_allclose(refit['probability'], original['probability'],
+                               atol=0.1)